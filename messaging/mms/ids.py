@@ -0,0 +1,184 @@
+# See LICENSE
+"""Unique Transaction-Id and Message-ID values, and matching them back"""
+
+import os
+from threading import Lock
+import time
+import uuid
+
+from messaging.utils import LRUCache
+
+
+class IdGenerator(object):
+    """
+    I generate unique, time-ordered identifiers
+
+    An identifier is 25 hexadecimal digits: the milliseconds since the
+    epoch (11), the node (4), the process id (6) and a counter (4) that
+    tells apart the identifiers of the same millisecond. Identifiers of
+    the same process are strictly increasing, even if the clock goes
+    back, and compare in the same order as strings.
+
+    I am safe to share between threads, and a child process starts its
+    own sequence after a fork.
+    """
+
+    def __init__(self, node=None, prefix='', clock=time.time):
+        """
+        :param node: Tells apart the hosts that generate identifiers, by
+                     default it is taken from the MAC address
+        :type node: int
+        :param prefix: Put in front of every identifier
+        :type prefix: str
+        """
+        if node is None:
+            node = uuid.getnode()
+
+        self.node = node & 0xffff
+        self.prefix = prefix
+        self._clock = clock
+        self._lock = Lock()
+        self._pid = None
+        self._last = 0
+        self._seq = 0
+
+    def __call__(self):
+        """Returns a new identifier"""
+        self._lock.acquire()
+        try:
+            pid = os.getpid()
+            if pid != self._pid:
+                self._pid = pid
+                self._last = self._seq = 0
+
+            now = int(self._clock() * 1000)
+            if now > self._last:
+                self._last = now
+                self._seq = 0
+            else:
+                self._seq += 1
+                if self._seq > 0xffff:
+                    # borrow the next millisecond
+                    self._last += 1
+                    self._seq = 0
+
+            return '%s%011x%04x%06x%04x' % (self.prefix, self._last,
+                                            self.node, pid & 0xffffff,
+                                            self._seq)
+        finally:
+            self._lock.release()
+
+
+_generator = IdGenerator()
+
+
+def new_id():
+    """
+    Returns a new identifier from the current generator
+
+    This is what the encoders use for the Transaction-Id of messages
+    that do not have one.
+
+    :rtype: str
+    """
+    return _generator()
+
+
+def set_id_generator(generator):
+    """
+    Makes :func:`new_id` use ``generator``
+
+    :param generator: Called without arguments, returns a new identifier,
+                      e.g. an :class:`IdGenerator`
+    :type generator: callable
+    """
+    global _generator
+    _generator = generator
+
+
+class TransactionIndex(object):
+    """
+    I match the MMS PDUs received from a MMSC to the messages sent
+
+    Something about every message sent (its recipient, a database key,
+    ...) is added under its Transaction-Id. The m-send-conf that
+    answers it is matched by Transaction-Id, and the Message-ID it
+    assigns is remembered, so the m-delivery-ind and m-read-orig-ind
+    that come later are matched by Message-ID.
+
+    At most ``maxsize`` transactions and ``maxsize`` messages are kept,
+    the least recently used are forgotten. I am safe to share between
+    threads.
+    """
+
+    def __init__(self, maxsize=65536):
+        self._transactions = LRUCache(maxsize)
+        self._messages = LRUCache(maxsize)
+        self._lock = Lock()
+
+    def __len__(self):
+        """Returns the number of transactions held"""
+        return len(self._transactions)
+
+    def add(self, transaction_id, value, message_id=None):
+        """
+        Remembers ``value`` for the message sent with ``transaction_id``
+
+        :param message_id: The Message-ID, if it is already known
+        :type message_id: str
+        """
+        self._lock.acquire()
+        try:
+            self._transactions.set(transaction_id, value)
+            if message_id is not None:
+                self._messages.set(message_id, value)
+        finally:
+            self._lock.release()
+
+    def get(self, transaction_id, default=None):
+        """Returns the value added for ``transaction_id``"""
+        self._lock.acquire()
+        try:
+            return self._transactions.get(transaction_id, default)
+        finally:
+            self._lock.release()
+
+    def get_by_message_id(self, message_id, default=None):
+        """Returns the value of the message with ``message_id``"""
+        self._lock.acquire()
+        try:
+            return self._messages.get(message_id, default)
+        finally:
+            self._lock.release()
+
+    def match(self, headers):
+        """
+        Returns the value of the message a received PDU refers to
+
+        A m-send-conf is matched by its Transaction-Id and links its
+        Message-ID to the same value. Other PDUs are matched by their
+        Message-ID if they have one, and by their Transaction-Id if not.
+
+        :param headers: The headers of the PDU, or the decoded
+                        :class:`~messaging.mms.message.MMSMessage`
+        :type headers: dict
+        :return: The value, or None if the message is not known
+        """
+        headers = getattr(headers, 'headers', headers)
+        message_id = headers.get('Message-ID')
+        transaction_id = headers.get('Transaction-Id')
+
+        self._lock.acquire()
+        try:
+            if headers.get('Message-Type') == 'm-send-conf':
+                value = self._transactions.get(transaction_id)
+                if value is not None and message_id is not None:
+                    self._messages.set(message_id, value)
+                return value
+
+            if message_id is not None:
+                return self._messages.get(message_id)
+
+            return self._transactions.get(transaction_id)
+        finally:
+            self._lock.release()
@@ -14,6 +14,9 @@
 # may be created by processing this file with epydoc: http://epydoc.sf.net
 """Iterator with "value preview" capability."""
 
+import array
+import mmap
+
 
 class PreviewIterator(object):
     """An ``iter`` wrapper class providing a "previewable" iterator.
@@ -69,3 +72,174 @@ class PreviewIterator(object):
 
     def reset_preview(self):
         self._preview_pos = 0
+
+
+def _as_bytes(data):
+    # byte strings and memory maps are used as they are, anything else
+    # (array.array('B'), bytearray, lists of ints) is copied once
+    if isinstance(data, (str, mmap.mmap)):
+        return data
+
+    if isinstance(data, array.array):
+        return data.tostring()
+
+    if isinstance(data, bytearray):
+        return str(data)
+
+    return array.array('B', data).tostring()
+
+
+class ByteCursor(object):
+    """
+    I am a position over a byte buffer
+
+    Reading a byte only moves an integer index, and strings and payloads
+    are read with slices and :func:`str.find` instead of byte by byte.
+
+    I also implement the :class:`PreviewIterator` interface (``next``,
+    ``preview`` and ``reset_preview``) so I can be handed to the existing
+    :class:`~messaging.mms.wsp_pdu.Decoder` methods.
+    """
+
+    def __init__(self, data, start=0, end=None):
+        """
+        :param data: the buffer to read
+        :type data: str, mmap.mmap, array.array('B') or bytearray
+        :param start: position of the first byte to read
+        :type start: int
+        :param end: position after the last byte to read, defaults to the
+                    end of ``data``
+        :type end: int
+        """
+        self.data = _as_bytes(data)
+        self.pos = start
+        self.end = len(self.data) if end is None else end
+        self._preview_pos = 0
+
+    def __iter__(self):
+        return self
+
+    @property
+    def remaining(self):
+        """The number of bytes left to read"""
+        return self.end - self.pos
+
+    def at_end(self):
+        return self.pos >= self.end
+
+    def peek(self, offset=0):
+        """
+        Returns the byte ``offset`` positions ahead without moving
+
+        :raise StopIteration: there is no such byte
+        """
+        pos = self.pos + offset
+        if pos >= self.end:
+            raise StopIteration
+
+        return ord(self.data[pos])
+
+    def advance(self, n=1):
+        """
+        Moves ``n`` bytes forward
+
+        :raise StopIteration: there are less than ``n`` bytes left; the
+                              cursor is moved to the end
+        """
+        self._preview_pos = 0
+        pos = self.pos + n
+        if pos > self.end:
+            self.pos = self.end
+            raise StopIteration
+
+        self.pos = pos
+
+    def read(self, n):
+        """
+        Returns the next ``n`` bytes as a string
+
+        :raise StopIteration: there are less than ``n`` bytes left; the
+                              cursor is moved to the end
+        """
+        start = self.pos
+        self.advance(n)
+        return self.data[start:self.pos]
+
+    def read_uint_var(self):
+        """Reads a variable length unsigned integer"""
+        uint = 0
+        byte = self.next()
+        while byte & 0x80:
+            uint = (uint << 7) | (byte & 0x7f)
+            byte = self.next()
+
+        return (uint << 7) | byte
+
+    def read_cstring(self):
+        """
+        Returns the string up to the next NUL byte, which is skipped
+
+        :raise StopIteration: there is no NUL byte before the end; the
+                              cursor is moved to the end
+        """
+        self._preview_pos = 0
+        nul = self.data.find('\0', self.pos, self.end)
+        if nul == -1:
+            self.pos = self.end
+            raise StopIteration
+
+        value = self.data[self.pos:nul]
+        self.pos = nul + 1
+        return value
+
+    def read_until(self, pattern):
+        """
+        Returns the string up to the first match of ``pattern``
+
+        The matched byte is skipped.
+
+        :param pattern: a compiled regular expression matching one byte
+        :raise StopIteration: ``pattern`` does not match before the end;
+                              the cursor is moved to the end
+        """
+        self._preview_pos = 0
+        match = pattern.search(self.data, self.pos, self.end)
+        if match is None:
+            self.pos = self.end
+            raise StopIteration
+
+        value = self.data[self.pos:match.start()]
+        self.pos = match.start() + 1
+        return value
+
+    def sub_cursor(self, n):
+        """
+        Returns a cursor over the next ``n`` bytes and skips them
+
+        :raise StopIteration: there are less than ``n`` bytes left
+        """
+        start = self.pos
+        self.advance(n)
+        return ByteCursor(self.data, start, self.pos)
+
+    # PreviewIterator interface
+
+    def next(self):
+        self._preview_pos = 0
+        pos = self.pos
+        if pos >= self.end:
+            raise StopIteration
+
+        self.pos = pos + 1
+        return ord(self.data[pos])
+
+    def preview(self):
+        pos = self.pos + self._preview_pos
+        if pos >= self.end:
+            raise StopIteration
+
+        self._preview_pos += 1
+        return ord(self.data[pos])
+
+    def reset_preview(self):
+        self._preview_pos = 0
@@ -18,7 +18,15 @@ from __future__ import with_statement
 import array
 import mimetypes
 import os
-import xml.dom.minidom
+import urllib
+
+from messaging.mms import smil
+
+try:
+    _buffer = buffer
+except NameError:
+    def _buffer(obj, offset, size):
+        return memoryview(obj)[offset:offset + size]
 
 
 class MMSMessage:
@@ -31,15 +39,16 @@ class MMSMessage:
         self._pages = []
         self._data_parts = []
         self._metaTags = {}
-        self._mms_message = None
+        self._parsed_pages = None
+        self._part_index = None
         self.headers = {
             'Message-Type': 'm-send-req',
-            'Transaction-Id': '1234',
             'MMS-Version': '1.0',
             'Content-Type': ('application/vnd.wap.multipart.mixed', {}),
         }
         self.width = 176
         self.height = 220
+        self.regions = smil.DEFAULT_REGIONS
         self.transactionID = '12345'
         self.subject = 'test'
 
@@ -68,11 +77,89 @@ class MMSMessage:
             self.headers['Content-Type'] = value
 
         self._pages.append(page)
+        if self._part_index is not None:
+            for part in page.data_parts:
+                self._part_index.add(part)
 
     @property
     def pages(self):
-        """Returns a list of all the pages in this message"""
-        return self._pages
+        """
+        Returns a list of all the pages in this message
+
+        The pages of a decoded message are rebuilt out of its SMIL part
+        the first time they are requested, see :func:`parse_pages`.
+        """
+        if self._pages or not self._data_parts:
+            return self._pages
+
+        if self._parsed_pages is None:
+            self._parsed_pages = self.parse_pages()
+
+        return self._parsed_pages
+
+    @property
+    def smil_part(self):
+        """
+        Returns the data part with the SMIL presentation, or None
+
+        This is the part that the "Start" parameter of the Content-Type
+        header refers to, or else the first "application/smil" part
+        that was added with :func:`add_data_part`.
+        """
+        start = self.headers['Content-Type'][1].get('Start')
+        if start is not None:
+            part = self.get_part_by_content_id(start)
+            if part is not None:
+                return part
+
+        for part in self.get_parts_by_content_type('application/smil'):
+            if part in self._data_parts:
+                return part
+
+        return None
+
+    def parse_pages(self):
+        """
+        Returns the pages described by the SMIL part of this message
+
+        The SMIL part is parsed with
+        :func:`messaging.mms.smil.parse_smil` and its media objects are
+        linked to the data parts by Content-Location, or by Content-ID
+        for "cid:" URIs. Media objects that do not refer to any part are
+        left out. The begin and end times and the duration of the slides
+        are kept, in milliseconds.
+
+        :rtype: list of :class:`MMSMessagePage`
+        """
+        smil_part = self.smil_part
+        if smil_part is None:
+            return []
+
+        pages = []
+        for slide in smil.parse_smil(smil_part.iter_chunks()):
+            page = MMSMessagePage()
+            if slide.duration:
+                page.duration = slide.duration
+
+            for tag, src, region, begin, end in slide.media:
+                part = self.get_part(src)
+                if part is None:
+                    continue
+
+                slot = smil.MEDIA_TAGS[tag]
+                if slot is None:
+                    slot = part.content_type.split('/')[0]
+                    if slot in ('image', 'video'):
+                        slot = 'image'
+                    elif slot not in ('audio', 'text'):
+                        continue
+
+                if getattr(page, slot) is None:
+                    setattr(page, slot, (part, begin or 0, end or 0))
+
+            pages.append(page)
+
+        return pages
 
     def add_data_part(self, data_part):
         """Adds a single data part (DataPart object) to the message, without
@@ -88,6 +175,92 @@ class MMSMessage:
         :type data_part: DataPart
         """
         self._data_parts.append(data_part)
+        self._parsed_pages = None
+        if self._part_index is not None:
+            self._part_index.add(data_part)
+
+    @property
+    def part_index(self):
+        """
+        The :class:`PartIndex` of the parts of this message
+
+        It is built the first time it is needed and kept up to date by
+        :func:`add_data_part` and :func:`add_page`. The parts are indexed
+        by the headers they have when they are added; call
+        :func:`reindex_parts` after changing them.
+        """
+        if self._part_index is None:
+            self.reindex_parts()
+
+        return self._part_index
+
+    def reindex_parts(self):
+        """Rebuilds :attr:`part_index` out of the current parts"""
+        index = PartIndex()
+        for page in self._pages:
+            for part in page.data_parts:
+                index.add(part)
+
+        for part in self._data_parts:
+            index.add(part)
+
+        self._part_index = index
+
+    def get_part_by_content_id(self, content_id):
+        """
+        Returns the part with Content-ID ``content_id``, or None
+
+        :param content_id: The Content-ID, with or without the angle
+                           brackets, or a "cid:" URI
+        :type content_id: str
+        :rtype: DataPart
+        """
+        if content_id.startswith('cid:'):
+            content_id = urllib.unquote(content_id[4:])
+
+        return self.part_index.ids.get(content_id.strip('<>'))
+
+    def get_part_by_location(self, location):
+        """
+        Returns the part with Content-Location ``location``, or None
+
+        :type location: str
+        :rtype: DataPart
+        """
+        return self.part_index.locations.get(location)
+
+    def get_parts_by_content_type(self, content_type):
+        """
+        Returns the parts of type ``content_type``, in order
+
+        :param content_type: The MIME type, without parameters. The
+                             comparison is case-insensitive
+        :type content_type: str
+        :rtype: list
+        """
+        return list(self.part_index.types.get(content_type.lower(), ()))
+
+    def get_part(self, src):
+        """
+        Returns the part that ``src`` refers to, or None
+
+        ``src`` is a "cid:" URI, or else a Content-Location. A bare
+        Content-ID is accepted too, as some phones write them without
+        the "cid:" scheme.
+
+        :param src: The URI of the part, e.g. a SMIL ``src`` attribute
+        :type src: str
+        :rtype: DataPart
+        """
+        if src.startswith('cid:'):
+            return self.get_part_by_content_id(src)
+
+        index = self.part_index
+        part = index.locations.get(src)
+        if part is None:
+            part = index.ids.get(src.strip('<>'))
+
+        return part
 
     @property
     def data_parts(self):
@@ -96,118 +269,33 @@ class MMSMessage:
 
         including data parts that were added to slides in this message"""
         parts = []
-        if len(self._pages):
-            parts.append(self.smil())
-            for slide in self._mms_message._pages:
-                parts.extend(slide.data_parts())
+        if self._pages:
+            parts.append(self._make_smil_part())
+            for slide in self._pages:
+                parts.extend(slide.data_parts)
 
         parts.extend(self._data_parts)
         return parts
 
+    def _make_smil_part(self):
+        smil_part = DataPart()
+        smil_part.set_data(self.smil(), 'application/smil')
+        #TODO: make this dynamic....
+        smil_part.headers['Content-ID'] = '<0000>'
+        return smil_part
+
     def smil(self):
-        """Returns the text of the message's SMIL file"""
-        impl = xml.dom.minidom.getDOMImplementation()
-        smil_doc = impl.createDocument(None, "smil", None)
-
-        # Create the SMIL header
-        head_node = smil_doc.createElement('head')
-        # Add metadata to header
-        for tag_name in self._metaTags:
-            meta_node = smil_doc.createElement('meta')
-            meta_node.setAttribute(tag_name, self._metaTags[tag_name])
-            head_node.appendChild(meta_node)
-
-        # Add layout info to header
-        layout_node = smil_doc.createElement('layout')
-        root_layout_node = smil_doc.createElement('root-layout')
-        root_layout_node.setAttribute('width', str(self.width))
-        root_layout_node.setAttribute('height', str(self.height))
-        layout_node.appendChild(root_layout_node)
-
-        areas = (('Image', '0', '0', '176', '144'),
-                 ('Text', '176', '144', '176', '76'))
-
-        for region_id, left, top, width, height in areas:
-            region_node = smil_doc.createElement('region')
-            region_node.setAttribute('id', region_id)
-            region_node.setAttribute('left', left)
-            region_node.setAttribute('top', top)
-            region_node.setAttribute('width', width)
-            region_node.setAttribute('height', height)
-            layout_node.appendChild(region_node)
-
-        head_node.appendChild(layout_node)
-        smil_doc.documentElement.appendChild(head_node)
-
-        # Create the SMIL body
-        body_node = smil_doc.createElement('body')
-        # Add pages to body
-        for page in self._pages:
-            par_node = smil_doc.createElement('par')
-            par_node.setAttribute('duration', str(page.duration))
-            # Add the page content information
-            if page.image is not None:
-                #TODO: catch unpack exception
-                part, begin, end = page.image
-                if 'Content-Location' in part.headers:
-                    src = part.headers['Content-Location']
-                elif 'Content-ID' in part.headers:
-                    src = part.headers['Content-ID']
-                else:
-                    src = part.data
-
-                image_node = smil_doc.createElement('img')
-                image_node.setAttribute('src', src)
-                image_node.setAttribute('region', 'Image')
-                if begin > 0 or end > 0:
-                    if end > page.duration:
-                        end = page.duration
-
-                    image_node.setAttribute('begin', str(begin))
-                    image_node.setAttribute('end', str(end))
-
-                par_node.appendChild(image_node)
-
-            if page.text is not None:
-                part, begin, end = page.text
-                src = part.data
-                text_node = smil_doc.createElement('text')
-                text_node.setAttribute('src', src)
-                text_node.setAttribute('region', 'Text')
-                if begin > 0 or end > 0:
-                    if end > page.duration:
-                        end = page.duration
-
-                    text_node.setAttribute('begin', str(begin))
-                    text_node.setAttribute('end', str(end))
-
-                par_node.appendChild(text_node)
-
-            if page.audio is not None:
-                part, begin, end = page.audio
-                if 'Content-Location' in part.headers:
-                    src = part.headers['Content-Location']
-                elif 'Content-ID' in part.headers:
-                    src = part.headers['Content-ID']
-                else:
-                    src = part.data
-
-                audio_node = smil_doc.createElement('audio')
-                audio_node.setAttribute('src', src)
-                if begin > 0 or end > 0:
-                    if end > page.duration:
-                        end = page.duration
-
-                    audio_node.setAttribute('begin', str(begin))
-                    audio_node.setAttribute('end', str(end))
-
-                par_node.appendChild(text_node)
-                par_node.appendChild(audio_node)
-
-            body_node.appendChild(par_node)
-
-        smil_doc.documentElement.appendChild(body_node)
-        return smil_doc.documentElement.toprettyxml()
+        """
+        Returns the text of the message's SMIL file
+
+        The presentation is written by
+        :func:`messaging.mms.smil.generate_smil` out of :attr:`width`,
+        :attr:`height`, :attr:`regions` and the pages of the message.
+
+        :rtype: str
+        """
+        return smil.generate_smil(self._pages, self.width, self.height,
+                                  self.regions, self._metaTags)
 
     def encode(self):
         """
@@ -222,6 +310,31 @@ class MMSMessage:
         encoder = mms_pdu.MMSEncoder()
         return encoder.encode(self)
 
+    def encoded_size(self):
+        """
+        Returns the length of :func:`encode`'s output, without encoding
+
+        Only the headers are encoded to be measured; the length of the
+        attachments is taken from their data, or from a stat of their
+        files, which are not read. See
+        :func:`messaging.mms.mms_pdu.MMSEncoder.encoded_size`.
+
+        :rtype: int
+        """
+        from messaging.mms import mms_pdu
+        return mms_pdu.MMSEncoder().encoded_size(self)
+
+    def template(self):
+        """
+        Returns this message encoded once, for many recipients
+
+        See :class:`messaging.mms.mms_pdu.MMSTemplate`.
+
+        :rtype: :class:`~messaging.mms.mms_pdu.MMSTemplate`
+        """
+        from messaging.mms import mms_pdu
+        return mms_pdu.MMSTemplate(self)
+
     def to_file(self, filename):
         """
         Writes this MMS message to `filename` in binary-encoded form
@@ -235,7 +348,24 @@ class MMSMessage:
         :return: The binary-encode MMS data, as an array of bytes
         """
         with open(filename, 'wb') as f:
-            self.encode().tofile(f)
+            self.encode_to(f)
+
+    def encode_to(self, fileobj):
+        """
+        Writes this MMS message to ``fileobj`` in binary-encoded form
+
+        The message is written as it is encoded, attachments that are
+        backed by files are copied in chunks instead of being loaded.
+        This uses :func:`messaging.mms.mms_pdu.MMSEncoder.encode_to`.
+
+        :param fileobj: A binary file-like object, or a socket
+
+        :return: The number of bytes written
+        :rtype: int
+        """
+        from messaging.mms import mms_pdu
+        encoder = mms_pdu.MMSEncoder()
+        return encoder.encode_to(self, fileobj)
 
     @staticmethod
     def from_data(data):
@@ -252,7 +382,7 @@ class MMSMessage:
         return decoder.decode_data(data)
 
     @staticmethod
-    def from_file(filename):
+    def from_file(filename, use_mmap=False):
         """
         Returns a new `:class:MMSMessage` out of file ``filename``
 
@@ -260,10 +390,46 @@ class MMSMessage:
 
         :param filename: The name of the file to load
         :type filename: str
+        :param use_mmap: Memory-map the file, the part payloads are only
+                         read when accessed
+        :type use_mmap: bool
         """
         from messaging.mms import mms_pdu
         decoder = mms_pdu.MMSDecoder()
-        return decoder.decode_file(filename)
+        return decoder.decode_file(filename, use_mmap=use_mmap)
+
+
+class PartIndex(object):
+    """
+    I map the Content-ID, Content-Location and content type of the
+    parts of a message to the parts
+
+    When several parts share a Content-ID or a Content-Location, the
+    first one that was added is kept.
+    """
+    __slots__ = ('ids', 'locations', 'types')
+
+    def __init__(self):
+        self.ids = {}
+        self.locations = {}
+        self.types = {}
+
+    def __len__(self):
+        return sum(map(len, self.types.itervalues()))
+
+    def add(self, part):
+        """Indexes ``part`` by its current headers"""
+        headers = part.headers
+        content_id = headers.get('Content-ID')
+        if content_id is not None:
+            self.ids.setdefault(content_id.strip('<>'), part)
+
+        location = headers.get('Content-Location')
+        if location is not None:
+            self.locations.setdefault(location, part)
+
+        content_type = part.content_type.lower()
+        self.types.setdefault(content_type, []).append(part)
 
 
 class MMSMessagePage:
@@ -285,9 +451,9 @@ class MMSMessagePage:
 
     @property
     def data_parts(self):
-        """Returns a list of the data parst in this slide"""
-        return [part for part in (self.image, self.audio, self.text)
-                    if part is not None]
+        """Returns a list of the data parts in this slide"""
+        return [item[0] for item in (self.image, self.audio, self.text)
+                    if item is not None]
 
     def number_of_parts(self):
         """
@@ -455,6 +621,7 @@ class DataPart(object):
         self.headers = {'Content-Type': ('application/octet-stream', {})}
         self._filename = None
         self._data = None
+        self._view = None
 
         if filename is not None:
             self.from_file(filename)
@@ -492,6 +659,7 @@ class DataPart(object):
         # Clear any headers that are currently set
         self.headers = {}
         self._data = None
+        self._view = None
         self.headers['Content-Location'] = os.path.basename(filename)
         content_type = (mimetypes.guess_type(filename)[0]
                                 or 'application/octet-stream', {})
@@ -514,12 +682,36 @@ class DataPart(object):
         self.headers = {}
         self._filename = None
         self._data = data
+        self._view = None
 
         if ct_parameters is None:
             ct_parameters = {}
 
         self.headers['Content-Type'] = content_type, ct_parameters
 
+    def set_buffer(self, buf, offset, length, content_type,
+                   ct_parameters=None):
+        """
+        Make this part refer to ``length`` bytes of ``buf`` from ``offset``
+
+        Nothing is copied: the bytes are only sliced out of ``buf`` the
+        first time :attr:`data` is read. This function clears any
+        previously-set header entries.
+
+        :param buf: The buffer holding the data, e.g. a whole MMS
+        :type buf: str or mmap.mmap
+        :param offset: The position of the data in ``buf``
+        :type offset: int
+        :param length: The length of the data
+        :type length: int
+        :param content_type: The MIME content type of the data
+        :type content_type: str
+        :param ct_parameters: Any content type header paramaters to add
+        :type ct_parameters: dict
+        """
+        self.set_data(None, content_type, ct_parameters)
+        self._view = (buf, offset, length)
+
     def set_text(self, text):
         """
         Convenience wrapper method for set_data()
@@ -536,20 +728,84 @@ class DataPart(object):
         """Provides the length of the data encapsulated by this object"""
         if self._filename is not None:
             return int(os.stat(self._filename)[6])
+        elif self._view is not None:
+            return self._view[2]
         else:
             return len(self.data)
 
+    def encoded_size(self):
+        """
+        Returns the length of this part once encoded in a message body
+
+        That is its header and data lengths, content type, headers and
+        data. The data is not read.
+
+        :rtype: int
+        """
+        from messaging.mms import mms_pdu
+        return mms_pdu.MMSEncoder().encoded_part_size(self)
+
     @property
     def data(self):
         """A buffer containing the binary data of this part"""
+        if self._view is not None:
+            buf, offset, length = self._view
+            self._data = buf[offset:offset + length]
+            self._view = None
+
         if self._data is not None:
             if type(self._data) == array.array:
                 self._data = self._data.tostring()
             return self._data
 
         elif self._filename is not None:
-            with open(self._filename, 'r') as f:
+            with open(self._filename, 'rb') as f:
                 self._data = f.read()
             return self._data
 
         return ''
+
+    def iter_chunks(self, chunk_size=65536):
+        """
+        Returns an iterator over the binary data of this part
+
+        The data of file-backed parts that has not been read yet is read
+        from the file in chunks of ``chunk_size`` bytes, and the data of
+        decoded parts is not copied (see :attr:`buffer`).
+
+        :param chunk_size: The size of the chunks read from a file
+        :type chunk_size: int
+        :rtype: iter
+        """
+        if self._filename is not None and self._data is None:
+            with open(self._filename, 'rb') as f:
+                while True:
+                    chunk = f.read(chunk_size)
+                    if not chunk:
+                        break
+
+                    yield chunk
+
+            return
+
+        data = self.buffer
+        if isinstance(data, unicode):
+            # one byte per character, like len() counts them
+            data = data.encode('latin-1')
+
+        if len(data):
+            yield data
+
+    @property
+    def buffer(self):
+        """
+        The binary data of this part, without copying it if possible
+
+        For parts decoded from a message this is a read-only buffer over
+        the original message data, otherwise it is the same as
+        :attr:`data`.
+        """
+        if self._view is not None:
+            return _buffer(*self._view)
+
+        return self.data
@@ -0,0 +1,722 @@
+# See LICENSE
+"""MM1 client: sends and retrieves MMS messages over HTTP"""
+
+from collections import deque
+import httplib
+import mmap
+import select
+import socket
+import tempfile
+from threading import Condition, Event, Lock, Thread
+import time
+import traceback
+import urlparse
+
+from messaging.mms import ids
+from messaging.mms.message import MMSMessage
+from messaging.mms.mms_pdu import MMSDecoder, MMSTemplate
+from messaging.mms.wsp_pdu import DecodeError
+
+MMS_CONTENT_TYPE = 'application/vnd.wap.mms-message'
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+
+
+class MM1Error(Exception):
+    """The MMSC answered with an HTTP error"""
+
+    def __init__(self, status, reason, data=''):
+        Exception.__init__(self, '%d %s' % (status, reason))
+        self.status = status
+        self.reason = reason
+        self.data = data
+
+
+def _is_dropped(conn):
+    # an idle connection has nothing to read, unless the server closed it
+    if conn.sock is None:
+        return True
+
+    try:
+        return bool(select.select([conn.sock], [], [], 0)[0])
+    except (select.error, socket.error, ValueError):
+        return True
+
+
+class ConnectionPool(object):
+    """
+    I keep open the idle HTTP connections, to reuse them
+
+    Up to ``maxsize`` idle connections are kept per host, the ones
+    returned beyond that are closed. I am safe to share between threads.
+    """
+
+    def __init__(self, maxsize=4, timeout=None):
+        """
+        :param maxsize: The idle connections to keep per host
+        :type maxsize: int
+        :param timeout: The timeout of the sockets, in seconds
+        :type timeout: float
+        """
+        self.maxsize = maxsize
+        self.timeout = timeout
+        self._idle = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        """
+        Returns a connection for ``key``, and whether it was idle
+
+        :param key: The scheme, host and port to connect to, and the host
+                    and port to tunnel to (None if not through a proxy)
+        :type key: tuple
+        :rtype: tuple
+        """
+        while True:
+            self._lock.acquire()
+            try:
+                idle = self._idle.get(key)
+                conn = idle.pop() if idle else None
+            finally:
+                self._lock.release()
+
+            if conn is None:
+                break
+
+            if not _is_dropped(conn):
+                return conn, True
+
+            conn.close()
+
+        scheme, host, port, tunnel = key
+        if scheme == 'https':
+            conn = httplib.HTTPSConnection(host, port, timeout=self.timeout)
+        else:
+            conn = httplib.HTTPConnection(host, port, timeout=self.timeout)
+
+        if tunnel is not None:
+            conn.set_tunnel(*tunnel)
+
+        return conn, False
+
+    def put(self, key, conn):
+        """Returns the idle connection ``conn`` to the pool"""
+        self._lock.acquire()
+        try:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.maxsize:
+                idle.append(conn)
+                return
+        finally:
+            self._lock.release()
+
+        conn.close()
+
+    def clear(self):
+        """Closes every idle connection"""
+        self._lock.acquire()
+        try:
+            idle, self._idle = self._idle, {}
+        finally:
+            self._lock.release()
+
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class MM1Client(object):
+    """
+    I send MMS messages to a MMSC and retrieve them from it
+
+    Messages are POSTed to the ``mmsc`` URL and retrieved from the URL
+    of their notification with a GET, over keep-alive connections that
+    are reused for the next requests to the same host. A request that
+    could not be written to a reused connection, because the server had
+    already closed it, is sent again on a new one. A GET is also sent
+    again if a reused connection is closed without an answer, but a POST
+    never is once written: the MMSC might have accepted the message.
+
+    I am safe to share between threads.
+    """
+
+    def __init__(self, mmsc, proxy=None, headers=None, pool=None,
+                 timeout=None):
+        """
+        :param mmsc: The URL the messages are sent to
+        :type mmsc: str
+        :param proxy: The host and port of the HTTP proxy (the WAP
+                      gateway), if any
+        :type proxy: tuple
+        :param headers: Extra HTTP headers for every request, e.g.
+                        User-Agent or x-wap-profile
+        :type headers: dict
+        :param pool: The connections to use, a new pool if None
+        :type pool: :class:`ConnectionPool`
+        :param timeout: The timeout of the sockets of a new pool
+        :type timeout: float
+        """
+        self.mmsc = mmsc
+        self.proxy = proxy
+        self.headers = headers or {}
+        if pool is None:
+            pool = ConnectionPool(timeout=timeout)
+
+        self.pool = pool
+
+    def close(self):
+        """Closes the idle connections"""
+        self.pool.clear()
+
+    def send(self, message, headers=None):
+        """
+        Sends ``message`` to the MMSC and returns its m-send-conf
+
+        The request body is written to the socket as it is encoded, the
+        attachments are never held in memory. Check the Response-Status
+        of the m-send-conf to know if the MMSC accepted the message.
+
+        :param message: An encoded PDU, a message or a template
+        :type message: str, :class:`~messaging.mms.message.MMSMessage` or
+                       :class:`~messaging.mms.mms_pdu.MMSTemplate`
+        :param headers: The headers of this recipient, for a template. If
+                        neither they nor the template have a
+                        Transaction-Id, one from
+                        :func:`~messaging.mms.ids.new_id` is set in them,
+                        like :class:`~messaging.mms.mms_pdu.MMSEncoder`
+                        does in the headers of a message
+        :type headers: dict
+
+        :raise MM1Error: The MMSC answered with an HTTP error
+
+        :return: The decoded answer, None if its body was empty
+        :rtype: :class:`~messaging.mms.message.MMSMessage`
+        """
+        if isinstance(message, MMSTemplate):
+            if headers is None:
+                headers = {}
+
+            if 'Transaction-Id' not in message.headers:
+                # the same one for the Content-Length and the body
+                headers.setdefault('Transaction-Id', ids.new_id())
+
+            recipient = dict(headers)
+            size = message.encoded_size(recipient)
+            write = lambda fileobj: message.encode_to(fileobj, recipient)
+        elif isinstance(message, basestring):
+            size = len(message)
+            write = lambda fileobj: fileobj.sendall(message)
+        else:
+            size = message.encoded_size()
+            write = message.encode_to
+
+        data = self.request('POST', self.mmsc, size, write)
+        if not data:
+            return None
+
+        return MMSMessage.from_data(data)
+
+    def retrieve(self, content_location):
+        """
+        Retrieves the message notified with ``content_location``
+
+        :param content_location: The Content-Location of the
+                                 m-notification-ind
+        :type content_location: str
+
+        :raise MM1Error: The MMSC answered with an HTTP error
+
+        :return: The decoded m-retrieve-conf
+        :rtype: :class:`~messaging.mms.message.MMSMessage`
+        """
+        return MMSMessage.from_data(self.request('GET', content_location))
+
+    def request(self, method, url, size=None, write=None):
+        """
+        Sends a request to ``url`` and returns the body of the answer
+
+        :param method: The HTTP method
+        :type method: str
+        :param size: The length of the request body
+        :type size: int
+        :param write: Called with the socket to write the request body
+        :type write: callable
+
+        :raise MM1Error: The server answered with an HTTP error
+        :rtype: str
+        """
+        response, release = self.open(method, url, size, write)
+        try:
+            return response.read()
+        finally:
+            release()
+
+    def open(self, method, url, size=None, write=None):
+        """
+        Sends a request to ``url`` and returns the answer unread
+
+        The arguments are those of :func:`request`. The body of the
+        answer can be read in chunks, the connection is returned to the
+        pool by the callable returned with it, once the body is read.
+
+        :raise MM1Error: The server answered with an HTTP error
+
+        :return: The response and the callable that releases it
+        :rtype: tuple
+        """
+        key, path = self._route(url)
+        while True:
+            conn, reused = self.pool.get(key)
+            sent = False
+            try:
+                conn.putrequest(method, path, skip_accept_encoding=True)
+                conn.putheader('Accept', MMS_CONTENT_TYPE)
+                if write is not None:
+                    conn.putheader('Content-Type', MMS_CONTENT_TYPE)
+                    conn.putheader('Content-Length', str(size))
+                for name, value in self.headers.items():
+                    conn.putheader(name, value)
+                conn.endheaders()
+                if not reused:
+                    # the body follows the headers in several writes
+                    conn.sock.setsockopt(socket.IPPROTO_TCP,
+                                         socket.TCP_NODELAY, 1)
+
+                if write is not None:
+                    write(conn.sock)
+
+                sent = True
+                response = conn.getresponse()
+                break
+            except socket.timeout:
+                # the server may still be working on the request
+                conn.close()
+                raise
+            except (socket.error, httplib.HTTPException), e:
+                conn.close()
+                # closed by the server while it was idle
+                if reused and (not sent or method == 'GET' and
+                               isinstance(e, httplib.BadStatusLine)):
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+
+        def release():
+            if response.isclosed() and not response.will_close:
+                self.pool.put(key, conn)
+            else:
+                # the body was not read to the end
+                conn.close()
+
+        if not 200 <= response.status < 300:
+            try:
+                data = response.read()
+            finally:
+                release()
+
+            raise MM1Error(response.status, response.reason, data)
+
+        return response, release
+
+    def _route(self, url):
+        """Returns the pool key and the request path of ``url``"""
+        parts = urlparse.urlsplit(url)
+        scheme = parts.scheme or 'http'
+        host = parts.hostname
+        port = parts.port or DEFAULT_PORTS.get(scheme, 80)
+
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+
+        if self.proxy is None:
+            return (scheme, host, port, None), path
+
+        proxy_host, proxy_port = self.proxy
+        if scheme == 'https':
+            # CONNECT through the proxy, then talk to the host
+            return (scheme, proxy_host, proxy_port, (host, port)), path
+
+        return ('http', proxy_host, proxy_port, None), url
+
+
+class Retrieval(object):
+    """
+    I am a message being retrieved by a :class:`RetrievalService`
+
+    ``headers`` is the message without its data parts, as soon as its
+    headers are received, and ``message`` the decoded message, or
+    ``error`` the exception raised while retrieving it.
+    ``headers_latency`` and ``latency`` are the seconds it took to get
+    the headers and the whole message.
+    """
+
+    def __init__(self, content_location, callback=None):
+        self.content_location = content_location
+        self.callback = callback
+        self.headers = None
+        self.message = None
+        self.error = None
+        self.headers_latency = None
+        self.latency = None
+        self._done = Event()
+
+    def done(self):
+        """Returns whether the retrieval finished"""
+        return self._done.is_set()
+
+    def wait(self, timeout=None):
+        """
+        Waits until the retrieval finishes
+
+        :return: Whether it finished, False if ``timeout`` expired
+        :rtype: bool
+        """
+        return self._done.wait(timeout)
+
+    def result(self, timeout=None):
+        """
+        Waits for the message and returns it
+
+        :raise: The error that made the retrieval fail
+        :rtype: :class:`~messaging.mms.message.MMSMessage`
+        """
+        if not self._done.wait(timeout):
+            raise RuntimeError('Retrieval of %s not finished'
+                               % self.content_location)
+
+        if self.error is not None:
+            raise self.error
+
+        return self.message
+
+
+class HostStats(object):
+    """
+    I am the latency of the retrievals from a host, in seconds
+
+    The percentiles are taken from the last ``samples`` retrievals.
+    """
+
+    def __init__(self, samples=1024):
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+        self.max = 0.0
+        self.headers_total = 0.0
+        self._recent = deque(maxlen=samples)
+
+    def add(self, retrieval):
+        """Counts the finished ``retrieval``"""
+        self.count += 1
+        if retrieval.error is not None:
+            self.errors += 1
+            return
+
+        self.total += retrieval.latency
+        self.max = max(self.max, retrieval.latency)
+        self.headers_total += retrieval.headers_latency
+        self._recent.append(retrieval.latency)
+
+    def percentile(self, percent):
+        """Returns the latency ``percent`` per cent of the recent are under"""
+        if not self._recent:
+            return None
+
+        recent = sorted(self._recent)
+        return recent[min(len(recent) - 1, len(recent) * percent // 100)]
+
+    def summary(self):
+        """
+        Returns the counters, the mean and max latencies, the mean
+        latency of the headers and the 50, 95 and 99 percentiles
+
+        :rtype: dict
+        """
+        succeeded = self.count - self.errors
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'mean': self.total / succeeded if succeeded else None,
+            'max': self.max,
+            'headers_mean': (self.headers_total / succeeded
+                             if succeeded else None),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99),
+        }
+
+
+class _Spool(object):
+    """The body of a retrieval, moved to a temporary file when big"""
+
+    def __init__(self, max_size, dir=None):
+        self.max_size = max_size
+        self.dir = dir
+        self.size = 0
+        self._chunks = []
+        self._file = None
+
+    def write(self, chunk):
+        self.size += len(chunk)
+        if self._file is not None:
+            self._file.write(chunk)
+            return
+
+        self._chunks.append(chunk)
+        if self.size > self.max_size:
+            self._file = tempfile.TemporaryFile(dir=self.dir)
+            self._file.write(''.join(self._chunks))
+            self._chunks = None
+
+    def head(self):
+        """Returns what was written, if it is still in memory"""
+        if self._file is None:
+            return ''.join(self._chunks)
+
+    def getvalue(self):
+        """Returns what was written, a memory map of the file if spilled"""
+        if self._file is None:
+            return ''.join(self._chunks)
+
+        self._file.flush()
+        try:
+            # the mapping outlives the (already deleted) file
+            return mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        finally:
+            self._file.close()
+
+
+class RetrievalService(object):
+    """
+    I retrieve many MMS messages at the same time, from many MMSCs
+
+    Worker threads fetch the Content-Location of the submitted
+    notifications with the connections of ``client``, never more than
+    ``max_per_host`` at the same time from the same host. The message
+    headers are decoded as soon as they arrive, while the body is still
+    being received. Bodies bigger than ``spool_size`` are written to a
+    temporary file that is memory-mapped to decode them, so the data
+    parts of the message are views into the mapping.
+    """
+
+    def __init__(self, client=None, workers=8, max_per_host=4,
+                 spool_size=1024 * 1024, spool_dir=None, on_headers=None,
+                 chunk_size=65536, clock=time.time):
+        """
+        :param client: The client to retrieve with, one without a MMSC
+                       URL if None
+        :type client: :class:`MM1Client`
+        :param workers: The number of threads
+        :type workers: int
+        :param max_per_host: The retrievals from one host at a time
+        :type max_per_host: int
+        :param spool_size: The bodies bigger than this go to a file
+        :type spool_size: int
+        :param spool_dir: The directory of the files, the default
+                          temporary directory if None
+        :type spool_dir: str
+        :param on_headers: Called with the :class:`Retrieval` when its
+                           headers are decoded, from a worker thread
+        :type on_headers: callable
+        """
+        if client is None:
+            client = MM1Client(None, pool=ConnectionPool(max_per_host))
+
+        self.client = client
+        self.max_per_host = max_per_host
+        self.spool_size = spool_size
+        self.spool_dir = spool_dir
+        self.on_headers = on_headers
+        self.chunk_size = chunk_size
+        self._clock = clock
+
+        self._cond = Condition()
+        self._pending = {}
+        self._active = {}
+        self._hosts = deque()
+        self._stats = {}
+        self._closed = False
+
+        self._workers = [Thread(target=self._work) for i in range(workers)]
+        for worker in self._workers:
+            worker.daemon = True
+            worker.start()
+
+    def submit(self, content_location, callback=None):
+        """
+        Queues the retrieval of ``content_location``
+
+        :param callback: Called with the :class:`Retrieval` when it
+                         finishes, from a worker thread
+        :type callback: callable
+        :rtype: :class:`Retrieval`
+        """
+        retrieval = Retrieval(content_location, callback)
+        host = urlparse.urlsplit(content_location).netloc
+
+        self._cond.acquire()
+        try:
+            if self._closed:
+                raise ValueError('The service is closed')
+
+            if host not in self._pending:
+                self._pending[host] = deque()
+                self._active[host] = 0
+                self._hosts.append(host)
+
+            self._pending[host].append((self._clock(), retrieval))
+            self._cond.notify()
+        finally:
+            self._cond.release()
+
+        return retrieval
+
+    def close(self, wait=True):
+        """
+        Stops the workers once the queued retrievals finish
+
+        :param wait: Whether to wait for them
+        :type wait: bool
+        """
+        self._cond.acquire()
+        try:
+            self._closed = True
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+        if wait:
+            for worker in self._workers:
+                worker.join()
+
+            self.client.close()
+
+    def stats(self):
+        """
+        Returns the latency of the retrievals of every host
+
+        The latencies count from the submission, so they include the
+        time spent waiting for a free slot.
+
+        :return: A :func:`HostStats.summary` per host
+        :rtype: dict
+        """
+        self._cond.acquire()
+        try:
+            return dict((host, stats.summary())
+                        for host, stats in self._stats.items())
+        finally:
+            self._cond.release()
+
+    def _next(self):
+        """Returns the next retrieval to do, None to stop"""
+        self._cond.acquire()
+        try:
+            while True:
+                for i in xrange(len(self._hosts)):
+                    # round robin, a busy host does not starve the others
+                    host = self._hosts[0]
+                    self._hosts.rotate(-1)
+                    if (self._pending[host] and
+                            self._active[host] < self.max_per_host):
+                        self._active[host] += 1
+                        return host, self._pending[host].popleft()
+
+                if self._closed and not any(self._pending.values()):
+                    return None
+
+                self._cond.wait()
+        finally:
+            self._cond.release()
+
+    def _finish(self, host, retrieval):
+        self._cond.acquire()
+        try:
+            self._active[host] -= 1
+            if host not in self._stats:
+                self._stats[host] = HostStats()
+
+            self._stats[host].add(retrieval)
+            if not self._active[host] and not self._pending[host]:
+                del self._active[host]
+                del self._pending[host]
+                self._hosts.remove(host)
+
+            self._cond.notify_all()
+        finally:
+            self._cond.release()
+
+    def _work(self):
+        while True:
+            job = self._next()
+            if job is None:
+                return
+
+            host, (start, retrieval) = job
+            try:
+                self._retrieve(retrieval, start)
+            except Exception, e:
+                retrieval.error = e
+
+            self._finish(host, retrieval)
+            retrieval._done.set()
+            if retrieval.callback is not None:
+                try:
+                    retrieval.callback(retrieval)
+                except Exception:
+                    # like an uncaught exception, but keep the worker
+                    traceback.print_exc()
+
+    def _retrieve(self, retrieval, start):
+        response, release = self.client.open('GET',
+                                             retrieval.content_location)
+        spool = _Spool(self.spool_size, self.spool_dir)
+        retry_size = 0
+        try:
+            while True:
+                chunk = response.read(self.chunk_size)
+                if not chunk:
+                    break
+
+                spool.write(chunk)
+                if retrieval.headers is None and spool.size >= retry_size:
+                    self._decode_headers(retrieval, spool.head(), start)
+                    # if incomplete, try again once the data has doubled:
+                    # what is decoded stays linear in the size of the head
+                    retry_size = 2 * spool.size
+        finally:
+            release()
+
+        data = spool.getvalue()
+        if retrieval.headers is None:
+            self._decode_headers(retrieval, data, start, complete=True)
+
+        retrieval.message = MMSDecoder().decode_data(data)
+        retrieval.latency = self._clock() - start
+
+    def _decode_headers(self, retrieval, data, start, complete=False):
+        if data is None:
+            # spilled before they could be decoded
+            return
+
+        decoder = MMSDecoder()
+        try:
+            headers = decoder.decode_headers(data)
+        except (DecodeError, StopIteration, IndexError):
+            if complete:
+                raise
+            return
+
+        # unless the body is complete, wait for what follows the
+        # headers, at least the number of parts
+        if not complete and (decoder.header_length is None or
+                             decoder.header_length >= len(data)):
+            return
+
+        retrieval.headers = headers
+        retrieval.headers_latency = self._clock() - start
+        if self.on_headers is not None:
+            self.on_headers(retrieval)
@@ -13,23 +13,12 @@
 
 from __future__ import with_statement
 import array
-import os
-import random
+from collections import namedtuple
+from datetime import datetime
+import mmap
 
-from messaging.utils import debug
-from messaging.mms import message, wsp_pdu
-from messaging.mms.iterator import PreviewIterator
-
-
-def flatten_list(x):
-    """Flattens ``x`` into a single list"""
-    result = []
-    for el in x:
-        if hasattr(el, "__iter__") and not isinstance(el, basestring):
-            result.extend(flatten_list(el))
-        else:
-            result.append(el)
-    return result
+from messaging.mms import ids, message, wsp_pdu
+from messaging.mms.iterator import ByteCursor, PreviewIterator
 
 
 mms_field_names = {
@@ -60,6 +49,18 @@ mms_field_names = {
 }
 
 
+class PartInfo(namedtuple('PartInfo', 'offset headers_len data_len '
+                                      'content_type content_id')):
+    """
+    I am the position of a data part in an encoded MMS message
+
+    ``offset`` is where the part's data starts, ``headers_len`` the size
+    of everything before it (the two lengths and the part headers) and
+    ``data_len`` the size of the data.
+    """
+    __slots__ = ()
+
+
 class MMSDecoder(wsp_pdu.Decoder):
     """A decoder for MMS messages"""
 
@@ -72,24 +73,39 @@ class MMSDecoder(wsp_pdu.Decoder):
         self._mms_data = array.array('B')
         self._mms_message = message.MMSMessage()
         self._parts = []
+        self.header_length = None
 
-    def decode_file(self, filename):
+    def decode_file(self, filename, use_mmap=False):
         """
         Load the data contained in the specified ``filename``, and decode it.
 
+        If ``use_mmap`` is True the file is memory-mapped instead of read:
+        only the message headers and the part headers are touched while
+        decoding, and the payloads of the returned parts are views into
+        the mapping that are read (and paged in) on first access. The
+        mapping is released once the message and its parts are gone.
+
         :param filename: The name of the MMS message file to open
         :type filename: str
+        :param use_mmap: Whether to memory-map the file
+        :type use_mmap: bool
 
         :raise OSError: The filename is invalid
 
         :return: The decoded MMS data
         :rtype: MMSMessage
         """
-        num_bytes = os.stat(filename)[6]
-        data = array.array('B')
-
         with open(filename, 'rb') as f:
-            data.fromfile(f, num_bytes)
+            data = None
+            if use_mmap:
+                try:
+                    data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except (ValueError, EnvironmentError):
+                    # empty files and special files can not be mapped
+                    pass
+
+            if data is None:
+                data = f.read()
 
         return self.decode_data(data)
 
@@ -98,7 +114,7 @@ class MMSDecoder(wsp_pdu.Decoder):
         Decode the specified MMS message data
 
         :param data: The MMS message data to decode
-        :type data: array.array('B')
+        :type data: str, mmap.mmap or array.array('B')
 
         :return: The decoded MMS data
         :rtype: MMSMessage
@@ -109,6 +125,59 @@ class MMSDecoder(wsp_pdu.Decoder):
         self.decode_message_body(body_iter)
         return self._mms_message
 
+    def decode_headers(self, data):
+        """
+        Decodes only the headers of the MMS message ``data``
+
+        Decoding stops at the Content-Type header, the message body is
+        not looked at. This is the cheapest way to classify or route a
+        message regardless of the size of its attachments.
+
+        :param data: The MMS message data to decode
+        :type data: str, mmap.mmap or array.array('B')
+
+        :return: A message with the decoded headers and no data parts
+        :rtype: MMSMessage
+        """
+        self._mms_message = message.MMSMessage()
+        self._mms_data = data
+        self.decode_message_header()
+        return self._mms_message
+
+    def decode_part_index(self, data):
+        """
+        Returns the layout of the data parts of the MMS message ``data``
+
+        The message and part headers are decoded, but the part payloads
+        are skipped using their lengths and never read.
+
+        :param data: The MMS message data to decode
+        :type data: str, mmap.mmap or array.array('B')
+
+        :return: A list with a :class:`PartInfo` per data part, in order
+        :rtype: list
+        """
+        self._mms_message = message.MMSMessage()
+        self._mms_data = data
+        data_iter = self.decode_message_header()
+
+        index = []
+        try:
+            num_entries = self.decode_uint_var(data_iter)
+        except StopIteration:
+            return index
+
+        for part_num in xrange(num_entries):
+            start = data_iter.pos
+            ctype, ct_parameters, headers, data_len = \
+                    self.decode_part_headers(data_iter)
+            offset = data_iter.pos
+            data_iter.advance(data_len)
+            index.append(PartInfo(offset, offset - start, data_len, ctype,
+                                  headers.get('Content-ID')))
+
+        return index
+
     def decode_message_header(self):
         """
         Decodes the (full) MMS header data
@@ -116,7 +185,7 @@ class MMSDecoder(wsp_pdu.Decoder):
         This must be called before :func:`_decodeBody`, as it sets
         certain internal variables relating to data lengths, etc.
         """
-        data_iter = PreviewIterator(self._mms_data)
+        data_iter = ByteCursor(self._mms_data)
 
         # First 3  headers (in order
         ############################
@@ -150,6 +219,8 @@ class MMSDecoder(wsp_pdu.Decoder):
             # content_type, params = value
             self._mms_message.headers[header] = value
 
+        # where the body starts, None if the headers are incomplete
+        self.header_length = data_iter.pos if content_type_found else None
         return data_iter
 
     def decode_message_body(self, data_iter):
@@ -169,6 +240,9 @@ class MMSDecoder(wsp_pdu.Decoder):
 
         #print 'Number of data entries (parts) in MMS body:', num_entries
 
+        # index the parts as they are added
+        self._mms_message._part_index = message.PartIndex()
+
         ########## MMS body: entries ##########
         # For every data "part", we have to read the following sequence:
         # <length of content-type + other possible headers>,
@@ -177,38 +251,61 @@ class MMSDecoder(wsp_pdu.Decoder):
         # <data>
         for part_num in xrange(num_entries):
             #print '\nPart %d:\n------' % part_num
-            headers_len = self.decode_uint_var(data_iter)
-            data_len = self.decode_uint_var(data_iter)
+            ctype, ct_parameters, headers, data_len = \
+                    self.decode_part_headers(data_iter)
+
+            # Data (note: this is not null-terminated)
+            part = message.DataPart()
+            if isinstance(data_iter, ByteCursor):
+                # refer to the payload instead of copying it
+                offset = data_iter.pos
+                data_iter.advance(data_len)
+                part.set_buffer(data_iter.data, offset, data_len, ctype)
+            else:
+                data = array.array('B')
+                for i in xrange(data_len):
+                    data.append(data_iter.next())
+
+                part.set_data(data, ctype)
 
-            # Prepare to read content-type + other possible headers
+            part.content_type_parameters = ct_parameters
+            part.headers = headers
+            self._mms_message.add_data_part(part)
+
+    def decode_part_headers(self, data_iter):
+        """
+        Decodes the headers of the data part pointed by ``data_iter``
+
+        ``data_iter`` is left at the start of the part's data.
+
+        :return: The part content type, its parameters, the part headers
+                 and the length of the part's data, in the format:
+                 (<str:content-type>, <dict:parameters>, <dict:headers>,
+                 <int:data length>)
+        :rtype: tuple
+        """
+        headers_len = self.decode_uint_var(data_iter)
+        data_len = self.decode_uint_var(data_iter)
+
+        # Prepare to read content-type + other possible headers
+        if isinstance(data_iter, ByteCursor):
+            ct_iter = data_iter.sub_cursor(headers_len)
+        else:
             ct_field_bytes = []
             for i in xrange(headers_len):
                 ct_field_bytes.append(data_iter.next())
 
             ct_iter = PreviewIterator(ct_field_bytes)
-            # Get content type
-            ctype, ct_parameters = self.decode_content_type_value(ct_iter)
-            headers = {'Content-Type': (ctype, ct_parameters)}
 
-            # Now read other possible headers until <headers_len> bytes
-            # have been read
-            while True:
-                try:
-                    hdr, value = self.decode_header(ct_iter)
-                    headers[hdr] = value
-                except StopIteration:
-                    break
+        # Get content type
+        ctype, ct_parameters = self.decode_content_type_value(ct_iter)
+        headers = {'Content-Type': (ctype, ct_parameters)}
 
-            # Data (note: this is not null-terminated)
-            data = array.array('B')
-            for i in xrange(data_len):
-                data.append(data_iter.next())
+        # Now read other possible headers until <headers_len> bytes
+        # have been read
+        headers.update(wsp_pdu.Decoder.decode_headers(ct_iter))
 
-            part = message.DataPart()
-            part.set_data(data, ctype)
-            part.content_type_parameters = ct_parameters
-            part.headers = headers
-            self._mms_message.add_data_part(part)
+        return ctype, ct_parameters, headers, data_len
 
     @staticmethod
     def decode_header(byte_iter):
@@ -264,26 +361,24 @@ class MMSDecoder(wsp_pdu.Decoder):
         :rtype: tuple
         """
         # Get the MMS-field-name
-        mms_field_name = ''
-        preview = byte_iter.preview()
-        byte = wsp_pdu.Decoder.decode_short_integer_from_byte(preview)
-
-        if byte in mms_field_names:
-            byte_iter.next()
-            mms_field_name = mms_field_names[byte][0]
-        else:
-            byte_iter.reset_preview()
+        byte = byte_iter.preview()
+        byte_iter.reset_preview()
+        if byte not in mms_header_decoders:
             raise wsp_pdu.DecodeError('Invalid MMS Header: could '
                                       'not decode MMS field name')
 
+        byte_iter.next()
+        mms_field_name, decode = mms_header_decoders[byte]
+
         # Now get the MMS-value
-        mms_value = ''
         try:
-            name = mms_field_names[byte][1]
-            mms_value = getattr(MMSDecoder, 'decode_%s' % name)(byte_iter)
+            mms_value = decode(byte_iter)
         except wsp_pdu.DecodeError, msg:
             raise wsp_pdu.DecodeError('Invalid MMS Header: Could '
                                       'not decode MMS-value: %s' % msg)
+        except StopIteration:
+            # the data ends in the middle of the value
+            raise
         except:
             raise RuntimeError('A fatal error occurred, probably due to an '
                                'unimplemented decoding operation. Tried to '
@@ -603,9 +698,48 @@ class MMSEncoder(wsp_pdu.Encoder):
         :rtype: array.array('B')
         """
         self._mms_message = mms_message
-        msg_data = self.encode_message_header()
-        msg_data.extend(self.encode_message_body())
-        return msg_data
+        writer = wsp_pdu.ByteWriter()
+        self.write_message_header(writer)
+        for chunk in self.iter_message_body():
+            writer.write(chunk)
+
+        return array.array('B', writer.getvalue())
+
+    def encode_to(self, mms_message, fileobj, chunk_size=65536):
+        """
+        Encodes ``mms_message`` and writes it to ``fileobj``
+
+        The output is exactly the same as :func:`encode`'s, but the whole
+        message is never held in memory: part lengths are taken from
+        :func:`len` (a stat for file-backed parts) and the part payloads
+        are written as they are read, in chunks of ``chunk_size`` bytes.
+
+        :param mms_message: The MMS message to encode
+        :type mms_message: MMSMessage
+        :param fileobj: A binary file-like object, or a socket
+        :param chunk_size: The size of the chunks read from files
+        :type chunk_size: int
+
+        :return: The number of bytes written
+        :rtype: int
+        """
+        self._mms_message = mms_message
+        write = getattr(fileobj, 'write', None)
+        if write is None:
+            write = fileobj.sendall
+
+        written = 0
+        writer = wsp_pdu.ByteWriter()
+        self.write_message_header(writer)
+        header = writer.getvalue()
+        write(header)
+        written += len(header)
+
+        for chunk in self.iter_message_body(chunk_size):
+            write(chunk)
+            written += len(chunk)
+
+        return written
 
     def encode_message_header(self):
         """
@@ -618,16 +752,34 @@ class MMSEncoder(wsp_pdu.Encoder):
         :return: the MMS PDU header, as an array of bytes
         :rtype: array.array('B')
         """
+        writer = wsp_pdu.ByteWriter()
+        self.write_message_header(writer)
+        return array.array('B', writer.getvalue())
+
+    def write_message_header(self, writer, headers=None):
+        """
+        Writes the MMS header data to ``writer``
+
+        See :func:`encode_message_header`. A message without a
+        Transaction-Id gets one from :func:`~messaging.mms.ids.new_id`,
+        which is also added to its headers.
+
+        :type writer: wsp_pdu.ByteWriter
+        :param headers: The headers to write instead of the message's
+        :type headers: dict
+        """
         # See [4], chapter 8 for info on how to use these
         # from_types = {'Address-present-token': 0x80,
         #               'Insert-address-token': 0x81}
 
         # content_types = {'application/vnd.wap.multipart.related': 0xb3}
 
-        # Create an array of 8-bit values
-        message_header = array.array('B')
+        own_headers = headers is None
+        if own_headers:
+            headers = self._mms_message.headers
 
-        headers_to_encode = self._mms_message.headers
+        # work on a copy, the message can be encoded more than once
+        headers_to_encode = headers.copy()
 
         # If the user added any of these to the message manually
         # (X- prefix) use those instead
@@ -673,8 +825,11 @@ class MMSEncoder(wsp_pdu.Encoder):
 
         ### Start of Transaction-Id verification
         if 'Transaction-Id' not in headers_to_encode:
-            trans_id = str(random.randint(1000, 9999))
+            trans_id = ids.new_id()
             headers_to_encode['Transaction-Id'] = trans_id
+            if own_headers:
+                # keep it, to match the answers of the MMSC
+                headers['Transaction-Id'] = trans_id
         ### End of Transaction-Id verification
 
         ### Start of MMS-Version verification
@@ -683,24 +838,69 @@ class MMSEncoder(wsp_pdu.Encoder):
 
         # Encode the first three headers, in correct order
         for hdr in ('Message-Type', 'Transaction-Id', 'MMS-Version'):
-            message_header.extend(
-                MMSEncoder.encode_header(hdr, headers_to_encode[hdr]))
+            MMSEncoder.write_header(writer, hdr, headers_to_encode[hdr])
             del headers_to_encode[hdr]
 
         # Encode all remaining MMS message headers, except "Content-Type"
         # -- this needs to be added last, according [2] and [4]
         for hdr in headers_to_encode:
             if hdr != 'Content-Type':
-                message_header.extend(
-                    MMSEncoder.encode_header(hdr, headers_to_encode[hdr]))
+                MMSEncoder.write_header(writer, hdr, headers_to_encode[hdr])
+
+        # Ok, now only "Content-type" should be left, PDUs without a
+        # body (m-send-conf, m-notifyresp-ind, ...) do not have it
+        if 'Content-Type' in headers_to_encode:
+            content_type, ct_parameters = headers_to_encode['Content-Type']
+            writer.write(MMSEncoder.encode_mms_field_name('Content-Type'))
+            MMSEncoder.write_content_type_value(writer, content_type,
+                                                ct_parameters)
+
+    def encoded_header_size(self, headers=None):
+        """
+        Returns the length of the encoded MMS header data
+
+        :param headers: The headers to measure instead of the message's
+        :type headers: dict
+        :rtype: int
+        """
+        writer = wsp_pdu.ByteWriter()
+        self.write_message_header(writer, headers)
+        return len(writer)
+
+    def encoded_part_size(self, part):
+        """
+        Returns the length of ``part`` once encoded in the message body
+
+        Only the part headers are encoded, the length of the data is
+        taken from :func:`len` (a stat for file-backed parts).
+
+        :param part: The data part to measure
+        :type part: DataPart
+        :rtype: int
+        """
+        writer = wsp_pdu.ByteWriter()
+        self.write_part_header(writer, part)
+        return len(writer) + len(part)
+
+    def encoded_size(self, mms_message):
+        """
+        Returns ``len(self.encode(mms_message))``, without encoding it
 
-        # Ok, now only "Content-type" should be left
-        content_type, ct_parameters = headers_to_encode['Content-Type']
-        message_header.extend(MMSEncoder.encode_mms_field_name('Content-Type'))
-        ret = MMSEncoder.encode_content_type_value(content_type, ct_parameters)
-        message_header.extend(flatten_list(ret))
+        The headers of the message and of its parts are encoded to be
+        measured, but the payloads are neither copied nor read.
 
-        return message_header
+        :param mms_message: The MMS message to measure
+        :type mms_message: MMSMessage
+        :rtype: int
+        """
+        self._mms_message = mms_message
+        size = self.encoded_header_size()
+        parts = self.get_message_parts()
+        size += len(wsp_pdu._uint_var(len(parts)))
+        for part in parts:
+            size += self.encoded_part_size(part)
+
+        return size
 
     def encode_message_body(self):
         """
@@ -745,18 +945,30 @@ class MMSEncoder(wsp_pdu.Encoder):
         :rtype: array.array('B')
         """
         message_body = array.array('B')
+        for chunk in self.iter_message_body():
+            message_body.fromstring(chunk)
 
-        #TODO: enable encoding of MMSs without SMIL file
-        ########## MMS body: header ##########
-        # Parts: SMIL file + <number of data elements in each slide>
-        num_entries = 1
-        for page in self._mms_message._pages:
-            num_entries += page.number_of_parts()
+        return message_body
+
+    def iter_message_body(self, chunk_size=65536):
+        """
+        Binary-encodes the MMS body data piece by piece
+
+        This yields the same bytes as :func:`encode_message_body`: the
+        number of entries, and then the encoded headers of every part
+        followed by its data, in chunks of at most ``chunk_size`` bytes
+        for parts that are backed by a file.
 
-        for data_part in self._mms_message._data_parts:
-            num_entries += 1
+        :param chunk_size: The size of the chunks read from files
+        :type chunk_size: int
 
-        message_body.extend(self.encode_uint_var(num_entries))
+        :return: An iterator over the binary-encoded MMS PDU body
+        :rtype: iter
+        """
+        parts = self.get_message_parts()
+
+        ########## MMS body: header ##########
+        yield str(wsp_pdu._uint_var(len(parts)))
 
         ########## MMS body: entries ##########
         # For every data "part", we have to add the following sequence:
@@ -764,45 +976,71 @@ class MMSEncoder(wsp_pdu.Encoder):
         # <length of data>,
         # <content-type + other possible headers>,
         # <data>.
+        for part in parts:
+            writer = wsp_pdu.ByteWriter()
+            self.write_part_header(writer, part)
+            yield writer.getvalue()
+            # Data (note: we do not null-terminate this)
+            for chunk in part.iter_chunks(chunk_size):
+                yield chunk
+
+    def get_message_parts(self):
+        """
+        Returns the data parts to encode, in order
 
-        # Gather the data parts, adding the MMS message's SMIL file
-        smil_part = message.DataPart()
-        smil = self._mms_message.smil()
-        smil_part.set_data(smil, 'application/smil')
-        #TODO: make this dynamic....
-        smil_part.headers['Content-ID'] = '<0000>'
-        parts = [smil_part]
+        The SMIL part describing the message pages comes first, followed
+        by the parts in every page and the parts that were added with
+        :func:`~messaging.mms.message.MMSMessage.add_data_part`.
+
+        :rtype: list
+        """
+        #TODO: enable encoding of MMSs without SMIL file
+        parts = [self._mms_message._make_smil_part()]
         for slide in self._mms_message._pages:
-            for part_tuple in (slide.image, slide.audio, slide.text):
-                if part_tuple is not None:
-                    parts.append(part_tuple[0])
+            parts.extend(slide.data_parts)
 
-        for part in parts:
-            name, val_type = part.headers['Content-Type']
-            part_content_type = self.encode_content_type_value(name, val_type)
-
-            encoded_part_headers = []
-            for hdr in part.headers:
-                if hdr == 'Content-Type':
-                    continue
-                encoded_part_headers.extend(
-                        wsp_pdu.Encoder.encode_header(hdr, part.headers[hdr]))
-
-            # HeadersLen entry (length of the ContentType and
-            #  Headers fields combined)
-            headers_len = len(part_content_type) + len(encoded_part_headers)
-            message_body.extend(self.encode_uint_var(headers_len))
-            # DataLen entry (length of the Data field)
-            message_body.extend(self.encode_uint_var(len(part)))
-            # ContentType entry
-            message_body.extend(part_content_type)
-            # Headers
-            message_body.extend(encoded_part_headers)
-            # Data (note: we do not null-terminate this)
-            for char in part.data:
-                message_body.append(ord(char))
+        parts.extend(self._mms_message._data_parts)
+        return parts
 
-        return message_body
+    def encode_part_header(self, part):
+        """
+        Binary-encodes everything that precedes the data of ``part``
+
+        :param part: The data part to encode
+        :type part: DataPart
+
+        :return: The HeadersLen, DataLen, ContentType and Headers fields
+        :rtype: array.array('B')
+        """
+        writer = wsp_pdu.ByteWriter()
+        self.write_part_header(writer, part)
+        return array.array('B', writer.getvalue())
+
+    def write_part_header(self, writer, part):
+        """
+        Writes everything that precedes the data of ``part`` to ``writer``
+
+        See :func:`encode_part_header`.
+
+        :type writer: wsp_pdu.ByteWriter
+        """
+        mark = writer.mark()
+        # ContentType entry
+        name, val_type = part.headers['Content-Type']
+        self.write_content_type_value(writer, name, val_type)
+        # Headers
+        for hdr in part.headers:
+            if hdr == 'Content-Type':
+                continue
+            wsp_pdu.Encoder.write_header(writer, hdr, part.headers[hdr])
+
+        # HeadersLen entry (length of the ContentType and
+        #  Headers fields combined) and DataLen entry (length of the
+        #  Data field) go in front of them
+        headers_len = writer.mark() - mark
+        lengths = wsp_pdu._uint_var(headers_len)
+        lengths += wsp_pdu._uint_var(len(part))
+        writer.insert(mark, lengths)
 
     @staticmethod
     def encode_header(header_field_name, header_value):
@@ -831,39 +1069,38 @@ class MMSEncoder(wsp_pdu.Encoder):
                  (<str:header name>, <str/int/float:header value>)
         :rtype: tuple
         """
-        encoded_header = []
-        # First try encoding the header as a "MMS-header"...
-        for assigned_number in mms_field_names:
-            header = mms_field_names[assigned_number][0]
-            if header == header_field_name:
-                encoded_header.extend(
-                    wsp_pdu.Encoder.encode_short_integer(assigned_number))
-                # Now encode the value
-                expected_type = mms_field_names[assigned_number][1]
-                try:
-                    ret = getattr(MMSEncoder,
-                                  'encode_%s' % expected_type)(header_value)
-                    encoded_header.extend(ret)
-                except wsp_pdu.EncodeError, msg:
-                    raise wsp_pdu.EncodeError('Error encoding parameter '
-                                              'value: %s' % msg)
-                except:
-                    debug('A fatal error occurred, probably due to an '
-                          'unimplemented encoding operation')
-                    raise
+        writer = wsp_pdu.ByteWriter()
+        MMSEncoder.write_header(writer, header_field_name, header_value)
+        return writer.tolist()
 
-                break
+    @staticmethod
+    def write_header(writer, header_field_name, header_value):
+        """
+        Writes a header entry for an MMS message to ``writer``
 
-        # See if the "MMS-header" encoding worked
-        if not len(encoded_header):
-            # ...it didn't. Use "Application-header" encoding
+        See :func:`encode_header`.
+
+        :type writer: wsp_pdu.ByteWriter
+        """
+        # First try encoding the header as a "MMS-header"...
+        if header_field_name in mms_header_encoders:
+            assigned_number, encode = mms_header_encoders[header_field_name]
+            writer.write_byte(assigned_number)
+            # Now encode the value
+            if encode is None:
+                raise wsp_pdu.EncodeError('Encoding of header "%s" is not '
+                                          'implemented' % header_field_name)
+            try:
+                writer.write(encode(header_value))
+            except wsp_pdu.EncodeError, msg:
+                raise wsp_pdu.EncodeError('Error encoding parameter '
+                                          'value: %s' % msg)
+        else:
+            # ...it isn't. Use "Application-header" encoding
             header_name = wsp_pdu.Encoder.encode_token_text(header_field_name)
-            encoded_header.extend(header_name)
+            writer.write(header_name)
             # Now add the value
-            encoded_header.extend(
-                    wsp_pdu.Encoder.encode_text_string(header_value))
-
-        return encoded_header
+            writer.write_text_string(header_value)
 
     @staticmethod
     def encode_mms_field_name(field_name):
@@ -883,19 +1120,11 @@ class MMSEncoder(wsp_pdu.Encoder):
         :return: The encoded header field name, as a sequence of bytes
         :rtype: list
         """
-        encoded_mms_field_name = []
-
-        for assigned_number in mms_field_names:
-            if mms_field_names[assigned_number][0] == field_name:
-                encoded_mms_field_name.extend(
-                        wsp_pdu.Encoder.encode_short_integer(assigned_number))
-                break
-
-        if not len(encoded_mms_field_name):
+        if field_name not in mms_header_encoders:
             raise wsp_pdu.EncodeError('The specified header field name is not '
                                       'a well-known MMS header field name')
 
-        return encoded_mms_field_name
+        return [mms_header_encoders[field_name][0]]
 
     @staticmethod
     def encode_from_value(from_value=''):
@@ -982,6 +1211,78 @@ class MMSEncoder(wsp_pdu.Encoder):
 
         return [message_types.get(message_type, 0x80)]
 
+    @staticmethod
+    def encode_boolean_value(value):
+        """
+        Encodes ``value`` as a Yes (0x80) or No (0x81), see [4], 7.2.6
+
+        :type value: bool
+        :rtype: list
+        """
+        return [value and 0x80 or 0x81]
+
+    @staticmethod
+    def encode_message_class_value(message_class):
+        """
+        Encodes the Message-Class value ``message_class``
+
+        From [4], section 7.2.12::
+
+            Message-class-value = Class-identifier | Token-text
+            Class-identifier = Personal | Advertisement | Informational | Auto
+
+        :param message_class: One of the class identifiers, or any token
+        :type message_class: str
+        :rtype: list
+        """
+        class_identifiers = {
+            'Personal': 0x80,
+            'Advertisement': 0x81,
+            'Informational': 0x82,
+            'Auto': 0x83,
+        }
+
+        if message_class in class_identifiers:
+            return [class_identifiers[message_class]]
+
+        return wsp_pdu.Encoder.encode_token_text(message_class)
+
+    @staticmethod
+    def encode_priority_value(priority):
+        """
+        Encodes the Priority value ``priority``: Low, Normal or High
+
+        :raise wsp_pdu.EncodeError: ``priority`` is not a known value
+        :rtype: list
+        """
+        priorities = {'Low': 0x80, 'Normal': 0x81, 'High': 0x82}
+        if priority not in priorities:
+            raise wsp_pdu.EncodeError('Unknown priority: %s' % priority)
+
+        return [priorities[priority]]
+
+    @staticmethod
+    def encode_expiry_value(expiry):
+        """
+        Encodes the Expiry value ``expiry``
+
+        From [4], section 7.2.10::
+
+            Expiry-value = Value-length (Absolute-token Date-value | Relative-token Delta-seconds-value)
+            Absolute-token = <Octet 128>
+            Relative-token = <Octet 129>
+
+        :param expiry: The expiry date, or the seconds until it expires
+        :type expiry: datetime.datetime or int
+        :rtype: list
+        """
+        if isinstance(expiry, datetime):
+            value = [0x80] + wsp_pdu.Encoder.encode_date_value(expiry)
+        else:
+            value = [0x81] + wsp_pdu.Encoder.encode_integer_value(expiry)
+
+        return wsp_pdu.Encoder.encode_value_length(len(value)) + value
+
     @staticmethod
     def encode_status_value(status_value):
         status_values = {
@@ -994,3 +1295,137 @@ class MMSEncoder(wsp_pdu.Encoder):
 
         # Return an unrecognised state if it couldn't be decoded
         return [status_values.get(status_value, 'Unrecognised')]
+
+    @staticmethod
+    def encode_response_status_value(response_status):
+        """
+        Encodes the Response-Status value ``response_status``, e.g. 'Ok'
+
+        See :func:`MMSDecoder.decode_response_status_value`.
+
+        :raise wsp_pdu.EncodeError: ``response_status`` is not a known value
+        :rtype: list
+        """
+        response_status_values = {
+            'Ok': 0x80,
+            'Error-unspecified': 0x81,
+            'Error-service-denied': 0x82,
+            'Error-message-format-corrupt': 0x83,
+            'Error-sending-address-unresolved': 0x84,
+            'Error-message-not-found': 0x85,
+            'Error-network-problem': 0x86,
+            'Error-content-not-accepted': 0x87,
+            'Error-unsupported-message': 0x88,
+        }
+        if response_status not in response_status_values:
+            raise wsp_pdu.EncodeError('Unknown response status: %s'
+                                      % response_status)
+
+        return [response_status_values[response_status]]
+
+
+class MMSTemplate(object):
+    """
+    I am a MMS message encoded once, to be sent to many recipients
+
+    The body of the message (the part table, the SMIL presentation and
+    every payload) is encoded when I am created and kept as a single
+    string. Only the header block is encoded for every recipient, so the
+    cost of :func:`encode` does not depend on the size of the
+    attachments. Later changes to the message are not seen by me.
+    """
+
+    def __init__(self, mms_message):
+        """
+        :param mms_message: The message to send
+        :type mms_message: :class:`~messaging.mms.message.MMSMessage`
+        """
+        self._encoder = MMSEncoder()
+        self._encoder._mms_message = mms_message
+        self.headers = mms_message.headers.copy()
+        self.body = ''.join(self._encoder.iter_message_body())
+
+    def encode_headers(self, headers=None):
+        """
+        Returns the header block of the message for one recipient
+
+        :param headers: The headers that differ for this recipient, e.g.
+                        To, Transaction-Id or Message-ID; they are added
+                        to the headers of the message. Give every
+                        recipient its own Transaction-Id, e.g. from
+                        :func:`~messaging.mms.ids.new_id`
+        :type headers: dict
+        :rtype: str
+        """
+        if headers:
+            headers = dict(self.headers, **headers)
+        else:
+            headers = self.headers
+
+        writer = wsp_pdu.ByteWriter()
+        self._encoder.write_message_header(writer, headers)
+        return writer.getvalue()
+
+    def encode(self, headers=None):
+        """
+        Returns the encoded message for one recipient
+
+        The body is not copied: the same string is returned every time,
+        after the header block, ready for a gathering write. Join them
+        to get what :func:`MMSEncoder.encode` returns.
+
+        :param headers: See :func:`encode_headers`
+        :type headers: dict
+        :return: The header block and the body
+        :rtype: list of str
+        """
+        return [self.encode_headers(headers), self.body]
+
+    def encoded_size(self, headers=None):
+        """
+        Returns the length of the encoded message for one recipient
+
+        :param headers: See :func:`encode_headers`
+        :type headers: dict
+        :rtype: int
+        """
+        if headers:
+            headers = dict(self.headers, **headers)
+        else:
+            headers = self.headers
+
+        return (self._encoder.encoded_header_size(headers) +
+                len(self.body))
+
+    def encode_to(self, fileobj, headers=None):
+        """
+        Writes the encoded message for one recipient to ``fileobj``
+
+        :param fileobj: A binary file-like object, or a socket
+        :param headers: See :func:`encode_headers`
+        :type headers: dict
+        :return: The number of bytes written
+        :rtype: int
+        """
+        write = getattr(fileobj, 'write', None)
+        if write is None:
+            write = fileobj.sendall
+
+        header = self.encode_headers(headers)
+        write(header)
+        write(self.body)
+        return len(header) + len(self.body)
+
+
+# MMS field name -> (encoded field name, value encoder), the encoder is
+# None if that value type can not be encoded yet
+mms_header_encoders = dict(
+    (name, (assigned_number | 0x80,
+            getattr(MMSEncoder, 'encode_%s' % value_type, None)))
+    for assigned_number, (name, value_type) in mms_field_names.items())
+
+# encoded MMS field name -> (MMS field name, value decoder)
+mms_header_decoders = dict(
+    (assigned_number | 0x80,
+     (name, getattr(MMSDecoder, 'decode_%s' % value_type)))
+    for assigned_number, (name, value_type) in mms_field_names.items())
@@ -0,0 +1,440 @@
+# See LICENSE
+"""WAP Push PDU encoding, decoding and dispatching, and MMS notifications"""
+
+from collections import namedtuple
+
+from messaging.mms import ids, wbxml, wsp_pdu
+from messaging.mms.iterator import ByteCursor
+from messaging.mms.mms_pdu import (MMSDecoder, MMSEncoder,
+                                   mms_header_decoders, mms_header_encoders)
+
+MMS_CONTENT_TYPE = 'application/vnd.wap.mms-message'
+MMS_APPLICATION_ID = 'x-wap-application:mms.ua'
+SI_CONTENT_TYPE = 'application/vnd.wap.sic'
+SL_CONTENT_TYPE = 'application/vnd.wap.slc'
+_MMS_CONTENT_TYPE_CODE = 0x3e | 0x80
+# X-Wap-Application-Id: x-wap-application:mms.ua
+_MMS_APPLICATION_HEADER = '\xaf\x84'
+
+# PDU types that carry pushed content ([5], table 34)
+PUSH_PDU_TYPES = (0x06, 0x07)
+PUSH = 0x06
+
+
+class PushPDU(object):
+    """
+    I am a WSP Push or ConfirmedPush PDU
+
+    ``transaction_id`` is None for PDUs received over a connection,
+    ``headers`` holds the WSP headers after the content type and
+    ``body`` the pushed content.
+    """
+    __slots__ = ('transaction_id', 'pdu_type', 'content_type',
+                 'content_type_parameters', 'headers', 'body')
+
+    def __init__(self, transaction_id, pdu_type, content_type,
+                 content_type_parameters, headers, body):
+        self.transaction_id = transaction_id
+        self.pdu_type = pdu_type
+        self.content_type = content_type
+        self.content_type_parameters = content_type_parameters
+        self.headers = headers
+        self.body = body
+
+    @property
+    def application_id(self):
+        """The X-Wap-Application-Id header, or None"""
+        return self.headers.get('X-Wap-Application-Id')
+
+    def is_mms_notification(self):
+        """Returns True if I carry an MMS PDU, e.g. a m-notification-ind"""
+        return self.content_type == MMS_CONTENT_TYPE
+
+
+class MMSNotification(namedtuple('MMSNotification',
+                                 'transaction_id mms_version sender subject '
+                                 'message_class message_size expiry '
+                                 'content_location')):
+    """
+    I am the part of a m-notification-ind needed to fetch the message
+
+    ``transaction_id`` is the X-Mms-Transaction-Id to acknowledge with
+    a m-notifyresp-ind, not the one of the WSP push. The headers that
+    were not sent are None.
+    """
+    __slots__ = ()
+
+
+def _encoded_field(name):
+    return chr(mms_header_encoders[name][0])
+
+
+class NotificationEncoder(object):
+    """
+    I encode m-notification-ind PDUs, and their WAP push envelope
+
+    The notifications of a batch only differ in their transaction id and
+    content location. Everything else is encoded once, when I am
+    created, and every notification is joined from the encoded pieces.
+    The headers are written in the order of [4], section 6.2.
+    """
+
+    _head = (_encoded_field('Message-Type') +
+             chr(MMSEncoder.encode_message_type_value('m-notification-ind')[0]) +
+             _encoded_field('Transaction-Id'))
+    _location = _encoded_field('Content-Location')
+
+    def __init__(self, message_size, expiry, sender=None, subject=None,
+                 message_class='Personal', mms_version='1.0',
+                 application_id=MMS_APPLICATION_ID):
+        """
+        :param message_size: The size of the message, in bytes
+        :type message_size: int
+        :param expiry: The expiry date, or the seconds until it expires
+        :type expiry: datetime.datetime or int
+        :param sender: The address of the sender, e.g.
+                       "+447785342749/TYPE=PLMN"
+        :param subject: The subject of the message
+        :param application_id: The X-Wap-Application-Id of the push
+
+        :raise EncodeError: A header could not be encoded
+        """
+        writer = wsp_pdu.ByteWriter()
+        write_header = MMSEncoder.write_header
+        write_header(writer, 'MMS-Version', mms_version)
+        if sender is not None:
+            write_header(writer, 'From', sender)
+        if subject is not None:
+            write_header(writer, 'Subject', subject)
+
+        write_header(writer, 'Message-Class', message_class)
+        write_header(writer, 'Message-Size', message_size)
+        write_header(writer, 'Expiry', expiry)
+        self._headers = writer.getvalue()
+
+        writer = wsp_pdu.ByteWriter()
+        wsp_pdu.Encoder.write_content_type_value(writer, MMS_CONTENT_TYPE, {})
+        wsp_pdu.Encoder.write_header(writer, 'X-Wap-Application-Id',
+                                     application_id)
+        self._envelope = (chr(PUSH) +
+                          ''.join(map(chr, wsp_pdu.Encoder.encode_uint_var(
+                                                             len(writer)))) +
+                          writer.getvalue())
+
+    def encode_notification_ind(self, transaction_id, content_location):
+        """
+        Returns the m-notification-ind PDU, without its push envelope
+
+        :param transaction_id: The X-Mms-Transaction-Id of the
+                               notification, a new one is generated with
+                               :func:`~messaging.mms.ids.new_id` if None
+        :type transaction_id: str
+        :param content_location: The URI the message is retrieved from
+        :type content_location: str
+        :rtype: str
+        """
+        if transaction_id is None:
+            transaction_id = ids.new_id()
+
+        return ''.join([self._head, wsp_pdu._text_bytes(transaction_id),
+                        '\0', self._headers, self._location,
+                        wsp_pdu._text_bytes(content_location), '\0'])
+
+    def encode_push(self, transaction_id, content_location, push_id=0):
+        """
+        Returns the m-notification-ind in a connectionless WSP Push PDU
+
+        The result is what :func:`decode_mms_notification` decodes.
+
+        :param push_id: The TID of the WSP push
+        :type push_id: int
+        :rtype: str
+        """
+        return ''.join([chr(push_id & 0xff), self._envelope,
+                        self.encode_notification_ind(transaction_id,
+                                                     content_location)])
+
+
+def encode_notification_ind(transaction_id, content_location, message_size,
+                            expiry, sender=None, subject=None,
+                            message_class='Personal', mms_version='1.0'):
+    """
+    Encodes a single m-notification-ind, see :class:`NotificationEncoder`
+
+    :rtype: str
+    """
+    encoder = NotificationEncoder(message_size, expiry, sender, subject,
+                                  message_class, mms_version)
+    return encoder.encode_notification_ind(transaction_id, content_location)
+
+
+def decode_push(data, connectionless=True):
+    """
+    Decodes the WSP Push PDU ``data``
+
+    From [5], section 8.2.4.1::
+
+        Push = [TID] PDU-type HeadersLen ContentType Headers Data
+
+    :param data: The PDU, e.g. the reassembled text of a WAP push SMS
+    :type data: str or array.array('B')
+    :param connectionless: Whether ``data`` starts with a transaction id,
+                           as it does when it is pushed over SMS
+    :type connectionless: bool
+
+    :raise DecodeError: ``data`` is not a Push or ConfirmedPush PDU
+    :rtype: :class:`PushPDU`
+    """
+    cursor = ByteCursor(data)
+    try:
+        tid = cursor.next() if connectionless else None
+        pdu_type = cursor.next()
+        if pdu_type not in PUSH_PDU_TYPES:
+            raise wsp_pdu.DecodeError('Not a push PDU: 0x%02x' % pdu_type)
+
+        headers_len = cursor.read_uint_var()
+        headers_iter = cursor.sub_cursor(headers_len)
+    except StopIteration:
+        raise wsp_pdu.DecodeError('Truncated push PDU')
+
+    try:
+        ctype, params = wsp_pdu.Decoder.decode_content_type_value(
+                                                            headers_iter)
+    except StopIteration:
+        raise wsp_pdu.DecodeError('Truncated push PDU content type')
+
+    headers = wsp_pdu.Decoder.decode_headers(headers_iter)
+    body = cursor.data[cursor.pos:cursor.end]
+    return PushPDU(tid, pdu_type, ctype, params, headers, body)
+
+
+def encode_push(body, content_type, headers=None, transaction_id=0,
+                content_type_parameters=None):
+    """
+    Encodes a connectionless WSP Push PDU, see :func:`decode_push`
+
+    :param body: The pushed content, e.g. :func:`~messaging.mms.wbxml.encode_si`
+    :type body: str
+    :param content_type: The media type of ``body``
+    :type content_type: str
+    :param headers: The WSP headers, e.g. {'X-Wap-Application-Id':
+                    'x-wap-application:wml.ua'}
+    :type headers: dict
+    :param transaction_id: The TID of the push
+    :type transaction_id: int
+
+    :raise EncodeError: A header could not be encoded
+    :rtype: str
+    """
+    writer = wsp_pdu.ByteWriter()
+    wsp_pdu.Encoder.write_content_type_value(writer, content_type,
+                                             content_type_parameters or {})
+    if headers:
+        for name in sorted(headers):
+            wsp_pdu.Encoder.write_header(writer, name, headers[name])
+
+    writer.insert(0, wsp_pdu.Encoder.encode_uint_var(len(writer)))
+    writer.insert(0, [transaction_id & 0xff, PUSH])
+    writer.write(body)
+    return writer.getvalue()
+
+
+class PushDispatcher(object):
+    """
+    I hand every WAP push to the handler registered for it
+
+    Handlers are registered for a content type, an application id, or
+    both, and are called with the decoded :class:`PushPDU`. The most
+    specific registration wins: application id and content type, then
+    application id alone, then content type alone, then ``default``.
+    """
+
+    def __init__(self, default=None):
+        """
+        :param default: The handler for pushes nothing is registered for,
+                        by default the :class:`PushPDU` itself is returned
+        :type default: callable
+        """
+        self.default = default
+        self._handlers = {}
+
+    def register(self, handler, content_type=None, application_id=None):
+        """
+        Registers ``handler`` for ``content_type`` and/or ``application_id``
+
+        A previous handler for the same pair is replaced.
+
+        :param handler: Called with the :class:`PushPDU`, what it returns
+                        is returned by :func:`dispatch`
+        :type handler: callable
+        """
+        if content_type is None and application_id is None:
+            raise ValueError("content_type or application_id is required")
+
+        self._handlers[(application_id, content_type)] = handler
+
+    def unregister(self, content_type=None, application_id=None):
+        """Removes the handler registered with the same arguments"""
+        self._handlers.pop((application_id, content_type), None)
+
+    def get_handler(self, push):
+        """
+        Returns the handler for ``push``
+
+        :type push: :class:`PushPDU`
+        """
+        handlers = self._handlers
+        app_id, ctype = push.application_id, push.content_type
+        for key in ((app_id, ctype), (app_id, None), (None, ctype)):
+            if key in handlers:
+                return handlers[key]
+
+        return self.default
+
+    def dispatch(self, data, connectionless=True):
+        """
+        Decodes the WAP push ``data`` and hands it to its handler
+
+        See :func:`decode_push` for the arguments.
+
+        :raise DecodeError: ``data`` is not a Push PDU
+        :return: What the handler returns
+        """
+        push = decode_push(data, connectionless)
+        handler = self.get_handler(push)
+        if handler is None:
+            return push
+
+        return handler(push)
+
+
+def _decode_mms(push):
+    return MMSDecoder().decode_data(push.body)
+
+
+def _decode_wbxml(push):
+    return wbxml.parse(push.body)
+
+
+dispatcher = PushDispatcher()
+dispatcher.register(_decode_mms, content_type=MMS_CONTENT_TYPE)
+dispatcher.register(_decode_wbxml, content_type=SI_CONTENT_TYPE)
+dispatcher.register(_decode_wbxml, content_type=SL_CONTENT_TYPE)
+
+
+def _is_mms_content_type(cursor):
+    # the content type is usually the well-known code or the plain
+    # media type, only decode it when it has parameters. ``cursor`` is
+    # left after it when it is the MMS content type
+    byte = cursor.peek()
+    if byte == _MMS_CONTENT_TYPE_CODE:
+        cursor.advance()
+        return True
+
+    if 0x20 <= byte < 0x80:
+        if cursor.data.startswith(MMS_CONTENT_TYPE + '\0', cursor.pos):
+            cursor.advance(len(MMS_CONTENT_TYPE) + 1)
+            return True
+
+        return False
+
+    ctype = wsp_pdu.Decoder.decode_content_type_value(cursor)[0]
+    return ctype == MMS_CONTENT_TYPE
+
+
+def _is_mms_application(cursor):
+    # the push headers that follow the content type, usually just
+    # X-Wap-Application-Id with the well-known code of the MMS UA
+    if cursor.pos >= cursor.end:
+        return True
+
+    if cursor.data.startswith(_MMS_APPLICATION_HEADER, cursor.pos,
+                              cursor.end):
+        return True
+
+    application_id = wsp_pdu.Decoder.decode_headers(cursor).get(
+                                                    'X-Wap-Application-Id')
+    return application_id in (None, MMS_APPLICATION_ID)
+
+
+def _decode_notification_ind(cursor):
+    if not cursor.data.startswith('\x8c\x82', cursor.pos, cursor.end):
+        # not a X-Mms-Message-Type: m-notification-ind
+        return None
+
+    cursor.advance(2)
+    decoders = mms_header_decoders
+    next_byte = cursor.next
+    headers = {}
+    try:
+        while True:
+            entry = decoders.get(next_byte())
+            if entry is None:
+                cursor.pos -= 1
+                name, value = wsp_pdu.Decoder.decode_header(cursor)
+            else:
+                name, decode = entry
+                value = decode(cursor)
+
+            headers[name] = value
+    except StopIteration:
+        pass
+
+    get = headers.get
+    return MMSNotification(get('Transaction-Id'), get('MMS-Version'),
+                           get('From'), get('Subject'), get('Message-Class'),
+                           get('Message-Size'), get('Expiry'),
+                           get('Content-Location'))
+
+
+def decode_notification_ind(data):
+    """
+    Decodes the m-notification-ind ``data``, without its push envelope
+
+    Only the headers are decoded, and no
+    :class:`~messaging.mms.message.MMSMessage` is built.
+
+    :param data: The MMS PDU
+    :type data: str or array.array('B')
+
+    :raise DecodeError: A header value could not be decoded
+    :return: The notification, or None if ``data`` is another MMS PDU
+    :rtype: :class:`MMSNotification`
+    """
+    return _decode_notification_ind(ByteCursor(data))
+
+
+def decode_mms_notification(data):
+    """
+    Decodes the WAP push ``data`` if it is a m-notification-ind
+
+    This is the fast path for MMS notifications. The Push PDU fields
+    are read as in :func:`decode_push`, but only the content type and
+    the X-Wap-Application-Id are looked at. Only if they are
+    "application/vnd.wap.mms-message" and the MMS user agent (or no
+    application id) the MMS headers are decoded, like
+    :func:`decode_notification_ind` does.
+
+    :param data: The PDU, e.g. the reassembled text of a WAP push SMS
+    :type data: str or array.array('B')
+
+    :raise DecodeError: ``data`` is not a Push PDU
+    :return: The notification, or None if ``data`` pushes something else
+    :rtype: :class:`MMSNotification`
+    """
+    cursor = ByteCursor(data)
+    try:
+        cursor.advance()
+        pdu_type = cursor.next()
+        if pdu_type not in PUSH_PDU_TYPES:
+            raise wsp_pdu.DecodeError('Not a push PDU: 0x%02x' % pdu_type)
+
+        headers_len = cursor.read_uint_var()
+        headers_iter = cursor.sub_cursor(headers_len)
+        if not (_is_mms_content_type(headers_iter) and
+                _is_mms_application(headers_iter)):
+            return None
+    except StopIteration:
+        raise wsp_pdu.DecodeError('Truncated push PDU')
+
+    return _decode_notification_ind(cursor)
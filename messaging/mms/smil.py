@@ -0,0 +1,319 @@
+# See LICENSE
+"""Compact SMIL presentations for MMS messages"""
+
+import re
+from threading import Lock
+from xml.parsers import expat
+
+from messaging.utils import LRUCache
+
+# (id, left, top, width, height)
+DEFAULT_REGIONS = (
+    ('Image', 0, 0, 176, 144),
+    ('Text', 0, 144, 176, 76),
+)
+
+# tags of the media objects in a <par>, and the slot of the page they go in
+MEDIA_TAGS = {
+    'img': 'image',
+    'video': 'image',
+    'text': 'text',
+    'audio': 'audio',
+    'ref': None,
+}
+
+CLOCK_VALUE = re.compile(
+    r'^\s*(?:(?:(\d+):)?(\d+):(\d+(?:\.\d+)?)'
+    r'|(\d+(?:\.\d+)?)(h|min|s|ms)?)\s*$')
+
+_clock_units = {'h': 3600000, 'min': 60000, 's': 1000, 'ms': 1, None: 1000}
+
+_escapes = {
+    '&': '&amp;',
+    '<': '&lt;',
+    '>': '&gt;',
+    '"': '&quot;',
+    '\t': '&#9;',
+    '\n': '&#10;',
+    '\r': '&#13;',
+}
+
+_HEAD = '<smil><head>%s<layout>%s%s</layout></head><body>'
+_META = '<meta name="%s" content="%s"/>'
+_ROOT_LAYOUT = '<root-layout width="%s" height="%s"/>'
+_REGION = '<region id="%s" left="%s" top="%s" width="%s" height="%s"/>'
+_TAIL = '</body></smil>'
+_PAR = '<par dur="%dms">'
+_MEDIA = '<%s src="%s"%s/>'
+
+
+def escape_attr(value):
+    """
+    Returns ``value`` ready to be written between double quotes
+
+    Besides the markup characters, tabs and line breaks are escaped so
+    they survive the attribute value normalization of XML parsers.
+    Unicode values are encoded to UTF-8.
+
+    :rtype: str
+    """
+    if isinstance(value, unicode):
+        value = value.encode('utf-8')
+    else:
+        value = str(value)
+
+    for c in '&<>"\t\n\r':
+        if c in value:
+            value = ''.join([_escapes.get(ch, ch) for ch in value])
+            break
+
+    return value
+
+
+def get_src(part):
+    """
+    Returns the URI that refers to ``part`` from the SMIL presentation
+
+    Content-Location is preferred, Content-ID is turned into a ``cid:``
+    URI. Parts with neither are referred to by their data.
+    """
+    headers = part.headers
+    if 'Content-Location' in headers:
+        return headers['Content-Location']
+    elif 'Content-ID' in headers:
+        return 'cid:' + headers['Content-ID'].strip('<>')
+
+    return part.data
+
+
+def parse_clock_value(value):
+    """
+    Returns the milliseconds of the SMIL clock value ``value``
+
+    Full ("0:01:30.5") and partial ("01:30") clock values and timecounts
+    with or without a metric ("1.5s", "350ms", "2min", "3") are
+    understood. None is returned for anything else, e.g. "indefinite".
+
+    :rtype: int
+    """
+    match = CLOCK_VALUE.match(value)
+    if match is None:
+        return None
+
+    hours, minutes, seconds, count, unit = match.groups()
+    if count is not None:
+        return int(round(float(count) * _clock_units[unit]))
+
+    ms = float(seconds) * 1000 + int(minutes) * 60000
+    if hours is not None:
+        ms += int(hours) * 3600000
+
+    return int(round(ms))
+
+
+class Slide(object):
+    """
+    I am a ``<par>`` element of a parsed SMIL presentation
+
+    :attr:`media` holds a (tag, src, region, begin, end) tuple for every
+    media object, in document order. Times are in milliseconds and are
+    None when they are not set.
+    """
+    __slots__ = ('duration', 'media')
+
+    def __init__(self, duration=None):
+        self.duration = duration
+        self.media = []
+
+
+class SmilParser(object):
+    """
+    I parse a SMIL presentation as it is fed, without building a DOM
+
+    Only the ``<par>`` elements and the media objects in them are
+    kept; ``<par>`` elements inside a ``<seq>`` are listed in document
+    order and nested ``<par>`` elements are merged into the outer one.
+    """
+
+    def __init__(self):
+        self.slides = []
+        self._depth = 0
+        self._parser = expat.ParserCreate()
+        self._parser.returns_unicode = False
+        self._parser.StartElementHandler = self._start_element
+        self._parser.EndElementHandler = self._end_element
+
+    def _start_element(self, name, attrs):
+        if name == 'par':
+            self._depth += 1
+            if self._depth == 1:
+                dur = attrs.get('dur')
+                if dur is not None:
+                    dur = parse_clock_value(dur)
+                self.slides.append(Slide(dur))
+
+        elif self._depth and name in MEDIA_TAGS and 'src' in attrs:
+            begin, end = attrs.get('begin'), attrs.get('end')
+            if begin is not None:
+                begin = parse_clock_value(begin)
+            if end is not None:
+                end = parse_clock_value(end)
+
+            self.slides[-1].media.append(
+                (name, attrs['src'], attrs.get('region'), begin, end))
+
+    def _end_element(self, name):
+        if name == 'par' and self._depth:
+            self._depth -= 1
+
+    def feed(self, data):
+        """
+        Parses the next chunk of the presentation
+
+        :raise xml.parsers.expat.ExpatError: The presentation is not
+                                             well-formed
+        """
+        self._parser.Parse(data, False)
+
+    def close(self):
+        """
+        Finishes the parsing and returns the slides
+
+        :rtype: list of :class:`Slide`
+        """
+        self._parser.Parse('', True)
+        return self.slides
+
+
+def parse_smil(chunks):
+    """
+    Returns the slides of the SMIL presentation in ``chunks``
+
+    Parsing stops at the first error and the slides read until then
+    are returned, as the SMIL written by phones is not always
+    well-formed.
+
+    :param chunks: The presentation, e.g. ``DataPart.iter_chunks()``
+    :type chunks: iter
+    :rtype: list of :class:`Slide`
+    """
+    parser = SmilParser()
+    try:
+        for chunk in chunks:
+            parser.feed(chunk)
+
+        return parser.close()
+    except expat.ExpatError:
+        return parser.slides
+
+
+class SmilWriter(object):
+    """
+    I write the SMIL presentation of a list of MMS pages
+
+    The output has no whitespace between elements and is the same for
+    the same pages, so it can be cached along with the encoded part.
+    The ``<head>`` section only depends on the screen size, the regions
+    and the meta tags, it is formatted once and kept in a bounded
+    cache. I am safe to share between threads.
+    """
+
+    def __init__(self, maxsize=64):
+        self._heads = LRUCache(maxsize)
+        self._lock = Lock()
+
+    def head(self, width, height, regions=DEFAULT_REGIONS, meta=None):
+        """
+        Returns everything that precedes the first ``<par>`` element
+
+        :param width: The width of the root layout
+        :param height: The height of the root layout
+        :param regions: (id, left, top, width, height) tuples; images go
+                        to the "Image" region and text to the "Text" one
+        :type regions: tuple
+        :param meta: The name and content of ``<meta>`` tags
+        :type meta: dict
+        :rtype: str
+        """
+        meta = tuple(sorted(meta.items())) if meta else ()
+        key = (width, height, tuple(regions), meta)
+
+        self._lock.acquire()
+        try:
+            ret = self._heads.get(key)
+        finally:
+            self._lock.release()
+
+        if ret is None:
+            ret = _HEAD % (
+                ''.join([_META % (escape_attr(name), escape_attr(content))
+                         for name, content in meta]),
+                _ROOT_LAYOUT % (escape_attr(width), escape_attr(height)),
+                ''.join([_REGION % tuple(map(escape_attr, region))
+                         for region in regions]))
+
+            self._lock.acquire()
+            try:
+                self._heads.set(key, ret)
+            finally:
+                self._lock.release()
+
+        return ret
+
+    def write(self, pages, width=176, height=220, regions=DEFAULT_REGIONS,
+              meta=None):
+        """
+        Returns the SMIL presentation of ``pages``
+
+        Every page becomes a ``<par>`` element with its duration, and
+        its image, text and audio, in that order. The begin and end
+        times are only written when they are set, the end time is
+        capped to the duration of the page. Times are in milliseconds.
+
+        :param pages: The pages of the message
+        :type pages: list of :class:`~messaging.mms.message.MMSMessagePage`
+        :rtype: str
+
+        See :func:`head` for the rest of the parameters.
+        """
+        out = [self.head(width, height, regions, meta)]
+        append = out.append
+
+        for page in pages:
+            duration = page.duration
+            append(_PAR % duration)
+
+            for tag, region, item in (('img', 'Image', page.image),
+                                      ('text', 'Text', page.text),
+                                      ('audio', None, page.audio)):
+                if item is None:
+                    continue
+
+                part, begin, end = item
+                attrs = ''
+                if region is not None:
+                    attrs = ' region="%s"' % region
+                if begin > 0:
+                    attrs += ' begin="%dms"' % begin
+                if end > 0:
+                    attrs += ' end="%dms"' % min(end, duration)
+
+                append(_MEDIA % (tag, escape_attr(get_src(part)), attrs))
+
+            append('</par>')
+
+        append(_TAIL)
+        return ''.join(out)
+
+    def clear(self):
+        """Empties the cache of ``<head>`` sections"""
+        self._lock.acquire()
+        try:
+            self._heads.clear()
+        finally:
+            self._lock.release()
+
+
+_writer = SmilWriter()
+
+generate_smil = _writer.write
@@ -0,0 +1,586 @@
+# See LICENSE
+"""WBXML encoding and decoding of Service Indication and Service Loading"""
+
+import codecs
+import re
+
+try:
+    from xml.etree import cElementTree as ElementTree
+except ImportError:
+    from xml.etree import ElementTree
+
+from messaging.mms.iterator import ByteCursor
+from messaging.mms.wsp_pdu import (ByteWriter, DecodeError, EncodeError,
+                                   well_known_charsets)
+
+# Global tokens (WAP-192, section 7.1)
+SWITCH_PAGE = 0x00
+END = 0x01
+ENTITY = 0x02
+STR_I = 0x03
+LITERAL = 0x04
+EXT_I_0, EXT_I_1, EXT_I_2 = 0x40, 0x41, 0x42
+PI = 0x43
+LITERAL_C = 0x44
+EXT_T_0, EXT_T_1, EXT_T_2 = 0x80, 0x81, 0x82
+STR_T = 0x83
+LITERAL_A = 0x84
+EXT_0, EXT_1, EXT_2 = 0xC0, 0xC1, 0xC2
+OPAQUE = 0xC3
+LITERAL_AC = 0xC4
+
+# bits of a tag token
+TAG_ATTRIBUTES = 0x80
+TAG_CONTENT = 0x40
+
+WBXML_VERSION = 0x03  # 1.3
+UTF_8 = 0x6A
+
+_unsupported = frozenset([EXT_I_0, EXT_I_1, EXT_I_2, PI, EXT_T_0, EXT_T_1,
+                          EXT_T_2, EXT_0, EXT_1, EXT_2])
+
+
+class Language(object):
+    """
+    I am the tokens of a WBXML document type
+
+    Only code page 0 is used by the document types defined here.
+
+    :param public_id: The well-known public identifier
+    :type public_id: int
+    :param fpi: The formal public identifier of the DTD
+    :type fpi: str
+    :param tags: {token: tag name}
+    :type tags: dict
+    :param attr_starts: {token: (attribute name, value prefix)}
+    :type attr_starts: dict
+    :param attr_values: {token: attribute value string}
+    :type attr_values: dict
+    :param date_attrs: names of the attributes whose values are dates
+                       encoded as opaque data, e.g. "2010-05-01T12:00:00Z"
+    :type date_attrs: tuple
+    """
+
+    def __init__(self, public_id, fpi, tags, attr_starts, attr_values,
+                 date_attrs=()):
+        self.public_id = public_id
+        self.fpi = fpi
+        self.tags = tags
+        self.attr_starts = attr_starts
+        self.attr_values = attr_values
+        self.date_attrs = frozenset(date_attrs)
+
+        self.tag_tokens = dict((name, token) for token, name in tags.items())
+        # attribute name -> [(prefix, token)], longest prefix first
+        self.attr_prefixes = {}
+        for token, (name, prefix) in sorted(attr_starts.items()):
+            self.attr_prefixes.setdefault(name, []).append((prefix, token))
+
+        for prefixes in self.attr_prefixes.values():
+            prefixes.sort(key=lambda item: -len(item[0]))
+
+        self.value_tokens = dict((value, token)
+                                 for token, value in attr_values.items())
+        values = sorted(attr_values.values(), key=len, reverse=True)
+        self.value_pattern = re.compile('|'.join(map(re.escape, values)))
+
+
+_url_values = {
+    0x85: '.com/',
+    0x86: '.edu/',
+    0x87: '.net/',
+    0x88: '.org/',
+}
+
+# Service Indication (WAP-167, section 8)
+SI = Language(0x05, '-//WAPFORUM//DTD SI 1.0//EN', {
+    0x05: 'si',
+    0x06: 'indication',
+    0x07: 'info',
+    0x08: 'item',
+}, {
+    0x05: ('action', 'signal-none'),
+    0x06: ('action', 'signal-low'),
+    0x07: ('action', 'signal-medium'),
+    0x08: ('action', 'signal-high'),
+    0x09: ('action', 'delete'),
+    0x0A: ('created', ''),
+    0x0B: ('href', ''),
+    0x0C: ('href', 'http://'),
+    0x0D: ('href', 'http://www.'),
+    0x0E: ('href', 'https://'),
+    0x0F: ('href', 'https://www.'),
+    0x10: ('si-expires', ''),
+    0x11: ('si-id', ''),
+    0x12: ('class', ''),
+}, _url_values, date_attrs=('created', 'si-expires'))
+
+# Service Loading (WAP-168, section 9)
+SL = Language(0x06, '-//WAPFORUM//DTD SL 1.0//EN', {
+    0x05: 'sl',
+}, {
+    0x05: ('action', 'execute-low'),
+    0x06: ('action', 'execute-high'),
+    0x07: ('action', 'cache'),
+    0x08: ('href', ''),
+    0x09: ('href', 'http://'),
+    0x0A: ('href', 'http://www.'),
+    0x0B: ('href', 'https://'),
+    0x0C: ('href', 'https://www.'),
+}, _url_values)
+
+# public identifier -> Language
+languages = {}
+# formal public identifier -> Language
+_fpi_languages = {}
+
+
+def register_language(language):
+    """
+    Makes :func:`parse` recognise the documents of ``language``
+
+    :type language: :class:`Language`
+    """
+    languages[language.public_id] = language
+    _fpi_languages[language.fpi] = language
+
+register_language(SI)
+register_language(SL)
+
+
+def decode_date(data):
+    """
+    Returns the opaque date ``data`` as "YYYY-MM-DDThh:mm:ssZ"
+
+    Dates are encoded as their 14 digits, two per octet, with the
+    trailing zero octets left out (WAP-167, section 8.2.2).
+    """
+    digits = data.encode('hex').ljust(14, '0')
+    return '%s-%s-%sT%s:%s:%sZ' % (digits[:4], digits[4:6], digits[6:8],
+                                   digits[8:10], digits[10:12], digits[12:14])
+
+
+def encode_date(date):
+    """
+    Returns the opaque encoding of ``date``, see :func:`decode_date`
+
+    :param date: The date, e.g. "2010-05-01T12:00:00Z"
+    :type date: str
+
+    :raise EncodeError: ``date`` does not have 14 digits
+    :rtype: str
+    """
+    digits = re.sub(r'\D', '', date)
+    if len(digits) != 14:
+        raise EncodeError('Invalid date: %s' % date)
+
+    return digits.decode('hex').rstrip('\0')
+
+
+class Parser(object):
+    """
+    I decode a WBXML document as a stream of events
+
+    The document header is read when I am created. Iterating over me
+    yields, in document order:
+
+     - ("start", (tag, attributes)) for every element
+     - ("text", text) for every string in the content of an element
+     - ("end", tag) when an element is closed
+
+    Strings are returned as unicode, opaque data too: it is decoded with
+    the charset of the document, like inline strings.
+    """
+
+    def __init__(self, data, language=None):
+        """
+        :param data: The WBXML document
+        :type data: str or array.array('B')
+        :param language: The document type; by default it is looked up
+                         by the public identifier of the document
+        :type language: :class:`Language`
+
+        :raise DecodeError: The header is truncated, or the document type
+                            is not known
+        """
+        self._cursor = cursor = ByteCursor(data)
+        try:
+            self.version = cursor.next()
+            self.public_id = cursor.read_uint_var()
+            fpi_index = None
+            if self.public_id == 0:
+                fpi_index = cursor.read_uint_var()
+
+            self.charset = UTF_8
+            if self.version:
+                self.charset = cursor.read_uint_var()
+
+            self.string_table = cursor.read(cursor.read_uint_var())
+        except StopIteration:
+            raise DecodeError('Truncated WBXML header')
+
+        self._codec = 'utf-8'
+        name = well_known_charsets.get(self.charset)
+        if name is not None:
+            try:
+                self._codec = codecs.lookup(name).name
+            except LookupError:
+                pass
+
+        if language is None:
+            if fpi_index is not None:
+                language = _fpi_languages.get(self._table_string(fpi_index))
+            else:
+                language = languages.get(self.public_id)
+
+            if language is None:
+                raise DecodeError('Unknown WBXML document type: %d'
+                                  % self.public_id)
+
+        self.language = language
+
+    def _table_string(self, offset):
+        table = self.string_table
+        end = table.find('\0', offset)
+        if offset >= len(table) or end == -1:
+            raise DecodeError('Invalid string table reference: %d' % offset)
+
+        return table[offset:end].decode(self._codec, 'replace')
+
+    def _read_string(self, byte):
+        cursor = self._cursor
+        if byte == STR_I:
+            return cursor.read_cstring().decode(self._codec, 'replace')
+        elif byte == STR_T:
+            return self._table_string(cursor.read_uint_var())
+        elif byte == ENTITY:
+            return unichr(cursor.read_uint_var())
+        elif byte == OPAQUE:
+            return self._read_opaque().decode(self._codec, 'replace')
+
+        return None
+
+    def _read_opaque(self):
+        cursor = self._cursor
+        return cursor.read(cursor.read_uint_var())
+
+    def _read_attributes(self):
+        cursor = self._cursor
+        language = self.language
+        attrs = {}
+        name, value = None, []
+        while True:
+            byte = cursor.next()
+            if byte == END or byte == LITERAL or byte < 0x80 and byte not in (
+                                        SWITCH_PAGE, STR_I, ENTITY):
+                if name is not None:
+                    attrs[name] = u''.join(value)
+
+                if byte == END:
+                    return attrs
+                elif byte == LITERAL:
+                    name, value = self._table_string(cursor.read_uint_var()), []
+                elif byte in language.attr_starts:
+                    name, prefix = language.attr_starts[byte]
+                    value = [unicode(prefix)]
+                else:
+                    raise DecodeError('Unknown attribute: 0x%02x' % byte)
+
+            elif byte == SWITCH_PAGE:
+                if cursor.next() != 0:
+                    raise DecodeError('Only code page 0 is supported')
+
+            elif byte == OPAQUE and name in language.date_attrs:
+                value.append(unicode(decode_date(self._read_opaque())))
+
+            elif byte in language.attr_values:
+                value.append(unicode(language.attr_values[byte]))
+
+            else:
+                string = self._read_string(byte)
+                if string is None or name is None:
+                    raise DecodeError('Unexpected token in attributes: '
+                                      '0x%02x' % byte)
+                value.append(string)
+
+    def __iter__(self):
+        cursor = self._cursor
+        tags = self.language.tags
+        stack = []
+        try:
+            while True:
+                byte = cursor.next()
+                if byte == END:
+                    if not stack:
+                        raise DecodeError('END token outside of an element')
+
+                    yield 'end', stack.pop()
+                    if not stack:
+                        return
+
+                elif byte == SWITCH_PAGE:
+                    if cursor.next() != 0:
+                        raise DecodeError('Only code page 0 is supported')
+
+                elif byte in (STR_I, STR_T, ENTITY, OPAQUE):
+                    if not stack:
+                        raise DecodeError('Text outside of an element')
+
+                    yield 'text', self._read_string(byte)
+
+                elif byte in _unsupported:
+                    raise DecodeError('Unsupported WBXML token: 0x%02x' % byte)
+
+                else:
+                    token = byte & 0x3f
+                    if token == LITERAL:
+                        tag = self._table_string(cursor.read_uint_var())
+                    elif token in tags:
+                        tag = tags[token]
+                    else:
+                        raise DecodeError('Unknown tag: 0x%02x' % byte)
+
+                    attrs = {}
+                    if byte & TAG_ATTRIBUTES:
+                        attrs = self._read_attributes()
+
+                    yield 'start', (tag, attrs)
+                    if byte & TAG_CONTENT:
+                        stack.append(tag)
+                    else:
+                        yield 'end', tag
+                        if not stack:
+                            return
+        except StopIteration:
+            raise DecodeError('Truncated WBXML document')
+
+
+def parse(data, language=None):
+    """
+    Decodes the WBXML document ``data`` into an element tree
+
+    :param data: The WBXML document, e.g. the body of a SI push
+    :type data: str or array.array('B')
+    :param language: The document type, see :class:`Parser`
+    :type language: :class:`Language`
+
+    :raise DecodeError: ``data`` is not a valid document
+    :return: The root element
+    :rtype: xml.etree.ElementTree.Element
+    """
+    root = None
+    stack = []
+    for event, value in Parser(data, language):
+        if event == 'start':
+            tag, attrs = value
+            if stack:
+                elem = ElementTree.SubElement(stack[-1], tag, attrs)
+            else:
+                elem = root = ElementTree.Element(tag, attrs)
+
+            stack.append(elem)
+        elif event == 'end':
+            stack.pop()
+        else:
+            parent = stack[-1]
+            if len(parent):
+                child = parent[-1]
+                child.tail = (child.tail or u'') + value
+            else:
+                parent.text = (parent.text or u'') + value
+
+    return root
+
+
+def _to_bytes(value):
+    if isinstance(value, unicode):
+        return value.encode('utf-8')
+
+    return value
+
+
+class Serializer(object):
+    """
+    I encode element trees as WBXML documents of a :class:`Language`
+
+    Documents are written as WBXML 1.3 in UTF-8, without a string table.
+    Attribute values are split into the longest attribute start prefix
+    and the attribute value tokens of the language.
+    """
+
+    def __init__(self, language):
+        self.language = language
+
+    def write_string(self, writer, string):
+        writer.write_byte(STR_I)
+        writer.write(_to_bytes(string))
+        writer.write_byte(0x00)
+
+    def write_attribute(self, writer, name, value):
+        """
+        Writes the attribute ``name`` with ``value`` to ``writer``
+
+        :raise EncodeError: The language has no token for ``name``, or
+                            for the start of ``value``
+        """
+        language = self.language
+        for prefix, token in language.attr_prefixes.get(name, ()):
+            if value.startswith(prefix):
+                break
+        else:
+            raise EncodeError('Can not encode attribute %s="%s"'
+                              % (name, value))
+
+        writer.write_byte(token)
+        value = value[len(prefix):]
+        if not value:
+            return
+
+        if name in language.date_attrs:
+            date = encode_date(value)
+            writer.write_byte(OPAQUE)
+            writer.write_uint_var(len(date))
+            writer.write(date)
+            return
+
+        start = 0
+        for match in language.value_pattern.finditer(value):
+            if match.start() > start:
+                self.write_string(writer, value[start:match.start()])
+
+            writer.write_byte(language.value_tokens[match.group()])
+            start = match.end()
+
+        if start < len(value):
+            self.write_string(writer, value[start:])
+
+    def write_element(self, writer, elem):
+        """
+        Writes ``elem`` and its children to ``writer``
+
+        :raise EncodeError: The language has no token for a tag
+        """
+        token = self.language.tag_tokens.get(elem.tag)
+        if token is None:
+            raise EncodeError('Can not encode element <%s>' % elem.tag)
+
+        attrs = elem.attrib
+        content = elem.text or len(elem)
+        if attrs:
+            token |= TAG_ATTRIBUTES
+        if content:
+            token |= TAG_CONTENT
+
+        writer.write_byte(token)
+        if attrs:
+            for name in sorted(attrs):
+                self.write_attribute(writer, name, attrs[name])
+            writer.write_byte(END)
+
+        if content:
+            if elem.text:
+                self.write_string(writer, elem.text)
+
+            for child in elem:
+                self.write_element(writer, child)
+                if child.tail:
+                    self.write_string(writer, child.tail)
+
+            writer.write_byte(END)
+
+    def serialize(self, elem):
+        """
+        Returns the WBXML document with root element ``elem``
+
+        :type elem: xml.etree.ElementTree.Element
+        :rtype: str
+        """
+        writer = ByteWriter()
+        writer.write_byte(WBXML_VERSION)
+        writer.write_uint_var(self.language.public_id)
+        writer.write_uint_var(UTF_8)
+        # no string table
+        writer.write_byte(0x00)
+        self.write_element(writer, elem)
+        return writer.getvalue()
+
+
+def serialize(elem, language):
+    """
+    Returns ``elem`` encoded as a WBXML document of ``language``
+
+    See :class:`Serializer`.
+
+    :rtype: str
+    """
+    return Serializer(language).serialize(elem)
+
+
+def build_si(href=None, text=None, si_id=None, created=None, expires=None,
+             action=None):
+    """
+    Returns the element tree of a Service Indication
+
+    :param href: The URI of the service
+    :param text: The message shown to the user
+    :param si_id: Identifies the indication, to replace or delete it
+    :param created: When the content was created, "YYYY-MM-DDThh:mm:ssZ"
+    :param expires: When the indication expires, "YYYY-MM-DDThh:mm:ssZ"
+    :param action: One of "signal-none", "signal-low", "signal-medium",
+                   "signal-high" and "delete"
+    :rtype: xml.etree.ElementTree.Element
+    """
+    attrs = {}
+    for name, value in (('href', href), ('si-id', si_id),
+                        ('created', created), ('si-expires', expires),
+                        ('action', action)):
+        if value is not None:
+            attrs[name] = value
+
+    si = ElementTree.Element('si')
+    indication = ElementTree.SubElement(si, 'indication', attrs)
+    indication.text = text
+    return si
+
+
+def build_sl(href, action=None):
+    """
+    Returns the element tree of a Service Loading
+
+    :param href: The URI of the service to load
+    :param action: One of "execute-low", "execute-high" and "cache"
+    :rtype: xml.etree.ElementTree.Element
+    """
+    attrs = {'href': href}
+    if action is not None:
+        attrs['action'] = action
+
+    return ElementTree.Element('sl', attrs)
+
+
+_si_serializer = Serializer(SI)
+_sl_serializer = Serializer(SL)
+
+
+def encode_si(href=None, text=None, si_id=None, created=None, expires=None,
+              action=None):
+    """
+    Returns a Service Indication encoded as WBXML
+
+    The arguments are the same of :func:`build_si`.
+
+    :rtype: str
+    """
+    return _si_serializer.serialize(build_si(href, text, si_id, created,
+                                             expires, action))
+
+
+def encode_sl(href, action=None):
+    """
+    Returns a Service Loading encoded as WBXML
+
+    The arguments are the same of :func:`build_sl`.
+
+    :rtype: str
+    """
+    return _sl_serializer.serialize(build_sl(href, action))
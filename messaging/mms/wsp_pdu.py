@@ -43,10 +43,11 @@ References used in the code and this document:
 """
 
 import array
+import calendar
 from datetime import datetime
+import re
 
-from messaging.utils import debug
-from messaging.mms.iterator import PreviewIterator
+from messaging.mms.iterator import ByteCursor, PreviewIterator
 
 wsp_pdu_types = {
     0x01: 'Connect',
@@ -181,6 +182,22 @@ well_known_charsets = {
     0x6A: 'utf-8',
 }
 
+# Push application ids assigned by the WINA
+# Format {<assigned_number> : <application id>}
+well_known_application_ids = {
+    0x00: 'x-wap-application:*',
+    0x01: 'x-wap-application:push.sia',
+    0x02: 'x-wap-application:wml.ua',
+    0x03: 'x-wap-application:wta.ua',
+    0x04: 'x-wap-application:mms.ua',
+    0x05: 'x-wap-application:push.syncml',
+    0x06: 'x-wap-application:loc.ua',
+    0x07: 'x-wap-application:syncml.dm',
+    0x08: 'x-wap-application:drm.ua',
+    0x09: 'x-wap-application:emn.ua',
+    0x0A: 'x-wap-application:wv.ua',
+}
+
 # Header Field Name assignments ([5], table 39)
 header_field_names = [
     'Accept', 'Accept-Charset', 'Accept-Encoding',
@@ -218,7 +235,27 @@ header_field_names = [
 # known parameter assignments)
 # Temporary fix to allow different types of header field values to be
 # dynamically decoded
-header_field_encodings = {'Accept': 'accept_value', 'Pragma': 'pragma_value'}
+header_field_encodings = {
+    'Accept': 'accept_value',
+    'Content-Length': 'integer_value',
+    'Encoding-Version': 'version_value',
+    'Pragma': 'pragma_value',
+    'Push-Flag': 'integer_value',
+    'X-Wap-Application-Id': 'application_id_value',
+}
+
+# headers that are only decoded with a specific Wap-value decoder
+header_field_decodings = dict(header_field_encodings,
+                              **{'Content-ID': 'content_id_value'})
+
+# WSP encoding versions with their own assigned numbers
+VERSIONS = ('1.1', '1.2', '1.3', '1.4')
+
+# Bytes that end a Token-text: CTLs and separators ([5], section 8.4.2.1)
+TOKEN_END = re.compile(r'[\x00-\x20(),/:;<=>?@\[\\\]{}]')
+
+# Bytes that can not be encoded in a Token-text
+TOKEN_SEPARATORS = re.compile(r'[\x0b (),/:;<=>?@\[\\\]{}]')
 
 
 def get_header_field_names(version='1.2'):
@@ -237,7 +274,7 @@ def get_header_field_names(version='1.2'):
              numbers for the specified encoding version (and lower).
     :rtype: list
     """
-    if version not in ('1.1', '1.2', '1.3', '1.4'):
+    if version not in VERSIONS:
         raise ValueError('version must be "1.1",'
                          '"1.2", "1.3" or "1.4"')
 
@@ -275,7 +312,7 @@ def get_well_known_parameters(version='1.2'):
                 <int:assigned_number> : (<str:param_name>, <str:expected_type>)
     :rtype: dict
     """
-    if version not in ('1.1', '1.2', '1.3', '1.4'):
+    if version not in VERSIONS:
         raise ValueError('version must be "1.1",'
                          '"1.2", "1.3" or "1.4"')
     else:
@@ -352,6 +389,9 @@ class Decoder:
         :return: the decoded unsigned integer
         :rtype: int
         """
+        if isinstance(byte_iter, ByteCursor):
+            return byte_iter.read_uint_var()
+
         uint = 0
         byte = byte_iter.next()
         while (byte >> 7) == 0x01:
@@ -473,6 +513,13 @@ class Decoder:
         :return: The decoded text string
         :rtype: str
         """
+        if isinstance(byte_iter, ByteCursor):
+            # Remove Quote character (octet 127), if present
+            if byte_iter.peek() == 127:
+                byte_iter.advance()
+
+            return byte_iter.read_cstring()
+
         decoded_string = ''
         byte = byte_iter.next()
         # Remove Quote character (octet 127), if present
@@ -510,6 +557,42 @@ class Decoder:
         # returning *technically* we should not check for quote characters.
         return Decoder.decode_text_string(byte_iter)
 
+    @staticmethod
+    def decode_content_id_value(byte_iter):
+        """
+        From [5], section 8.4.2.67::
+
+            Content-ID-value = Quoted-string
+
+        Some terminals send a plain Text-string instead, it is accepted too
+
+        :return: The decoded Content-ID, without the leading quote
+        :rtype: str
+        """
+        try:
+            return Decoder.decode_quoted_string(byte_iter)
+        except DecodeError:
+            return Decoder.decode_text_string(byte_iter)
+
+    @staticmethod
+    def decode_application_id_value(byte_iter):
+        """
+        From [5], section 8.4.2.54::
+
+            Application-id-value = Uri-value | App-assigned-code
+            App-assigned-code = Integer-value
+
+        :return: The application id, or the assigned code if it is not
+                 one of :data:`well_known_application_ids`
+        :rtype: str or int
+        """
+        try:
+            code = Decoder.decode_integer_value(byte_iter)
+        except DecodeError:
+            return Decoder.decode_uri_value(byte_iter)
+
+        return well_known_application_ids.get(code, code)
+
     @staticmethod
     def decode_token_text(byte_iter):
         """ From [5], section 8.4.2.1:
@@ -528,6 +611,9 @@ class Decoder:
             byte_iter.reset_preview()
             raise DecodeError('Invalid token')
 
+        if isinstance(byte_iter, ByteCursor):
+            return byte_iter.read_until(TOKEN_END)
+
         byte = byte_iter.next()
         while byte > 31 and byte not in separators:
             token += chr(byte)
@@ -561,6 +647,9 @@ class Decoder:
             raise DecodeError('Invalid Extension-media: TEXT '
                               'starts with invalid character: %d' % byte)
 
+        if isinstance(byte_iter, ByteCursor):
+            return byte_iter.read_cstring()
+
         byte = byte_iter.next()
         while byte != 0x00:
             media_value += chr(byte)
@@ -842,11 +931,15 @@ class Decoder:
         value_length = Decoder.decode_value_length(byte_iter)
 
         # Read parameters, etc, until <value_length> is reached
-        ct_field_bytes = array.array('B')
-        for i in xrange(value_length):
-            ct_field_bytes.append(byte_iter.next())
+        if isinstance(byte_iter, ByteCursor):
+            ct_iter = byte_iter.sub_cursor(value_length)
+        else:
+            ct_field_bytes = array.array('B')
+            for i in xrange(value_length):
+                ct_field_bytes.append(byte_iter.next())
+
+            ct_iter = PreviewIterator(ct_field_bytes)
 
-        ct_iter = PreviewIterator(ct_field_bytes)
         # Now, decode all the bytes read
         media_type = Decoder.decode_media_type(ct_iter)
         # Decode the included paramaters (if any)
@@ -895,15 +988,14 @@ class Decoder:
         :rtype: tuple
         """
         token, value_type = Decoder.decode_well_known_parameter(byte_iter)
-        typed_value = ''
+        decode = parameter_value_decoders.get(value_type)
+        if decode is None:
+            raise DecodeError('Could not decode Typed-parameter: decoding '
+                              'of %s is not implemented' % value_type)
         try:
-            typed_value = getattr(Decoder, 'decode_%s' % value_type)(byte_iter)
+            typed_value = decode(byte_iter)
         except DecodeError, msg:
             raise DecodeError('Could not decode Typed-parameter: %s' % msg)
-        except:
-            debug('A fatal error occurred, probably due to an '
-                  'unimplemented decoding operation')
-            raise
 
         return token, typed_value
 
@@ -987,7 +1079,12 @@ class Decoder:
             raise DecodeError('Invalid well-known parameter token: could '
                               'not read integer value representing it')
 
-        wk_params = get_well_known_parameters(version)
+        try:
+            wk_params = parameter_decoders[version]
+        except KeyError:
+            raise ValueError('version must be "1.1",'
+                             '"1.2", "1.3" or "1.4"')
+
         if parameter_value in wk_params:
             parameter_name, expected_value = wk_params[parameter_value]
         else:
@@ -1300,7 +1397,7 @@ class Decoder:
         return decoded_charset
 
     @staticmethod
-    def decode_well_known_header(byte_iter):
+    def decode_well_known_header(byte_iter, version='1.4', page=1):
         """
         Currently, "Wap-value" is decoded as a Text-string in most cases
 
@@ -1310,42 +1407,73 @@ class Decoder:
             Well-known-field-name = Short-integer
             Wap-value = <many different headers value, most not implemented>
 
+        :param version: The WSP encoding version whose field names are
+                        used. This defaults to "1.4", the field names of
+                        every version are accepted.
+        :type version: str
+        :param page: The header code page, see :func:`decode_headers`
+        :type page: int
+
+        :raise DecodeError: Not a Well-known-header. ``byte_iter`` is not
+                            modified in this case.
 
         :return: The header name, and its value, in the format:
                  (<str:header_name>, <str:header_value>)
         :rtype: tuple
         """
-        field_value = Decoder.decode_short_integer(byte_iter)
-        hdr_fields = get_header_field_names()
-        # TODO: *technically* this can fail, but then we have already
-        # read a byte... should fix?
-        if field_value not in xrange(len(hdr_fields)):
-            raise DecodeError('Invalid Header Field value: %d' % field_value)
-
-        field_name = hdr_fields[field_value]
-
-        # TODO: make this flow better, and implement it in
-        # decode_application_header also
-        # Currently we decode most headers as text_strings, except
-        # where we have a specific decoding algorithm implemented
-        if field_name in header_field_encodings:
-            wap_value_type = header_field_encodings[field_name]
-            try:
-                decoded_value = getattr(Decoder,
-                                       'decode_%s' % wap_value_type)(byte_iter)
-            except DecodeError, msg:
-                raise DecodeError('Could not decode Wap-value: %s' % msg)
-            except:
-                debug('An error occurred, probably due to an '
-                      'unimplemented decoding operation. Tried to '
-                      'decode header: %s' % field_name)
-                raise
-
+        byte = byte_iter.preview()
+        byte_iter.reset_preview()
+        if not byte & 0x80:
+            raise DecodeError('Invalid Header Field value: %d' % byte)
+
+        table = get_header_code_page(page, version)
+        field_value = byte & 0x7f
+        if field_value in table:
+            field_name, decode = table[field_value]
+        elif page == 1:
+            raise DecodeError('Invalid Header Field value: %d' % byte)
         else:
-            decoded_value = Decoder.decode_text_string(byte_iter)
+            # the code page is unknown, the value is taken as text
+            field_name = 'X-Wsp-Page-%d-Field-%d' % (page, field_value)
+            decode = Decoder.decode_text_string
+
+        byte_iter.next()
+        try:
+            decoded_value = decode(byte_iter)
+        except DecodeError, msg:
+            raise DecodeError('Could not decode Wap-value: %s' % msg)
 
         return field_name, decoded_value
 
+    @staticmethod
+    def decode_shift_sequence(byte_iter):
+        """
+        Decodes the header code page selected by a Shift-sequence
+
+        From [5], section 8.4.2.6::
+
+            Shift-sequence = (Shift-delimiter Page-identity) |
+                             Short-cut-shift-delimiter
+            Shift-delimiter = <Octet 127>
+            Page-identity = <Any octet 1-255>
+            Short-cut-shift-delimiter = <Any octet 1-31>
+
+        :raise DecodeError: Not a Shift-sequence. ``byte_iter`` is not
+                            modified in this case.
+
+        :return: The number of the selected code page
+        :rtype: int
+        """
+        byte = byte_iter.preview()
+        byte_iter.reset_preview()
+        if byte == 127:
+            byte_iter.next()
+            return byte_iter.next()
+        elif 1 <= byte <= 31:
+            return byte_iter.next()
+
+        raise DecodeError('Not a Shift-sequence: %d' % byte)
+
     @staticmethod
     def decode_application_header(byte_iter):
         """
@@ -1375,12 +1503,13 @@ class Decoder:
         return app_header, app_specific_value
 
     @staticmethod
-    def decode_header(byte_iter):
+    def decode_header(byte_iter, version='1.4', page=1):
         """
         Decodes a WSP header entry
 
-        "Shift-sequence" encoding has not been implemented. Currently,
-        almost all header values are treated as text-strings
+        Currently, almost all header values are treated as text-strings.
+        A Shift-sequence in front of the header only applies to it, use
+        :func:`decode_headers` to decode a whole header section.
 
         From [5], section 8.4.2.6::
 
@@ -1389,18 +1518,147 @@ class Decoder:
             Well-known-header = Well-known-field-name Wap-value
             Application-header = Token-text Application-specific-value
 
+        :param version: The WSP encoding version whose field names are used
+        :type version: str
+        :param page: The header code page
+        :type page: int
 
         :return: The decoded headername, and its value, in the format:
                  (<str:header_name>, <str:header_value>)
         :rtype: tuple
         """
+        try:
+            page = Decoder.decode_shift_sequence(byte_iter)
+        except DecodeError:
+            pass
+
         # First try decoding the header as a well-known-header
         try:
-            return Decoder.decode_well_known_header(byte_iter)
+            return Decoder.decode_well_known_header(byte_iter, version, page)
         except DecodeError:
             # ...now try Application-header encoding
             return Decoder.decode_application_header(byte_iter)
 
+    @staticmethod
+    def decode_headers(byte_iter, version='1.4'):
+        """
+        Decodes all the WSP headers until the end of ``byte_iter``
+
+        Headers after a Shift-sequence are decoded with the field names
+        of the selected code page (see :func:`register_header_code_page`),
+        until the next Shift-sequence. Page 1 holds the field names of
+        ``version``.
+
+        :param version: The WSP encoding version whose field names are used
+        :type version: str
+
+        :return: The decoded headers
+        :rtype: dict
+        """
+        headers = {}
+        page = 1
+        while True:
+            try:
+                try:
+                    page = Decoder.decode_shift_sequence(byte_iter)
+                    continue
+                except DecodeError:
+                    pass
+
+                try:
+                    hdr, value = Decoder.decode_well_known_header(
+                                                byte_iter, version, page)
+                except DecodeError:
+                    hdr, value = Decoder.decode_application_header(byte_iter)
+
+                headers[hdr] = value
+            except StopIteration:
+                break
+
+        return headers
+
+
+def _uint_var(uint):
+    # the least significant septet goes last, without the continue bit
+    encoded = bytearray([uint & 0x7f])
+    uint >>= 7
+    while uint > 0:
+        encoded.append(0x80 | (uint & 0x7f))
+        uint >>= 7
+
+    encoded.reverse()
+    return encoded
+
+
+def _text_bytes(string):
+    if isinstance(string, unicode):
+        # one octet per character, as ord() used to give
+        return string.encode('latin-1')
+
+    return string
+
+
+class ByteWriter(object):
+    """
+    I am a growable byte buffer that encoded values are written to
+
+    Fields whose length prefix depends on what follows them (like a
+    Value-length) are written first, and the prefix is inserted in front
+    of them afterwards with :func:`insert`.
+    """
+    __slots__ = ('buf',)
+
+    def __init__(self):
+        self.buf = bytearray()
+
+    def __len__(self):
+        return len(self.buf)
+
+    def write(self, data):
+        """
+        Appends ``data`` to the buffer
+
+        :param data: A byte string, or a sequence of byte values
+        """
+        if isinstance(data, list):
+            self.buf.extend(data)
+        else:
+            self.buf += data
+
+    def write_byte(self, byte):
+        """Appends a single byte value"""
+        self.buf.append(byte)
+
+    def write_uint_var(self, uint):
+        """Appends ``uint`` as an uintvar, see :func:`Encoder.encode_uint_var`"""
+        self.buf += _uint_var(uint)
+
+    def write_text_string(self, string):
+        """Appends ``string`` as a null-terminated Text-string"""
+        self.buf += _text_bytes(string)
+        self.buf.append(0x00)
+
+    def mark(self):
+        """Returns the current position, to :func:`insert` a prefix at"""
+        return len(self.buf)
+
+    def insert(self, mark, data):
+        """Inserts ``data`` at position ``mark``"""
+        self.buf[mark:mark] = data
+
+    def insert_value_length(self, mark):
+        """Prefixes everything written after ``mark`` with its Value-length"""
+        self.insert(mark,
+                    Encoder.encode_value_length(len(self.buf) - mark))
+
+    def getvalue(self):
+        """Returns the written bytes as a string"""
+        return str(self.buf)
+
+    def tolist(self):
+        """Returns the written bytes as a list of byte values"""
+        return list(self.buf)
+
 
 class Encoder:
     """A WSP Data unit decoder"""
@@ -1441,15 +1699,7 @@ class Encoder:
         :return: the binary-encoded uint_var, as a list of byte values
         :rtype: list
         """
-        uint_var = [uint & 0x7f]
-        # Since this is the lowest entry, we do not set the continue bit to 1
-        uint = uint >> 7
-        # ...but for the remaining octets, we have to
-        while uint > 0:
-            uint_var.insert(0, 0x80 | (uint & 0x7f))
-            uint = uint >> 7
-
-        return uint_var
+        return list(_uint_var(uint))
 
     @staticmethod
     def encode_text_string(string):
@@ -1465,9 +1715,9 @@ class Encoder:
                      specified Text-string, as a list of byte values
         :rtype: list
         """
-        encoded_string = [ord(c) for c in string]
+        encoded_string = bytearray(_text_bytes(string))
         encoded_string.append(0x00)
-        return encoded_string
+        return list(encoded_string)
 
     @staticmethod
     def encode_short_integer(integer):
@@ -1520,16 +1770,17 @@ class Encoder:
         :return: The encoded Long-integer, as a sequence of byte values
         :rtype: list
         """
-        if not isinstance(integer, int):
-            raise EncodeError('<integer> must be of type "int"')
+        if not isinstance(integer, (int, long)) or integer < 0:
+            raise EncodeError('<integer> must be a positive "int"')
 
         encoded_long_int = []
         longInt = integer
-        # Encode the Multi-octect-integer
-        while longInt > 0:
-            byte = 0xff & longInt
-            encoded_long_int.append(byte)
+        # Encode the Multi-octect-integer, most significant octet first
+        while True:
+            encoded_long_int.insert(0, 0xff & longInt)
             longInt = longInt >> 8
+            if not longInt:
+                break
 
         # Now add the SHort-length value, and make sure it's ok
         shortLength = len(encoded_long_int)
@@ -1606,14 +1857,24 @@ class Encoder:
                  values
         :rtype: list
         """
-        if content_type in well_known_content_types:
+        writer = ByteWriter()
+        Encoder.write_media_type(writer, content_type)
+        return writer.tolist()
+
+    @staticmethod
+    def write_media_type(writer, content_type):
+        """
+        Writes the Media-type ``content_type`` to ``writer``
+
+        See :func:`encode_media_type`.
+
+        :type writer: ByteWriter
+        """
+        if content_type in content_type_codes:
             # Short-integer encoding
-            val = Encoder.encode_short_integer(
-                    well_known_content_types.index(content_type))
+            writer.write_byte(content_type_codes[content_type] | 0x80)
         else:
-            val = Encoder.encode_text_string(content_type)
-
-        return [val]
+            writer.write_text_string(content_type)
 
     @staticmethod
     def encode_parameter(parameter_name, parameter_value, version='1.2'):
@@ -1648,44 +1909,47 @@ class Encoder:
                  byte values
         :rtype: list
         """
-        wk_params = get_well_known_parameters(version)
-        encoded_parameter = []
-        # Try to encode the parameter using a "Typed-parameter" value
-        wkParamNumbers = wk_params.keys()
-        wkParamNumbers.sort(reverse=True)
-        for assigned_number in wkParamNumbers:
-            if wk_params[assigned_number][0] == parameter_name:
-                # Ok, it's a Typed-parameter; encode the parameter name
-                encoded_parameter.extend(
-                        Encoder.encode_short_integer(assigned_number))
-                # and now the value
-                expected_type = wk_params[assigned_number][1]
-                try:
-                    ret = getattr(Encoder,
-                                  'encode_%s' % expected_type)(parameter_value)
-                    encoded_parameter.extend(ret)
-                except EncodeError, msg:
-                    raise EncodeError('Error encoding param value: %s' % msg)
-                except:
-                    debug('A fatal error occurred, probably due to an '
-                          'unimplemented encoding operation')
-                    raise
-                break
+        writer = ByteWriter()
+        Encoder.write_parameter(writer, parameter_name, parameter_value,
+                                version)
+        return writer.tolist()
 
-        # See if the "Typed-parameter" encoding worked
-        if len(encoded_parameter) == 0:
-            # it didn't. Use "Untyped-parameter" encoding
-            encoded_parameter.extend(Encoder.encode_token_text(parameter_name))
-            value = []
+    @staticmethod
+    def write_parameter(writer, parameter_name, parameter_value,
+                        version='1.2'):
+        """
+        Writes a Parameter to ``writer``, see :func:`encode_parameter`
+
+        :type writer: ByteWriter
+        """
+        try:
+            encoders = parameter_encoders[version]
+        except KeyError:
+            raise ValueError('version must be "1.1",'
+                             '"1.2", "1.3" or "1.4"')
+
+        if parameter_name in encoders:
+            # It's a Typed-parameter; encode the parameter name
+            assigned_number, encode = encoders[parameter_name]
+            writer.write_byte(assigned_number | 0x80)
+            # and now the value
+            if encode is None:
+                raise EncodeError('Encoding of parameter "%s" is not '
+                                  'implemented' % parameter_name)
+            try:
+                writer.write(encode(parameter_value))
+            except EncodeError, msg:
+                raise EncodeError('Error encoding param value: %s' % msg)
+        else:
+            # Use "Untyped-parameter" encoding
+            writer.write(Encoder.encode_token_text(parameter_name))
             # First try to encode the untyped-value as an integer
             try:
                 value = Encoder.encode_integer_value(parameter_value)
             except EncodeError:
                 value = Encoder.encode_text_string(parameter_value)
 
-            encoded_parameter.extend(value)
-
-        return encoded_parameter
+            writer.write(value)
 
     # TODO: check up on the encoding/decoding of Token-text, in particular,
     # how does this differ from text-string? does it have 0x00 at the end?
@@ -1699,13 +1963,11 @@ class Encoder:
         :return: The encoded token string, as a list of byte values
         :rtype: list
         """
-        separators = (11, 32, 40, 41, 44, 47, 58, 59, 60, 61, 62, 63, 64,
-                      91, 92, 93, 123, 125)
         # Sanity check
-        for char in separators:
-            if chr(char) in text:
-                raise EncodeError('Char "%s" in text string; cannot '
-                                  'encode as Token-text' % chr(char))
+        match = TOKEN_SEPARATORS.search(text)
+        if match is not None:
+            raise EncodeError('Char "%s" in text string; cannot '
+                              'encode as Token-text' % match.group())
 
         return Encoder.encode_text_string(text)
 
@@ -1728,7 +1990,7 @@ class Encoder:
         :return: The encoded integer value, as a list of byte values
         :rtype: list
         """
-        if not isinstance(integer, int):
+        if not isinstance(integer, (int, long)):
             raise EncodeError('<integer> must be of type "int"')
 
         # First try and see if it's a short-integer
@@ -1737,6 +1999,60 @@ class Encoder:
         except EncodeError:
             return Encoder.encode_long_integer(integer)
 
+    @staticmethod
+    def encode_date_value(date):
+        """
+        Encodes ``date`` as the seconds since 1970-01-01, 00:00:00 GMT
+
+        From [5], section 8.4.2.3::
+
+            Date-value = Long-integer
+
+        :param date: The date; naive datetimes are taken as UTC
+        :type date: datetime.datetime
+        :rtype: list
+        """
+        if date.utcoffset() is not None:
+            date = date.replace(tzinfo=None) - date.utcoffset()
+
+        return Encoder.encode_long_integer(calendar.timegm(date.timetuple()))
+
+    @staticmethod
+    def encode_uri_value(uri):
+        """
+        Encodes ``uri`` as a Text-string
+
+        From [5], section 8.4.2.8::
+
+            Uri-value = Text-string
+
+        :rtype: list
+        """
+        return Encoder.encode_text_string(uri)
+
+    @staticmethod
+    def encode_application_id_value(application_id):
+        """
+        Encodes an X-Wap-Application-Id value
+
+        From [5], section 8.4.2.54::
+
+            Application-id-value = Uri-value | App-assigned-code
+
+        :param application_id: One of :data:`well_known_application_ids`
+                               or its code, or any other URI
+        :type application_id: str or int
+        :rtype: list
+        """
+        if isinstance(application_id, (int, long)):
+            return Encoder.encode_integer_value(application_id)
+
+        code = application_id_codes.get(application_id)
+        if code is not None:
+            return Encoder.encode_integer_value(code)
+
+        return Encoder.encode_text_string(application_id)
+
     @staticmethod
     def encode_text_value(text):
         """Stub for encoding Text-values; see :func:`encode_text_string`"""
@@ -1778,37 +2094,38 @@ class Encoder:
                  byte values
         :rtype: list
         """
-        encoded_header = []
+        writer = ByteWriter()
+        Encoder.write_header(writer, field_name, value)
+        return writer.tolist()
+
+    @staticmethod
+    def write_header(writer, field_name, value):
+        """
+        Writes a WSP header entry to ``writer``, see :func:`encode_header`
+
+        :type writer: ByteWriter
+        """
         # First try encoding the header name as a "well-known-header"...
-        wkHdrFields = get_header_field_names()
-        if field_name in wkHdrFields:
-            header_field_value = Encoder.encode_short_integer(
-                                    wkHdrFields.index(field_name))
-            encoded_header.extend(header_field_value)
+        if field_name in header_field_codes:
+            writer.write_byte(header_field_codes[field_name] | 0x80)
         else:
             # otherwise, encode it as an "application header"
-            encoded_header_name = Encoder.encode_token_text(field_name)
-            encoded_header.extend(encoded_header_name)
+            writer.write(Encoder.encode_token_text(field_name))
 
         # Now add the value
-        # TODO: make this flow better (see also Decoder.decode_header)
         # most header values are encoded as text_strings, except where we
         # have a specific Wap-value encoding implementation
-        if field_name in header_field_encodings:
-            wap_value_type = header_field_encodings[field_name]
+        if field_name in header_value_encoders:
+            encode = header_value_encoders[field_name]
+            if encode is None:
+                raise EncodeError('Encoding of header "%s" is not '
+                                  'implemented' % field_name)
             try:
-                ret = getattr(Encoder, 'encode_%s' % wap_value_type)(value)
-                encoded_header.extend(ret)
+                writer.write(encode(value))
             except EncodeError, msg:
                 raise EncodeError('Error encoding Wap-value: %s' % msg)
-            except:
-                debug('A fatal error occurred, probably due to an '
-                      'unimplemented encoding operation')
-                raise
         else:
-            encoded_header.extend(Encoder.encode_text_string(value))
-
-        return encoded_header
+            writer.write_text_string(value)
 
     @staticmethod
     def encode_content_type_value(media_type, parameters):
@@ -1827,16 +2144,29 @@ class Encoder:
                  any), as a sequence of bytes
         :rtype: list
         """
+        writer = ByteWriter()
+        Encoder.write_content_type_value(writer, media_type, parameters)
+        return writer.tolist()
+
+    @staticmethod
+    def write_content_type_value(writer, media_type, parameters):
+        """
+        Writes a content type and its parameters to ``writer``
+
+        See :func:`encode_content_type_value`.
+
+        :type writer: ByteWriter
+        """
         # First try do encode it using Constrained-media encoding
-        try:
-            if len(parameters):
-                raise EncodeError('Need to use '
-                                  'Content-general-form for parameters')
+        if not len(parameters):
+            try:
+                writer.write(Encoder.encode_constrained_media(media_type))
+                return
+            except EncodeError:
+                pass
 
-            return Encoder.encode_constrained_media(media_type)
-        except EncodeError:
-            # Try the general form
-            return Encoder.encode_content_general_form(media_type, parameters)
+        # Use the general form
+        Encoder.write_content_general_form(writer, media_type, parameters)
 
     @staticmethod
     def encode_constrained_media(media_type):
@@ -1858,10 +2188,7 @@ class Encoder:
         :rtype: list
         """
         # See if this value is in the table of well-known content types
-        if media_type in well_known_content_types:
-            value = well_known_content_types.index(media_type)
-        else:
-            value = media_type
+        value = content_type_codes.get(media_type, media_type)
 
         return Encoder.encode_constrained_encoding(value)
 
@@ -1947,21 +2274,28 @@ class Encoder:
         :return: The encoded Content-general-form, as a sequence of bytes
         :rtype: list
         """
-        enconded_content_general_form = []
-        encoded_media_type = []
+        writer = ByteWriter()
+        Encoder.write_content_general_form(writer, media_type, parameters)
+        return writer.tolist()
+
+    @staticmethod
+    def write_content_general_form(writer, media_type, parameters):
+        """
+        Writes a Content-general-form to ``writer``
+
+        The Value-length covers the encoded media type and all the
+        parameters, it is inserted once they have been written.
+
+        :type writer: ByteWriter
+        """
+        mark = writer.mark()
         # Encode the actual content type
-        encoded_media_type = Encoder.encode_media_type(media_type)
+        Encoder.write_media_type(writer, media_type)
         # Encode all parameters
-        encoded_parameters = [Encoder.encode_parameter(name, parameters[name])
-                                    for name in parameters]
-
-        value_length = len(encoded_media_type) + len(encoded_parameters)
-        encoded_value_length = Encoder.encode_value_length(value_length)
-        enconded_content_general_form.extend(encoded_value_length)
-        enconded_content_general_form.extend(encoded_media_type)
-        enconded_content_general_form.extend(encoded_parameters)
+        for name in parameters:
+            Encoder.write_parameter(writer, name, parameters[name])
 
-        return enconded_content_general_form
+        writer.insert_value_length(mark)
 
     @staticmethod
     def encode_value_length(length):
@@ -2053,3 +2387,125 @@ class Encoder:
             encoded_accept_value.extend(encoded_media_range)
 
         return encoded_accept_value
+
+
+# Lookup tables for the encoder, so names are not searched for in the
+# assignment lists (and encoders not looked up by name) on every call
+
+def _first_codes(names):
+    codes = {}
+    for code, name in enumerate(names):
+        codes.setdefault(name, code)
+
+    return codes
+
+# well-known content type -> assigned number
+content_type_codes = _first_codes(well_known_content_types)
+
+# well-known application id -> assigned number
+application_id_codes = dict((app_id, code) for code, app_id
+                            in well_known_application_ids.items())
+
+# well-known header field name -> assigned number (encoding version 1.2)
+header_field_codes = _first_codes(get_header_field_names())
+
+# header field name -> Wap-value encoder, None if not implemented
+header_value_encoders = dict(
+    (name, getattr(Encoder, 'encode_%s' % value_type, None))
+    for name, value_type in header_field_encodings.items())
+
+
+def _parameter_encoders(version):
+    # when a name was assigned twice the most recent number is used
+    encoders = {}
+    params = get_well_known_parameters(version)
+    for assigned_number in sorted(params):
+        name, value_type = params[assigned_number]
+        encode = getattr(Encoder, 'encode_%s' % value_type, None)
+        encoders[name] = (assigned_number, encode)
+
+    return encoders
+
+# encoding version -> {parameter name: (assigned number, value encoder)}
+parameter_encoders = dict((version, _parameter_encoders(version))
+                          for version in VERSIONS)
+
+
+# Lookup tables for the decoder, built once for every encoding version
+
+def _header_decoders(version):
+    decoders = {}
+    for assigned_number, name in enumerate(get_header_field_names(version)):
+        decode = Decoder.decode_text_string
+        if name in header_field_decodings:
+            decode = getattr(Decoder,
+                             'decode_%s' % header_field_decodings[name])
+
+        decoders[assigned_number] = (name, decode)
+
+    return decoders
+
+# encoding version -> {assigned number: (header field name, value decoder)}
+header_decoders = dict((version, _header_decoders(version))
+                       for version in VERSIONS)
+
+# encoding version -> {assigned number: (parameter name, value type)}
+parameter_decoders = dict((version, get_well_known_parameters(version))
+                          for version in VERSIONS)
+
+# parameter value type -> value decoder, None if not implemented
+parameter_value_decoders = dict(
+    (value_type, getattr(Decoder, 'decode_%s' % value_type, None))
+    for name, value_type in well_known_parameters.values())
+
+# header code page -> {assigned number: (header field name, value decoder)}
+header_code_pages = {}
+
+
+def register_header_code_page(page, fields):
+    """
+    Registers the header field names of the code page ``page``
+
+    Page 1 is the default page, with the field names of [5], table 39.
+    Other pages are selected by a Shift-sequence, see
+    :func:`Decoder.decode_headers`. The headers of a page that has not
+    been registered are decoded as text, with generated names.
+
+    :param page: The code page, in range 2-255
+    :type page: int
+    :param fields: The field names of the page, in the format:
+                   {<int:assigned number>: (<str:name>, <str:value type>)}
+                   where the value type is the name of a Wap-value
+                   decoder of :class:`Decoder` (e.g. ``"integer_value"``
+                   for :func:`Decoder.decode_integer_value`), or None to
+                   decode the value as a Text-string.
+    :type fields: dict
+
+    :raise ValueError: The page can not be registered
+    """
+    if not 2 <= page <= 255:
+        raise ValueError('Header code page must be in range 2-255')
+
+    decoders = {}
+    for assigned_number, (name, value_type) in fields.items():
+        decode = Decoder.decode_text_string
+        if value_type is not None:
+            decode = getattr(Decoder, 'decode_%s' % value_type)
+
+        decoders[assigned_number] = (name, decode)
+
+    header_code_pages[page] = decoders
+
+
+def get_header_code_page(page, version='1.4'):
+    """
+    Returns the header field table used to decode the code page ``page``
+
+    :return: The table, in the format:
+             {<int:assigned number>: (<str:name>, <value decoder>)}
+    :rtype: dict
+    """
+    if page == 1:
+        return header_decoders[version]
+
+    return header_code_pages.get(page, {})
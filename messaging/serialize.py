@@ -0,0 +1,727 @@
+# See LICENSE
+"""
+Compact binary serialization of SMS and MMS objects
+
+Meant for passing messages between processes: :func:`dumps` stores the
+already decoded (or encoded) attributes, so :func:`loads` does not run
+the PDU codecs again. :class:`Record` reads the fields of a serialized
+message one at a time, straight from the buffer.
+
+A record is laid out as::
+
+    'PM' <version:1> <kind:1> <nfields:2> <offset:4> * nfields <values>
+
+where every offset is relative to the start of the record and every
+value is a tag byte followed by its data.
+
+The common :class:`~messaging.sms.SmsDeliver` (short numbers, byte-sized
+fields and no timezone) and lists of :class:`~messaging.sms.pdu.Pdu` are
+stored instead with a fixed layout that is packed and unpacked with a
+single :mod:`struct` call, which makes them faster to serialize and to
+load than with :mod:`cPickle`. The headers of a MMS, an arbitrary dict,
+are not: for them the gain is a smaller payload and :class:`Record`.
+"""
+
+from array import array
+from datetime import datetime, timedelta
+import struct
+
+from messaging.mms.message import MMSMessage
+from messaging.sms.deliver import SmsDeliver
+from messaging.sms.pdu import Pdu
+from messaging.sms.submit import SmsSubmit
+from messaging.sms.udh import ConcatReference, PortAddress, UserDataHeader
+from messaging.utils import FixedOffset
+
+MAGIC = 'PM'
+VERSION = 1
+
+SMS_DELIVER = 1
+SMS_SUBMIT = 2
+PDU_LIST = 3
+MMS_HEADERS = 4
+# the fixed layouts of SMS_DELIVER and PDU_LIST
+SMS_DELIVER_PACKED = 5
+PDU_LIST_PACKED = 6
+
+# the kind of object stored by every layout
+KINDS = {
+    SMS_DELIVER: SMS_DELIVER,
+    SMS_SUBMIT: SMS_SUBMIT,
+    PDU_LIST: PDU_LIST,
+    MMS_HEADERS: MMS_HEADERS,
+    SMS_DELIVER_PACKED: SMS_DELIVER,
+    PDU_LIST_PACKED: PDU_LIST,
+}
+
+# (key, attribute) pairs of every kind, in storage order
+FIELDS = {
+    SMS_DELIVER: (
+        ('pdu', '_pdu'), ('strict', '_strict'), ('keep_pdu', '_keep_pdu'),
+        ('csca', 'csca'), ('mtype', 'mtype'), ('number', 'number'),
+        ('pid', 'pid'), ('dcs', 'dcs'), ('fmt', 'fmt'), ('date', 'date'),
+        ('type', 'type'), ('text', 'text'), ('sr', 'sr'), ('udh', 'udh'),
+    ),
+    SMS_SUBMIT: (
+        ('number', '_number'), ('text', 'text'), ('csca', '_csca'),
+        ('klass', '_klass'), ('validity', '_validity'),
+        ('request_status', 'request_status'), ('ref', 'ref'),
+        ('rand_id', 'rand_id'), ('next_id', '_next_id'),
+        ('msgvp', 'msgvp'), ('pid', 'pid'), ('fmt', 'fmt'),
+        ('dcs', 'dcs'), ('type', 'type'), ('text_gsm', 'text_gsm'),
+        ('udh', 'udh'),
+    ),
+}
+
+_HEADER = struct.Struct('<2sBBH')
+_OFFSET = struct.Struct('<I')
+_LENGTH = struct.Struct('<I')
+_INT = struct.Struct('<q')
+_FLOAT = struct.Struct('<d')
+_DATETIME = struct.Struct('<HBBBBBI')
+_TZ = struct.Struct('<h')
+_TIMEDELTA = struct.Struct('<iii')
+# flags, None fields, mtype, pid, dcs, fmt, type, the date and the
+# lengths of the PDU, SMSC, number and text, followed by their bytes
+_DELIVER = struct.Struct('<BBBBBBBHBBBBBIHBBH')
+
+# flags of _DELIVER
+D_STRICT = 0x01
+D_KEEP_PDU = 0x02
+D_NO_PDU = 0x04
+D_NO_CSCA = 0x08
+D_NO_NUMBER = 0x10
+D_NO_DATE = 0x20
+D_STR_TEXT = 0x40
+D_NO_EXTRA = 0x80
+
+_NO_DATE = (0, 0, 0, 0, 0, 0, 0)
+
+(T_NONE, T_TRUE, T_FALSE, T_BYTE, T_INT, T_STR, T_UNICODE, T_FLOAT,
+ T_DATETIME, T_DATETIME_TZ, T_TIMEDELTA, T_LIST, T_TUPLE, T_DICT,
+ T_ARRAY, T_UDH) = range(16)
+
+# set on the tags of sized values whose length does not fit in a byte
+LONG = 0x80
+
+
+def _pack_size(tag, size):
+    if size < 0x100:
+        return chr(tag) + chr(size)
+
+    return chr(tag | LONG) + _LENGTH.pack(size)
+
+
+def _pack_int(value, out):
+    if 0 <= value <= 0xff:
+        out.append(chr(T_BYTE) + chr(value))
+    else:
+        out.append(chr(T_INT) + _INT.pack(value))
+
+
+def _pack_str(value, out):
+    out.append(_pack_size(T_STR, len(value)))
+    out.append(value)
+
+
+def _pack_unicode(value, out):
+    value = value.encode('utf-8')
+    out.append(_pack_size(T_UNICODE, len(value)))
+    out.append(value)
+
+
+def _pack_datetime(value, out):
+    fields = _DATETIME.pack(value.year, value.month, value.day, value.hour,
+                            value.minute, value.second, value.microsecond)
+    offset = value.utcoffset()
+    if offset is None:
+        out.append(chr(T_DATETIME) + fields)
+        return
+
+    minutes = offset.days * 1440 + offset.seconds // 60
+    out.append(chr(T_DATETIME_TZ) + fields + _TZ.pack(minutes))
+    _pack_value(value.tzname(), out)
+
+
+def _pack_sequence(tag):
+    def pack(value, out):
+        out.append(_pack_size(tag, len(value)))
+        for item in value:
+            _PACKERS[type(item)](item, out)
+
+    return pack
+
+
+def _pack_dict(value, out):
+    out.append(_pack_size(T_DICT, len(value)))
+    for key, item in value.iteritems():
+        _PACKERS[type(key)](key, out)
+        _PACKERS[type(item)](item, out)
+
+
+def _pack_array(value, out):
+    data = value.tostring()
+    out.append(chr(T_ARRAY) + value.typecode + _LENGTH.pack(len(data)))
+    out.append(data)
+
+
+def _pack_udh(value, out):
+    out.append(chr(T_UDH))
+    concat, ports = value.concat, value.ports
+    if concat is not None:
+        concat = (concat.ref, concat.cnt, concat.seq, concat.eight_bits)
+    if ports is not None:
+        ports = (ports.dest_port, ports.orig_port, ports.eight_bits)
+
+    _pack_value(concat, out)
+    _pack_value(ports, out)
+    _pack_value(value.headers, out)
+
+
+_PACKERS = {
+    type(None): lambda value, out: out.append(chr(T_NONE)),
+    bool: lambda value, out: out.append(chr(value and T_TRUE or T_FALSE)),
+    int: _pack_int,
+    long: _pack_int,
+    float: lambda value, out: out.append(chr(T_FLOAT) + _FLOAT.pack(value)),
+    str: _pack_str,
+    unicode: _pack_unicode,
+    datetime: _pack_datetime,
+    timedelta: lambda value, out: out.append(chr(T_TIMEDELTA) +
+                    _TIMEDELTA.pack(value.days, value.seconds,
+                                    value.microseconds)),
+    list: _pack_sequence(T_LIST),
+    tuple: _pack_sequence(T_TUPLE),
+    dict: _pack_dict,
+    array: _pack_array,
+    UserDataHeader: _pack_udh,
+}
+
+
+def _pack_value(value, out):
+    try:
+        packer = _PACKERS[type(value)]
+    except KeyError:
+        raise TypeError("Can not serialize %r" % value)
+
+    packer(value, out)
+
+
+def _unpack_str(data, pos):
+    end = pos + 1 + ord(data[pos])
+    return data[pos + 1:end], end
+
+
+def _unpack_long_str(data, pos):
+    end = pos + 4 + _LENGTH.unpack_from(data, pos)[0]
+    return data[pos + 4:end], end
+
+
+def _unpack_unicode(data, pos):
+    end = pos + 1 + ord(data[pos])
+    return data[pos + 1:end].decode('utf-8'), end
+
+
+def _unpack_long_unicode(data, pos):
+    end = pos + 4 + _LENGTH.unpack_from(data, pos)[0]
+    return data[pos + 4:end].decode('utf-8'), end
+
+
+def _unpack_datetime(data, pos):
+    return datetime(*_DATETIME.unpack_from(data, pos)), pos + _DATETIME.size
+
+
+_timezones = {}
+
+
+def _unpack_datetime_tz(data, pos):
+    value, pos = _unpack_datetime(data, pos)
+    minutes = _TZ.unpack_from(data, pos)[0]
+    name, pos = _unpack_value(data, pos + _TZ.size)
+    try:
+        tz = _timezones[minutes, name]
+    except KeyError:
+        tz = _timezones[minutes, name] = FixedOffset(minutes, name)
+
+    return value.replace(tzinfo=tz), pos
+
+
+def _unpack_timedelta(data, pos):
+    days, seconds, micros = _TIMEDELTA.unpack_from(data, pos)
+    return timedelta(days, seconds, micros), pos + _TIMEDELTA.size
+
+
+def _unpack_items(data, pos, count):
+    items = []
+    for i in xrange(count):
+        item, pos = _UNPACKERS[ord(data[pos])](data, pos + 1)
+        items.append(item)
+
+    return items, pos
+
+
+def _unpack_list(data, pos):
+    return _unpack_items(data, pos + 1, ord(data[pos]))
+
+
+def _unpack_long_list(data, pos):
+    return _unpack_items(data, pos + 4, _LENGTH.unpack_from(data, pos)[0])
+
+
+def _unpack_tuple(data, pos):
+    items, pos = _unpack_items(data, pos + 1, ord(data[pos]))
+    return tuple(items), pos
+
+
+def _unpack_long_tuple(data, pos):
+    count = _LENGTH.unpack_from(data, pos)[0]
+    items, pos = _unpack_items(data, pos + 4, count)
+    return tuple(items), pos
+
+
+def _unpack_dict(data, pos):
+    items, pos = _unpack_items(data, pos + 1, 2 * ord(data[pos]))
+    return dict(zip(items[::2], items[1::2])), pos
+
+
+def _unpack_long_dict(data, pos):
+    count = 2 * _LENGTH.unpack_from(data, pos)[0]
+    items, pos = _unpack_items(data, pos + 4, count)
+    return dict(zip(items[::2], items[1::2])), pos
+
+
+def _unpack_array(data, pos):
+    end = pos + 5 + _LENGTH.unpack_from(data, pos + 1)[0]
+    value = array(data[pos])
+    value.fromstring(data[pos + 5:end])
+    return value, end
+
+
+def _unpack_udh(data, pos):
+    udh = UserDataHeader()
+    concat, pos = _unpack_value(data, pos)
+    ports, pos = _unpack_value(data, pos)
+    udh.headers, pos = _unpack_value(data, pos)
+    if concat is not None:
+        udh.concat = ConcatReference(*concat)
+    if ports is not None:
+        udh.ports = PortAddress(*ports)
+
+    return udh, pos
+
+
+def _unknown_tag(data, pos):
+    raise ValueError("Unknown tag %d at offset %d" % (ord(data[pos - 1]),
+                                                       pos - 1))
+
+
+_UNPACKERS = [_unknown_tag] * 0x100
+_UNPACKERS[T_NONE] = lambda data, pos: (None, pos)
+_UNPACKERS[T_TRUE] = lambda data, pos: (True, pos)
+_UNPACKERS[T_FALSE] = lambda data, pos: (False, pos)
+_UNPACKERS[T_BYTE] = lambda data, pos: (ord(data[pos]), pos + 1)
+_UNPACKERS[T_INT] = lambda data, pos: (_INT.unpack_from(data, pos)[0],
+                                       pos + 8)
+_UNPACKERS[T_FLOAT] = lambda data, pos: (_FLOAT.unpack_from(data, pos)[0],
+                                         pos + 8)
+_UNPACKERS[T_STR] = _unpack_str
+_UNPACKERS[T_STR | LONG] = _unpack_long_str
+_UNPACKERS[T_UNICODE] = _unpack_unicode
+_UNPACKERS[T_UNICODE | LONG] = _unpack_long_unicode
+_UNPACKERS[T_DATETIME] = _unpack_datetime
+_UNPACKERS[T_DATETIME_TZ] = _unpack_datetime_tz
+_UNPACKERS[T_TIMEDELTA] = _unpack_timedelta
+_UNPACKERS[T_LIST] = _unpack_list
+_UNPACKERS[T_LIST | LONG] = _unpack_long_list
+_UNPACKERS[T_TUPLE] = _unpack_tuple
+_UNPACKERS[T_TUPLE | LONG] = _unpack_long_tuple
+_UNPACKERS[T_DICT] = _unpack_dict
+_UNPACKERS[T_DICT | LONG] = _unpack_long_dict
+_UNPACKERS[T_ARRAY] = _unpack_array
+_UNPACKERS[T_UDH] = _unpack_udh
+
+
+def _unpack_value(data, pos):
+    """Returns the value stored at ``pos`` and the position after it"""
+    return _UNPACKERS[ord(data[pos])](data, pos + 1)
+
+
+def _pack_deliver(obj):
+    """Returns ``obj`` with the fixed layout, None if it does not fit"""
+    pdu, csca, number = obj._pdu, obj.csca, obj.number
+    text, date = obj.text, obj.date
+    flags = obj._strict and D_STRICT or 0
+    if obj._keep_pdu:
+        flags |= D_KEEP_PDU
+
+    if pdu is None:
+        flags |= D_NO_PDU
+        pdu = ''
+    if csca is None:
+        flags |= D_NO_CSCA
+        csca = ''
+    if number is None:
+        flags |= D_NO_NUMBER
+        number = ''
+
+    if type(text) is unicode:
+        text = text.encode('utf-8')
+    else:
+        flags |= D_STR_TEXT
+
+    if date is None:
+        flags |= D_NO_DATE
+        date = _NO_DATE
+    elif type(date) is not datetime or date.tzinfo is not None:
+        return None
+    else:
+        date = (date.year, date.month, date.day, date.hour, date.minute,
+                date.second, date.microsecond)
+
+    sr, udh = obj.sr, obj.udh
+    if sr is None and udh is None:
+        flags |= D_NO_EXTRA
+
+    nulls = 0
+    ints = [obj.mtype, obj.pid, obj.dcs, obj.fmt, obj.type]
+    for i, value in enumerate(ints):
+        if value is None:
+            nulls |= 1 << i
+            ints[i] = 0
+        elif type(value) is not int or not 0 <= value <= 0xff:
+            return None
+
+    if (type(pdu) is not str or type(csca) is not str or
+            type(number) is not str or type(text) is not str or
+            len(pdu) > 0xffff or len(csca) > 0xff or
+            len(number) > 0xff or len(text) > 0xffff):
+        return None
+
+    out = [_HEADER.pack(MAGIC, VERSION, SMS_DELIVER_PACKED,
+                        len(FIELDS[SMS_DELIVER])),
+           _DELIVER.pack(flags, nulls, *(ints + list(date) + [
+                         len(pdu), len(csca), len(number), len(text)])),
+           pdu, csca, number, text]
+    if not flags & D_NO_EXTRA:
+        _pack_value(sr, out)
+        _pack_value(udh, out)
+
+    return ''.join(out)
+
+
+def _unpack_deliver(data, pos):
+    """Returns the values of a SMS_DELIVER_PACKED, in FIELDS order"""
+    fields = _DELIVER.unpack_from(data, pos)
+    flags, nulls = fields[0], fields[1]
+    pos += _DELIVER.size
+    end = pos + fields[14]
+    pdu = data[pos:end]
+    pos, end = end, end + fields[15]
+    csca = data[pos:end]
+    pos, end = end, end + fields[16]
+    number = data[pos:end]
+    pos, end = end, end + fields[17]
+    if end > len(data):
+        raise ValueError("Truncated record")
+
+    text = data[pos:end]
+    if not flags & D_STR_TEXT:
+        text = text.decode('utf-8')
+
+    if flags & D_NO_PDU:
+        pdu = None
+    if flags & D_NO_CSCA:
+        csca = None
+    if flags & D_NO_NUMBER:
+        number = None
+
+    date = None
+    if not flags & D_NO_DATE:
+        date = datetime(*fields[7:14])
+
+    mtype, pid, dcs, fmt, type_ = fields[2:7]
+    if nulls:
+        mtype = None if nulls & 0x01 else mtype
+        pid = None if nulls & 0x02 else pid
+        dcs = None if nulls & 0x04 else dcs
+        fmt = None if nulls & 0x08 else fmt
+        type_ = None if nulls & 0x10 else type_
+
+    sr = udh = None
+    if not flags & D_NO_EXTRA:
+        sr, pos = _unpack_value(data, end)
+        udh, pos = _unpack_value(data, pos)
+
+    return [pdu, bool(flags & D_STRICT), bool(flags & D_KEEP_PDU), csca,
+            mtype, number, pid, dcs, fmt, date, type_, text, sr, udh]
+
+
+def _pack_pdus(pdus):
+    """Returns ``pdus`` with the fixed layout, None if they do not fit"""
+    values = []
+    ints = []
+    for p in pdus:
+        if type(p.pdu) is not str or len(p.pdu) > 0xffff:
+            return None
+
+        values.append(len(p.pdu))
+        ints.extend((p.length, p.cnt, p.seq))
+
+    for value in ints:
+        if type(value) is not int or not 0 <= value <= 0xff:
+            return None
+
+    count = len(pdus)
+    layout = '<%dH%dB' % (count, 3 * count)
+    return ''.join([_HEADER.pack(MAGIC, VERSION, PDU_LIST_PACKED, count),
+                    struct.pack(layout, *(values + ints))] +
+                   [p.pdu for p in pdus])
+
+
+def _unpack_pdus(data, pos, count):
+    """Returns the :class:`~messaging.sms.pdu.Pdu` of a PDU_LIST_PACKED"""
+    values = struct.unpack_from('<%dH%dB' % (count, 3 * count), data, pos)
+    pos += 5 * count
+    pdus = []
+    new = Pdu.__new__
+    for i in xrange(count):
+        pdu = new(Pdu)
+        end = pos + values[i]
+        pdu.pdu = data[pos:end]
+        pos = end
+        j = count + 3 * i
+        pdu.length, pdu.cnt, pdu.seq = values[j:j + 3]
+        pdus.append(pdu)
+
+    if pos > len(data):
+        raise ValueError("Truncated record")
+
+    return pdus
+
+
+def _pack_record(kind, values):
+    header = [_HEADER.pack(MAGIC, VERSION, kind, len(values))]
+    out = []
+    pos = _HEADER.size + _OFFSET.size * len(values)
+    for value in values:
+        header.append(_OFFSET.pack(pos))
+        start = len(out)
+        _pack_value(value, out)
+        pos += sum(map(len, out[start:]))
+
+    return ''.join(header + out)
+
+
+def dumps(obj):
+    """
+    Serializes ``obj`` and returns the resulting string
+
+    :param obj: a :class:`~messaging.sms.SmsDeliver`, a
+                :class:`~messaging.sms.SmsSubmit`, a list of
+                :class:`~messaging.sms.pdu.Pdu` objects or a
+                :class:`~messaging.mms.message.MMSMessage`, of which
+                only the headers are serialized
+
+    :raise TypeError: ``obj`` can not be serialized
+    :rtype: str
+    """
+    if isinstance(obj, SmsDeliver):
+        data = _pack_deliver(obj)
+        if data is not None:
+            return data
+
+        kind = SMS_DELIVER
+    elif isinstance(obj, SmsSubmit):
+        kind = SMS_SUBMIT
+    elif isinstance(obj, MMSMessage):
+        keys = tuple(obj.headers)
+        values = [keys] + [obj.headers[key] for key in keys]
+        return _pack_record(MMS_HEADERS, values)
+    elif isinstance(obj, list) and all(isinstance(p, Pdu) for p in obj):
+        data = _pack_pdus(obj)
+        if data is not None:
+            return data
+
+        values = [[(p.pdu, p.length, p.cnt, p.seq) for p in obj]]
+        return _pack_record(PDU_LIST, values)
+    else:
+        raise TypeError("Can not serialize %r" % obj)
+
+    return _pack_record(kind, [getattr(obj, attr, None)
+                               for key, attr in FIELDS[kind]])
+
+
+def _load_deliver(values):
+    obj = SmsDeliver.__new__(SmsDeliver)
+    (obj._pdu, obj._strict, obj._keep_pdu, obj.csca, obj.mtype, obj.number,
+     obj.pid, obj.dcs, obj.fmt, obj.date, obj.type, obj.text, obj.sr,
+     obj.udh) = values
+    return obj
+
+
+def _load_pdus(values):
+    pdus = []
+    new = Pdu.__new__
+    for fields in values:
+        pdu = new(Pdu)
+        pdu.pdu, pdu.length, pdu.cnt, pdu.seq = fields
+        pdus.append(pdu)
+
+    return pdus
+
+
+_DELIVER_PREFIX = _HEADER.pack(MAGIC, VERSION, SMS_DELIVER_PACKED, 0)[:4]
+_PDUS_PREFIX = _HEADER.pack(MAGIC, VERSION, PDU_LIST_PACKED, 0)[:4]
+
+
+def loads(data):
+    """
+    Returns the object serialized in ``data`` by :func:`dumps`
+
+    :raise ValueError: ``data`` is not a valid record
+    """
+    # the fixed layouts are loaded without going through a Record
+    prefix = data[:4]
+    try:
+        if prefix == _DELIVER_PREFIX:
+            return _load_deliver(_unpack_deliver(data, _HEADER.size))
+
+        if prefix == _PDUS_PREFIX:
+            count = _HEADER.unpack_from(data)[3]
+            return _unpack_pdus(data, _HEADER.size, count)
+
+        return Record(data).load()
+    except (struct.error, IndexError):
+        raise ValueError("Truncated record")
+
+
+# the fields of every kind but MMS_HEADERS, whose are in the record
+_KEYS = dict((kind, [key for key, attr in fields])
+             for kind, fields in FIELDS.items())
+_KEYS[PDU_LIST] = ['pdus']
+
+
+class Record(object):
+    """
+    I am a lazy view of a record serialized by :func:`dumps`
+
+    Fields are only decoded when accessed (all at once for the fixed
+    layouts)::
+
+        record = Record(data)
+        if record['number'] == '+34616585119':
+            print record['text']
+    """
+
+    def __init__(self, data, offset=0):
+        """
+        :param data: the buffer holding the record
+        :type data: str
+        :param offset: position of the record in ``data``
+        :type offset: int
+
+        :raise ValueError: ``data`` is not a valid record
+        """
+        try:
+            magic, version, kind, count = _HEADER.unpack_from(data, offset)
+        except struct.error:
+            raise ValueError("Truncated record")
+
+        if magic != MAGIC:
+            raise ValueError("Not a serialized message")
+
+        if version != VERSION:
+            raise ValueError("Unsupported record version: %d" % version)
+
+        if kind not in KINDS:
+            raise ValueError("Unknown record kind: %d" % kind)
+
+        self.data = data
+        self.offset = offset
+        self.kind = KINDS[kind]
+        self.version = version
+        self._layout = kind
+        self._count = count
+        self._keys = _KEYS.get(self.kind)
+        self._values = None
+
+    def _field(self, index):
+        if self._layout != self.kind:
+            # a fixed layout is unpacked at once
+            if self._values is None:
+                self._values = self._fields()
+
+            return self._values[index]
+
+        pos = self.offset + _HEADER.size + _OFFSET.size * index
+        pos = self.offset + _OFFSET.unpack_from(self.data, pos)[0]
+        return _unpack_value(self.data, pos)[0]
+
+    def keys(self):
+        """Returns the names of the fields in this record"""
+        if self._keys is None:
+            self._keys = list(self._field(0))
+
+        return self._keys
+
+    def __contains__(self, key):
+        return key in self.keys()
+
+    def __getitem__(self, key):
+        try:
+            index = self.keys().index(key)
+        except ValueError:
+            raise KeyError(key)
+
+        if self.kind == MMS_HEADERS:
+            index += 1
+
+        return self._field(index)
+
+    def get(self, key, default=None):
+        if key not in self.keys():
+            return default
+
+        return self[key]
+
+    def _fields(self):
+        pos = self.offset + _HEADER.size
+        if self._layout == SMS_DELIVER_PACKED:
+            return _unpack_deliver(self.data, pos)
+
+        if self._layout == PDU_LIST_PACKED:
+            pdus = _unpack_pdus(self.data, pos, self._count)
+            return [[(p.pdu, p.length, p.cnt, p.seq) for p in pdus]]
+
+        # values are stored one after the other, in field order
+        pos = self.offset + _OFFSET.unpack_from(self.data, pos)[0]
+        values = []
+        for i in xrange(self._count):
+            value, pos = _unpack_value(self.data, pos)
+            values.append(value)
+
+        return values
+
+    def load(self):
+        """Returns the serialized object"""
+        if self._layout == PDU_LIST_PACKED:
+            return _unpack_pdus(self.data, self.offset + _HEADER.size,
+                                self._count)
+
+        values = self._fields()
+        if self.kind == PDU_LIST:
+            return _load_pdus(values[0])
+
+        if self.kind == MMS_HEADERS:
+            message = MMSMessage()
+            message.headers = dict(zip(values[0], values[1:]))
+            return message
+
+        if self.kind == SMS_DELIVER:
+            return _load_deliver(values)
+
+        obj = SmsSubmit.__new__(SmsSubmit)
+        for (key, attr), value in zip(FIELDS[self.kind], values):
+            setattr(obj, attr, value)
+
+        return obj
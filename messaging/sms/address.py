@@ -0,0 +1,208 @@
+# See LICENSE
+"""Encoding and normalization of SMS address fields"""
+
+import re
+from threading import Lock
+
+from messaging.utils import LRUCache, clean_number, encode_str
+
+VALID_NUMBER = re.compile("^\+?\d{3,20}$")
+
+# characters people use to make numbers readable
+SEPARATORS = re.compile(r"[\s\-.()/]")
+
+
+def _encode_address(number, smsc):
+    number = clean_number(number)
+    ptype = 0x81  # set to unknown number by default
+    if number[0] == '+':
+        number = number[1:]
+        ptype = 0x91
+
+    digits = len(number)
+    if len(number) % 2:
+        number += 'F'
+
+    ps = chr(ptype)
+    for n in range(0, len(number), 2):
+        num = number[n + 1] + number[n]
+        ps += chr(int(num, 16))
+
+    if smsc:
+        # the SMSC address length counts octets, type included
+        return encode_str(chr(len(ps)) + ps)
+
+    # the destination address length counts digits
+    return encode_str(chr(digits) + ps)
+
+
+class AddressCodec(object):
+    """
+    I encode address fields (length, TON/NPI and BCD digits)
+
+    The most recently encoded addresses are kept in a bounded cache, as
+    messages usually go to a handful of SMSCs and to recipients that
+    show up again and again. I am safe to share between threads.
+    """
+
+    def __init__(self, maxsize=4096):
+        self._phones = LRUCache(maxsize)
+        self._smscs = LRUCache(maxsize)
+        self._lock = Lock()
+
+    def _encode(self, cache, number, smsc):
+        self._lock.acquire()
+        try:
+            ret = cache.get(number)
+        finally:
+            self._lock.release()
+
+        if ret is None:
+            ret = _encode_address(number, smsc)
+            self._lock.acquire()
+            try:
+                cache.set(number, ret)
+            finally:
+                self._lock.release()
+
+        return ret
+
+    def encode_phone(self, number):
+        """
+        Returns the hexadecimal TP-Destination-Address for ``number``
+
+        :param number: the recipient number, already validated
+        :type number: str
+        :rtype: str
+        """
+        return self._encode(self._phones, number, False)
+
+    def encode_smsc(self, number):
+        """
+        Returns the hexadecimal SMSC address field for ``number``
+
+        "00" is returned if ``number`` is empty, so the phone uses the
+        SMSC that is configured in the SIM.
+
+        :param number: the SMSC number, already validated
+        :type number: str
+        :rtype: str
+        """
+        if not number or not number.strip():
+            return "00"
+
+        return self._encode(self._smscs, number, True)
+
+    def clear(self):
+        """Empties the caches"""
+        self._lock.acquire()
+        try:
+            self._phones.clear()
+            self._smscs.clear()
+        finally:
+            self._lock.release()
+
+
+_codec = AddressCodec()
+
+encode_phone_address = _codec.encode_phone
+encode_smsc_address = _codec.encode_smsc
+
+
+def _to_international(number, country_code, international_prefix,
+                      trunk_prefix):
+    if number.startswith('+'):
+        return number
+
+    if international_prefix and number.startswith(international_prefix):
+        return '+' + number[len(international_prefix):]
+
+    if trunk_prefix and number.startswith(trunk_prefix):
+        number = number[len(trunk_prefix):]
+
+    return '+' + country_code + number
+
+
+def normalize_number(number, country_code=None, international_prefix='00',
+                     trunk_prefix='0'):
+    """
+    Returns ``number`` without separators, or None if it is not valid
+
+    Spaces, dashes, dots, slashes and parentheses are removed and the
+    result must match :data:`VALID_NUMBER`, like the numbers accepted
+    by :class:`~messaging.sms.SmsSubmit`.
+
+    If ``country_code`` is given the number is also converted to the
+    E.164 format (+<country code><number>): ``international_prefix`` is
+    replaced with a +, and the national numbers lose their
+    ``trunk_prefix`` and get ``country_code`` in front. Otherwise the
+    numbers are left as they were written, without separators.
+
+    :param number: the number to normalize
+    :type number: str
+    :param country_code: the country code of the national numbers,
+                         e.g. '34'
+    :type country_code: str
+    :param international_prefix: the prefix to call abroad
+    :type international_prefix: str
+    :param trunk_prefix: the prefix to call within the country, if any
+    :type trunk_prefix: str
+    :rtype: str
+    """
+    number = SEPARATORS.sub('', number)
+    if not VALID_NUMBER.match(number):
+        return None
+
+    if country_code is None:
+        return number
+
+    number = _to_international(number, country_code.lstrip('+'),
+                               international_prefix, trunk_prefix)
+    if VALID_NUMBER.match(number):
+        return number
+
+    return None
+
+
+def normalize_numbers(numbers, country_code=None, international_prefix='00',
+                      trunk_prefix='0'):
+    """
+    Normalizes and validates a list of numbers at once
+
+    The separators are removed from all the numbers in a single pass,
+    which is much faster than calling :func:`normalize_number` on every
+    item of a large recipient list. The other parameters are the ones
+    of :func:`normalize_number`.
+
+    :param numbers: the numbers to normalize
+    :type numbers: list
+
+    :return: a tuple with the list of (index, number) tuples of the
+             normalized numbers and the list of (index, number) tuples of
+             the numbers that are not valid, both in input order
+    :rtype: tuple
+    """
+    numbers = list(numbers)
+    joined = '\0'.join(numbers)
+    if joined.count('\0') == len(numbers) - 1:
+        cleaned = SEPARATORS.sub('', joined).split('\0')
+    else:
+        # some number has a NUL byte, it can't be split back
+        cleaned = [SEPARATORS.sub('', number) for number in numbers]
+
+    if country_code is not None:
+        country_code = country_code.lstrip('+')
+
+    match = VALID_NUMBER.match
+    valid, invalid = [], []
+    for i, number in enumerate(cleaned):
+        if match(number) and country_code is not None:
+            number = _to_international(number, country_code,
+                                       international_prefix, trunk_prefix)
+
+        if match(number):
+            valid.append((i, number))
+        else:
+            invalid.append((i, numbers[i]))
+
+    return valid, invalid
@@ -1,7 +1,12 @@
 # see LICENSE
 
+from messaging.utils import SlotsPickleMixin
 
-class SmsBase(object):
+
+class SmsBase(SlotsPickleMixin):
+
+    __slots__ = ('udh', 'number', 'text', 'fmt', 'dcs', 'pid', 'csca',
+                 'type')
 
     def __init__(self):
         self.udh = None
@@ -0,0 +1,264 @@
+# See LICENSE
+"""Bulk decoding of files of hexadecimal SMS PDUs"""
+
+from collections import deque
+import csv
+from datetime import datetime
+from itertools import islice
+import json
+import multiprocessing
+from optparse import OptionParser
+import sys
+
+from messaging.sms.deliver import SmsDeliver
+
+FIELDS = ('text', 'pid', 'dcs', 'csca', 'number', 'type', 'date', 'fmt',
+          'sr', 'ref', 'cnt', 'seq')
+
+FORMATS = ('jsonl', 'csv')
+
+
+def _to_plain(value):
+    """Converts ``value`` to something that can be serialised as JSON"""
+    if isinstance(value, datetime):
+        return value.isoformat()
+
+    if isinstance(value, str):
+        # 8bit payloads and numbers: keep every byte
+        return value.decode('latin-1')
+
+    if isinstance(value, dict):
+        return dict((k, _to_plain(v)) for k, v in value.items())
+
+    return value
+
+
+def decode_chunk(args):
+    """
+    Decodes a chunk of numbered PDU lines
+
+    This runs in the worker processes, hence it only returns plain data.
+
+    :param args: a tuple (<list:[(lineno, pdu), ...]>, <bool:strict>)
+    :type args: tuple
+
+    :return: a list of (lineno, pdu, data, error) tuples, where either
+             ``data`` is a dict with the decoded fields or ``error`` is a
+             string describing why the PDU could not be decoded
+    :rtype: list
+    """
+    chunk, strict = args
+    ret = []
+    for lineno, pdu in chunk:
+        try:
+            data = SmsDeliver(pdu, strict=strict, keep_pdu=False).data
+        except Exception, e:
+            ret.append((lineno, pdu, None, '%s: %s' % (type(e).__name__, e)))
+        else:
+            ret.append((lineno, pdu, _to_plain(data), None))
+
+    return ret
+
+
+def _read_chunks(lines, chunksize):
+    numbered = ((i, line.strip()) for i, line in enumerate(lines))
+    numbered = ((i + 1, line) for i, line in numbered if line)
+    while True:
+        chunk = list(islice(numbered, chunksize))
+        if not chunk:
+            return
+
+        yield chunk
+
+
+def _decode_chunks(chunks, processes, strict):
+    """
+    Decodes the tagged ``chunks`` across a pool of processes
+
+    :param chunks: an iterable of (tag, chunk) tuples
+    :return: an iterator of (tag, results) tuples, in input order
+    """
+    if processes == 1:
+        for tag, chunk in chunks:
+            yield tag, decode_chunk((chunk, strict))
+        return
+
+    pool = multiprocessing.Pool(processes)
+    try:
+        pending = deque()
+        max_pending = 2 * (processes or multiprocessing.cpu_count())
+        for tag, chunk in chunks:
+            result = pool.apply_async(decode_chunk, ((chunk, strict),))
+            pending.append((tag, result))
+            if len(pending) >= max_pending:
+                tag, result = pending.popleft()
+                yield tag, result.get()
+
+        while pending:
+            tag, result = pending.popleft()
+            yield tag, result.get()
+
+        pool.close()
+    finally:
+        pool.terminate()
+        pool.join()
+
+
+def _read_files(paths, chunksize):
+    for path in paths:
+        f = open(path)
+        try:
+            for chunk in _read_chunks(f, chunksize):
+                yield path, chunk
+        finally:
+            f.close()
+
+
+def iter_decoded(lines, processes=None, chunksize=512, strict=True):
+    """
+    Decodes the PDUs in ``lines`` across a pool of processes
+
+    Results are yielded in input order, blank lines are skipped. At most
+    two chunks per process are in flight at any time, so arbitrarily
+    large inputs can be decoded in bounded memory.
+
+    :param lines: an iterable of hexadecimal PDUs, one per item
+    :param processes: number of worker processes, defaults to the number
+                      of CPUs. If 1, the PDUs are decoded in this process
+    :type processes: int
+    :param chunksize: number of PDUs sent to a worker at once
+    :type chunksize: int
+
+    :return: an iterator of (lineno, pdu, data, error) tuples, see
+             :func:`decode_chunk`
+    """
+    chunks = ((None, chunk) for chunk in _read_chunks(lines, chunksize))
+    for tag, results in _decode_chunks(chunks, processes, strict):
+        for result in results:
+            yield result
+
+
+class _JsonLinesWriter(object):
+
+    def __init__(self, f):
+        self.f = f
+
+    def write(self, data):
+        self.f.write(json.dumps(data, sort_keys=True))
+        self.f.write('\n')
+
+
+class _CsvWriter(object):
+
+    def __init__(self, f):
+        self.writer = csv.writer(f)
+        self.writer.writerow(FIELDS)
+
+    def write(self, data):
+        row = []
+        for field in FIELDS:
+            value = data.get(field)
+            if value is None:
+                value = ''
+            elif isinstance(value, dict):
+                value = json.dumps(value, sort_keys=True)
+            elif isinstance(value, unicode):
+                value = value.encode('utf-8')
+
+            row.append(value)
+
+        self.writer.writerow(row)
+
+
+def decode_files(paths, output, fmt='jsonl', rejects=None, processes=None,
+                 chunksize=512, strict=True):
+    """
+    Decodes the PDU files in ``paths`` and writes the results to ``output``
+
+    Every file is decoded by the same pool of processes, the chunks of
+    the next file are sent to it while the last ones of the previous
+    file are still being decoded.
+
+    :param paths: the files to decode, with a PDU per line
+    :type paths: list
+    :param output: file object where the decoded messages are written
+    :param fmt: output format, either 'jsonl' (JSON Lines) or 'csv'
+    :type fmt: str
+    :param rejects: optional file object where the PDUs that could not
+                    be decoded are written, as tab-separated
+                    <path> <lineno> <pdu> <error> lines
+    :param processes: see :func:`iter_decoded`
+    :param chunksize: see :func:`iter_decoded`
+
+    :raise ValueError: ``fmt`` is not supported
+
+    :return: the number of decoded and rejected PDUs
+    :rtype: tuple
+    """
+    if fmt == 'jsonl':
+        writer = _JsonLinesWriter(output)
+    elif fmt == 'csv':
+        writer = _CsvWriter(output)
+    else:
+        raise ValueError("Unknown output format: %s" % fmt)
+
+    decoded = rejected = 0
+    chunks = _read_files(paths, chunksize)
+    for path, results in _decode_chunks(chunks, processes, strict):
+        for lineno, pdu, data, error in results:
+            if error is None:
+                writer.write(data)
+                decoded += 1
+                continue
+
+            rejected += 1
+            if rejects is not None:
+                rejects.write('%s\t%d\t%s\t%s\n' % (path, lineno, pdu, error))
+
+    return decoded, rejected
+
+
+def main(argv=None):
+    """Entry point of the ``messaging-decode`` command"""
+    parser = OptionParser(usage="%prog [options] FILE...",
+                          description="Decode files of hexadecimal SMS "
+                                      "PDUs, one per line")
+    parser.add_option('-o', '--output', help="output file (default: stdout)")
+    parser.add_option('-f', '--format', default='jsonl', choices=FORMATS,
+                      help="output format: jsonl or csv (default: jsonl)")
+    parser.add_option('-r', '--rejects',
+                      help="file where undecodable PDUs are written")
+    parser.add_option('-j', '--jobs', type='int',
+                      help="number of worker processes (default: CPUs)")
+    parser.add_option('-c', '--chunk-size', type='int', default=512,
+                      help="PDUs per worker task (default: 512)")
+    parser.add_option('--no-strict', action='store_false', dest='strict',
+                      default=True, help="decode odd-length PDUs")
+    options, paths = parser.parse_args(argv)
+    if not paths:
+        parser.error("no input files")
+
+    output = sys.stdout
+    if options.output:
+        output = open(options.output, 'wb')
+
+    rejects = None
+    if options.rejects:
+        rejects = open(options.rejects, 'w')
+
+    try:
+        decoded, rejected = decode_files(paths, output, options.format,
+                                         rejects, options.jobs,
+                                         options.chunk_size, options.strict)
+    finally:
+        if output is not sys.stdout:
+            output.close()
+        if rejects is not None:
+            rejects.close()
+
+    sys.stderr.write("%d decoded, %d rejected\n" % (decoded, rejected))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
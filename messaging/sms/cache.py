@@ -0,0 +1,189 @@
+# See LICENSE
+"""Caching of decoded SMS and detection of duplicated deliveries"""
+
+from array import array
+from hashlib import sha1
+from math import ceil, log
+import struct
+import time
+
+from messaging.sms.deliver import SmsDeliver
+from messaging.utils import LRUCache
+
+
+def pdu_digest(pdu):
+    """Returns the key used to identify ``pdu`` in the caches"""
+    return sha1(pdu.upper()).digest()
+
+
+class BloomFilter(object):
+    """
+    I am a fixed-size probabilistic set of digests
+
+    Membership tests can return false positives with a probability of
+    roughly ``error_rate`` once ``capacity`` items have been added, but
+    never false negatives.
+    """
+
+    def __init__(self, capacity, error_rate=0.001):
+        if capacity < 1:
+            raise ValueError("capacity must be a positive integer")
+
+        if not 0 < error_rate < 1:
+            raise ValueError("error_rate must be between 0 and 1")
+
+        nbits = -capacity * log(error_rate) / (log(2) ** 2)
+        self.nbits = int(ceil(nbits))
+        self.nhashes = max(1, int(round(self.nbits * log(2) / capacity)))
+        self._bits = array('B', [0]) * (self.nbits // 8 + 1)
+
+    def _positions(self, digest):
+        h1, h2 = struct.unpack('>QQ', digest[:16])
+        for i in range(self.nhashes):
+            yield (h1 + i * h2) % self.nbits
+
+    def add(self, digest):
+        """Adds ``digest`` (at least 16 bytes long) to the filter"""
+        bits = self._bits
+        for pos in self._positions(digest):
+            bits[pos >> 3] |= 1 << (pos & 7)
+
+    def __contains__(self, digest):
+        bits = self._bits
+        for pos in self._positions(digest):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+
+        return True
+
+
+class SmsDeliverCache(object):
+    """
+    I am a bounded cache of decoded :class:`~messaging.sms.SmsDeliver`
+
+    Decoded messages are kept in a LRU keyed on the digest of the raw
+    PDU, so a PDU that is delivered more than once is only decoded once.
+
+    If ``window`` (in seconds) is set, :func:`receive` will also flag the
+    PDUs already seen within that time window. When ``bloom_capacity`` is
+    set, a pair of rotating Bloom filters remembers the PDUs seen in the
+    current and previous window (windows start at multiples of
+    ``window``) even after they have been evicted from the LRU, keeping
+    duplicate detection memory-bounded.
+    """
+
+    def __init__(self, maxsize=1024, window=None, bloom_capacity=None,
+                 error_rate=0.001, strict=True, clock=time.time):
+        self.window = window
+        self.strict = strict
+        self.hits = 0
+        self.misses = 0
+        self.duplicates = 0
+
+        self._clock = clock
+        self._lru = LRUCache(maxsize)
+        self._bloom_capacity = bloom_capacity
+        self._error_rate = error_rate
+        self._bloom = self._old_bloom = None
+        self._bloom_start = None
+        if bloom_capacity and window is not None:
+            self._bloom = BloomFilter(bloom_capacity, error_rate)
+            self._bloom_start = self._window_start(clock())
+
+    def __len__(self):
+        return len(self._lru)
+
+    def _window_start(self, now):
+        return now - now % self.window
+
+    def _rotate(self, now):
+        elapsed = now - self._bloom_start
+        if elapsed < self.window:
+            return
+
+        if elapsed < 2 * self.window:
+            self._old_bloom = self._bloom
+        else:
+            # nothing was received in the previous window
+            self._old_bloom = None
+
+        self._bloom = BloomFilter(self._bloom_capacity, self._error_rate)
+        self._bloom_start = self._window_start(now)
+
+    @property
+    def stats(self):
+        """Returns a dict with the cache counters"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'duplicates': self.duplicates,
+            'size': len(self._lru),
+        }
+
+    def _lookup(self, pdu):
+        key = pdu_digest(pdu)
+        entry = self._lru.get(key)
+        if entry is not None:
+            self.hits += 1
+            return key, entry
+
+        self.misses += 1
+        entry = [SmsDeliver(pdu, strict=self.strict), None]
+        self._lru.set(key, entry)
+        return key, entry
+
+    def decode(self, pdu):
+        """
+        Returns the :class:`~messaging.sms.SmsDeliver` for ``pdu``
+
+        The same object is returned for every copy of ``pdu`` still held
+        in the cache.
+
+        :raise ValueError: ``pdu`` could not be decoded
+        """
+        return self._lookup(pdu)[1][0]
+
+    def receive(self, pdu):
+        """
+        Decodes ``pdu`` and tells whether it is a duplicated delivery
+
+        A delivery is considered duplicated if the same PDU was received
+        less than ``window`` seconds ago. Duplicates are counted in
+        ``duplicates`` and can be discarded by the caller.
+
+        :return: a tuple (<SmsDeliver>, <bool:duplicate>)
+        :rtype: tuple
+        """
+        key, entry = self._lookup(pdu)
+        sms, first_seen = entry
+        if self.window is None:
+            return sms, False
+
+        now = self._clock()
+        if self._bloom is not None:
+            self._rotate(now)
+
+        if first_seen is not None:
+            duplicate = now - first_seen <= self.window
+        elif self._bloom is not None:
+            # not in the LRU (or evicted from it), but it might still
+            # have been seen within the window
+            duplicate = (key in self._bloom or
+                         (self._old_bloom is not None and
+                          key in self._old_bloom))
+        else:
+            duplicate = False
+
+        if not duplicate or first_seen is None:
+            entry[1] = now
+            if self._bloom is not None:
+                self._bloom.add(key)
+
+        if duplicate:
+            self.duplicates += 1
+
+        return sms, duplicate
+
+    def clear(self):
+        """Empties the cache; the counters are left untouched"""
+        self._lru.clear()
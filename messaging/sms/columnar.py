@@ -0,0 +1,388 @@
+# See LICENSE
+"""Columnar storage of decoded SMS for bulk analysis"""
+
+from __future__ import with_statement
+from array import array
+from calendar import timegm
+from datetime import datetime
+import mmap
+import struct
+import sys
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from messaging.sms.deliver import SmsDeliver
+
+MAGIC = 'PMSC'
+VERSION = 1
+
+# name, array typecode, value used for None
+INT_COLUMNS = (
+    ('dcs', 'h', -1),
+    ('pid', 'h', -1),
+    ('fmt', 'h', -1),
+    ('type', 'h', -1),
+    ('date', 'd', float('nan')),
+    ('ref', 'i', -1),
+    ('cnt', 'h', -1),
+    ('seq', 'h', -1),
+)
+
+STR_COLUMNS = ('number', 'csca', 'text')
+
+_HEADER = struct.Struct('<4sBBxxQ')
+_COLUMN = struct.Struct('<16sc7xQ')
+_BYTEORDER = {'little': 0, 'big': 1}
+
+
+def _align(n):
+    return (n + 7) & ~7
+
+
+class MappedArray(object):
+    """
+    I am a read-only array backed by a buffer, typically a mmap
+
+    Items are only read from the buffer when accessed.
+    """
+
+    def __init__(self, buf, offset, count, typecode, byteorder=sys.byteorder):
+        self._buf = buf
+        self._offset = offset
+        self._count = count
+        self.typecode = typecode
+        prefix = '<' if byteorder == 'little' else '>'
+        self._struct = struct.Struct(prefix + typecode)
+        self.itemsize = self._struct.size
+
+    def __len__(self):
+        return self._count
+
+    def __getitem__(self, i):
+        if i < 0:
+            i += self._count
+
+        if not 0 <= i < self._count:
+            raise IndexError("index out of range")
+
+        pos = self._offset + i * self.itemsize
+        return self._struct.unpack_from(self._buf, pos)[0]
+
+    def __iter__(self):
+        for i in xrange(self._count):
+            yield self[i]
+
+    def tolist(self):
+        return list(self)
+
+
+class _MappedBytes(object):
+    """Read-only byte string view over a region of a buffer"""
+
+    def __init__(self, buf, offset, length):
+        self._buf = buf
+        self._offset = offset
+        self._length = length
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, s):
+        start, stop, stride = s.indices(self._length)
+        return self._buf[self._offset + start:self._offset + stop]
+
+
+class StringColumn(object):
+    """
+    I am a column of strings stored in a single contiguous buffer
+
+    The string in row ``i`` is ``data[offsets[i]:offsets[i + 1]]``,
+    encoded in UTF-8 unless it was a byte string (8bit payloads).
+    """
+
+    def __init__(self, offsets=None, data=None, nulls=None):
+        self.offsets = array('I', [0]) if offsets is None else offsets
+        self.data = bytearray() if data is None else data
+        self.nulls = array('B') if nulls is None else nulls
+
+    def __len__(self):
+        return len(self.nulls)
+
+    def append(self, value):
+        if value is None:
+            self.nulls.append(1)
+        else:
+            if isinstance(value, unicode):
+                value = value.encode('utf-8')
+            self.data.extend(value)
+            self.nulls.append(0)
+
+        self.offsets.append(len(self.data))
+
+    def get_bytes(self, i):
+        """Returns the raw bytes of row ``i``, or None"""
+        if self.nulls[i]:
+            return None
+
+        return str(self.data[self.offsets[i]:self.offsets[i + 1]])
+
+    def __getitem__(self, i):
+        value = self.get_bytes(i)
+        if value is None:
+            return None
+
+        return value.decode('utf-8')
+
+    @property
+    def nbytes(self):
+        return (len(self.data) + len(self.nulls) +
+                len(self.offsets) * self.offsets.itemsize)
+
+
+class SmsColumns(object):
+    """
+    I am a batch of decoded SMS stored in typed columns
+
+    Numeric fields are stored in :class:`array.array` columns, with -1
+    (NaN for ``date``) standing for None, while the number, SMSC and text
+    are stored in :class:`StringColumn` objects. ``date`` is stored as
+    seconds since the epoch, in UTC.
+
+    Rows are appended from PDUs or :class:`~messaging.sms.SmsDeliver`
+    objects, so no per-message Python object graph is kept around.
+    """
+
+    def __init__(self):
+        self.columns = {}
+        for name, typecode, null in INT_COLUMNS:
+            self.columns[name] = array(typecode)
+
+        for name in STR_COLUMNS:
+            self.columns[name] = StringColumn()
+
+        self.errors = 0
+        self._mmap = None
+
+    def __len__(self):
+        return len(self.columns['dcs'])
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    @classmethod
+    def from_pdus(cls, pdus, strict=True):
+        """
+        Returns a new :class:`SmsColumns` with the decoded ``pdus``
+
+        PDUs that can not be decoded are skipped and counted in ``errors``
+        """
+        columns = cls()
+        columns.extend(pdus, strict)
+        return columns
+
+    def extend(self, pdus, strict=True):
+        """Decodes and appends the hexadecimal ``pdus``"""
+        for pdu in pdus:
+            try:
+                sms = SmsDeliver(pdu, strict=strict, keep_pdu=False)
+            except Exception:
+                self.errors += 1
+            else:
+                self.append(sms)
+
+    def append(self, sms):
+        """Appends the decoded :class:`~messaging.sms.SmsDeliver` ``sms``"""
+        if self._mmap is not None:
+            raise TypeError("memory-mapped columns are read-only")
+
+        columns = self.columns
+        for name in ('dcs', 'pid', 'fmt', 'type'):
+            value = getattr(sms, name)
+            columns[name].append(-1 if value is None else value)
+
+        if sms.date is None:
+            columns['date'].append(float('nan'))
+        else:
+            columns['date'].append(timegm(sms.date.utctimetuple()))
+
+        concat = sms.udh is not None and sms.udh.concat or None
+        if concat is None:
+            ref = cnt = seq = -1
+        else:
+            ref, cnt, seq = concat.ref, concat.cnt, concat.seq
+
+        columns['ref'].append(ref)
+        columns['cnt'].append(cnt)
+        columns['seq'].append(seq)
+
+        columns['number'].append(sms.number)
+        columns['csca'].append(sms.csca)
+        columns['text'].append(sms.text)
+
+    def row(self, i):
+        """Returns row ``i`` as a dict, like :attr:`SmsDeliver.data`"""
+        ret = {}
+        for name, typecode, null in INT_COLUMNS:
+            value = self.columns[name][i]
+            if value == null or value != value:
+                value = None
+            ret[name] = value
+
+        if ret['date'] is not None:
+            ret['date'] = datetime.utcfromtimestamp(ret['date'])
+
+        for name in ('ref', 'cnt', 'seq'):
+            if ret[name] is None:
+                del ret[name]
+
+        ret['number'] = self.columns['number'][i]
+        ret['csca'] = self.columns['csca'][i]
+        if ret['fmt'] == 0x04:
+            ret['text'] = self.columns['text'].get_bytes(i)
+        else:
+            ret['text'] = self.columns['text'][i]
+
+        return ret
+
+    @property
+    def nbytes(self):
+        """Approximate size in bytes of the column buffers"""
+        total = 0
+        for name, typecode, null in INT_COLUMNS:
+            column = self.columns[name]
+            total += len(column) * column.itemsize
+
+        for name in STR_COLUMNS:
+            total += self.columns[name].nbytes
+
+        return total
+
+    def to_numpy(self):
+        """
+        Returns a dict of :mod:`numpy` arrays with the numeric columns
+
+        The arrays share memory with the columns whenever possible.
+
+        :raise ImportError: numpy is not installed
+        """
+        if numpy is None:
+            raise ImportError("numpy is required for to_numpy")
+
+        ret = {}
+        for name, typecode, null in INT_COLUMNS:
+            column = self.columns[name]
+            dtype = numpy.dtype(typecode)
+            if isinstance(column, MappedArray):
+                ret[name] = numpy.frombuffer(column._buf, dtype,
+                                             len(column), column._offset)
+            else:
+                ret[name] = numpy.frombuffer(column, dtype)
+
+        return ret
+
+    def _buffers(self):
+        for name, typecode, null in INT_COLUMNS:
+            column = self.columns[name]
+            yield name, typecode, len(column), column
+
+        for name in STR_COLUMNS:
+            column = self.columns[name]
+            yield name + '.off', 'I', len(column.offsets), column.offsets
+            yield name + '.nul', 'B', len(column.nulls), column.nulls
+            yield name + '.dat', 'B', len(column.data), column.data
+
+    def save(self, filename):
+        """
+        Writes the columns to ``filename`` in a compact binary format
+
+        The file holds a header followed by every column buffer, aligned
+        to 8 bytes, so it can be memory-mapped back with :func:`load`.
+        """
+        with open(filename, 'wb') as f:
+            f.write(_HEADER.pack(MAGIC, VERSION, _BYTEORDER[sys.byteorder],
+                                 len(self)))
+            for name, typecode, count, buf in self._buffers():
+                if isinstance(buf, MappedArray):
+                    buf = array(typecode, buf)
+
+                nbytes = count * struct.calcsize(typecode)
+                f.write(_COLUMN.pack(name, typecode, nbytes))
+                if isinstance(buf, bytearray):
+                    f.write(buf)
+                else:
+                    buf.tofile(f)
+
+                f.write('\0' * (_align(nbytes) - nbytes))
+
+    @classmethod
+    def load(cls, filename, use_mmap=True):
+        """
+        Loads the columns stored in ``filename`` by :func:`save`
+
+        :param use_mmap: If True, the file is memory-mapped and the
+                         columns read from it on demand (read-only).
+                         Otherwise the columns are read into memory.
+        :type use_mmap: bool
+
+        :raise ValueError: ``filename`` is not a valid columns file
+        """
+        with open(filename, 'rb') as f:
+            if use_mmap:
+                buf = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            else:
+                buf = f.read()
+
+        if len(buf) < _HEADER.size:
+            raise ValueError("Not a SMS columns file: %s" % filename)
+
+        magic, version, byteorder, rows = _HEADER.unpack_from(buf, 0)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError("Not a SMS columns file: %s" % filename)
+
+        byteorder = byteorder and 'big' or 'little'
+        swap = byteorder != sys.byteorder and not use_mmap
+        raw = {}
+        pos = _HEADER.size
+        while pos < len(buf):
+            name, typecode, nbytes = _COLUMN.unpack_from(buf, pos)
+            name = name.rstrip('\0')
+            pos += _COLUMN.size
+            count = nbytes // struct.calcsize(typecode)
+            if name.endswith('.dat') and not use_mmap:
+                raw[name] = bytearray(buf[pos:pos + nbytes])
+            elif name.endswith('.dat'):
+                raw[name] = _MappedBytes(buf, pos, nbytes)
+            elif use_mmap:
+                raw[name] = MappedArray(buf, pos, count, typecode, byteorder)
+            else:
+                column = array(typecode)
+                column.fromstring(buf[pos:pos + nbytes])
+                if swap:
+                    column.byteswap()
+                raw[name] = column
+
+            pos += _align(nbytes)
+
+        columns = cls()
+        for name, typecode, null in INT_COLUMNS:
+            columns.columns[name] = raw[name]
+
+        for name in STR_COLUMNS:
+            columns.columns[name] = StringColumn(raw[name + '.off'],
+                                                 raw[name + '.dat'],
+                                                 raw[name + '.nul'])
+
+        if use_mmap:
+            columns._mmap = buf
+
+        return columns
+
+    def close(self):
+        """Releases the memory map of a :func:`load`-ed file, if any"""
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+
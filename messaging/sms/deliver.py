@@ -13,10 +13,23 @@ from messaging.sms.udh import UserDataHeader
 class SmsDeliver(SmsBase):
     """I am a delivered SMS in your Inbox"""
 
-    def __init__(self, pdu, strict=True):
+    __slots__ = ('_pdu', '_strict', '_keep_pdu', 'date', 'mtype', 'sr')
+
+    def __init__(self, pdu, strict=True, keep_pdu=True):
+        """
+        :param pdu: the hexadecimal PDU to decode
+        :type pdu: str
+        :param strict: If False, odd-length PDUs are decoded too
+        :type strict: bool
+        :param keep_pdu: If False, the PDU is not kept after decoding
+                         it and :attr:`pdu` returns None. Saves memory
+                         when lots of messages are held at once
+        :type keep_pdu: bool
+        """
         super(SmsDeliver, self).__init__()
         self._pdu = None
         self._strict = strict
+        self._keep_pdu = keep_pdu
         self.date = None
         self.mtype = None
         self.sr = None
@@ -63,9 +76,10 @@ class SmsDeliver(SmsBase):
             raise ValueError("Can not decode an odd-length pdu")
 
         # XXX: Should we keep the original PDU or the modified one?
-        self._pdu = pdu
+        if self._keep_pdu:
+            self._pdu = pdu
 
-        data = to_array(self._pdu)
+        data = to_array(pdu)
 
         # Service centre address
         smscl = data.pop(0)
@@ -1,7 +1,11 @@
 # see LICENSE
 
+from messaging.utils import SlotsPickleMixin
 
-class Pdu(object):
+
+class Pdu(SlotsPickleMixin):
+
+    __slots__ = ('pdu', 'length', 'cnt', 'seq')
 
     def __init__(self, pdu, len_smsc, cnt=1, seq=1):
         self.pdu = pdu.upper()
@@ -2,24 +2,27 @@
 """Classes for sending SMS"""
 
 from datetime import datetime, timedelta
-import re
 
 from messaging.sms import consts
-from messaging.utils import (debug, encode_str, clean_number,
+from messaging.utils import (debug, encode_str,
                              pack_8bits_to_ucs2, pack_8bits_to_7bits,
                              pack_8bits_to_8bit,
                              timedelta_to_relative_validity,
                              datetime_to_absolute_validity)
+from messaging.sms.address import (VALID_NUMBER, encode_phone_address,
+                                   encode_smsc_address)
 from messaging.sms.base import SmsBase
 from messaging.sms.gsm0338 import is_gsm_text
 from messaging.sms.pdu import Pdu
-
-VALID_NUMBER = re.compile("^\+?\d{3,20}$")
+from messaging.sms.udh import ConcatReference, PortAddress, UserDataHeader
 
 
 class SmsSubmit(SmsBase):
     """I am a SMS ready to be sent"""
 
+    __slots__ = ('_number', '_csca', '_klass', '_validity', '_next_id',
+                 'request_status', 'ref', 'rand_id', 'msgvp', 'text_gsm')
+
     def __init__(self, number, text):
         super(SmsSubmit, self).__init__()
         self._number = None
@@ -29,7 +32,7 @@ class SmsSubmit(SmsBase):
         self.request_status = False
         self.ref = None
         self.rand_id = None
-        self.id_list = range(0, 255)
+        self._next_id = 0
         self.msgvp = 0xaa
         self.pid = 0x00
 
@@ -73,6 +76,36 @@ class SmsSubmit(SmsBase):
 
     klass = property(lambda self: self._klass, _set_klass)
 
+    def _get_ports(self):
+        if self.udh is None:
+            return None
+
+        return self.udh.ports
+
+    def _set_ports(self, ports):
+        if ports is not None and not isinstance(ports, PortAddress):
+            dest_port, orig_port = ports
+            eight_bits = dest_port < 256 and orig_port < 256
+            ports = PortAddress(dest_port, orig_port, eight_bits)
+
+        if self.udh is None:
+            if ports is None:
+                return
+
+            self.udh = UserDataHeader()
+
+        self.udh.ports = ports
+
+    ports = property(_get_ports, _set_ports,
+                     doc="The application port addressing, set as a "
+                         "(destination, originator) tuple. Port addressed "
+                         "messages are sent as 8-bit data")
+
+    @property
+    def id_list(self):
+        """The references that :meth:`_get_rand_id` has not returned yet"""
+        return range(self._next_id, 255)
+
     def to_pdu(self):
         """Returns a list of :class:`~messaging.pdu.Pdu` objects"""
         smsc_pdu = self._get_smsc_pdu()
@@ -83,6 +116,9 @@ class SmsSubmit(SmsBase):
         sms_msg_pdu = self._get_msg_pdu()
 
         if len(sms_msg_pdu) == 1:
+            if self.ports is not None:
+                sms_submit_pdu = self._get_sms_submit_pdu(udh=True)
+
             pdu = smsc_pdu
             len_smsc = len(smsc_pdu) / 2
             pdu += sms_submit_pdu
@@ -130,27 +166,7 @@ class SmsSubmit(SmsBase):
         return pdu_list
 
     def _get_smsc_pdu(self):
-        if not self.csca or not self.csca.strip():
-            return "00"
-
-        number = clean_number(self.csca)
-        ptype = 0x81  # set to unknown number by default
-        if number[0] == '+':
-            number = number[1:]
-            ptype = 0x91
-
-        if len(number) % 2:
-            number += 'F'
-
-        ps = chr(ptype)
-        for n in range(0, len(number), 2):
-            num = number[n + 1] + number[n]
-            ps += chr(int(num, 16))
-
-        pl = len(ps)
-        ps = chr(pl) + ps
-
-        return encode_str(ps)
+        return encode_smsc_address(self.csca)
 
     def _get_tpmessref_pdu(self):
         if self.ref is None:
@@ -160,23 +176,7 @@ class SmsSubmit(SmsBase):
         return encode_str(chr(self.ref))
 
     def _get_phone_pdu(self):
-        number = clean_number(self.number)
-        ptype = 0x81
-        if number[0] == '+':
-            number = number[1:]
-            ptype = 0x91
-
-        pl = len(number)
-        if len(number) % 2:
-            number += 'F'
-
-        ps = chr(ptype)
-        for n in range(0, len(number), 2):
-            num = number[n + 1] + number[n]
-            ps += chr(int(num, 16))
-
-        ps = chr(pl) + ps
-        return encode_str(ps)
+        return encode_phone_address(self.number)
 
     def _get_tppid_pdu(self):
         return encode_str(chr(self.pid))
@@ -203,6 +203,13 @@ class SmsSubmit(SmsBase):
 
     def _get_msg_pdu(self):
         # Data coding scheme
+        if self.ports is not None:
+            if self.fmt is None:
+                self.fmt = 0x04
+            elif self.fmt != 0x04:
+                raise ValueError("Port addressing is only supported for "
+                                 "8-bit data")
+
         if self.fmt is None:
             if is_gsm_text(self.text):
                 self.fmt = 0x00
@@ -249,8 +256,14 @@ class SmsSubmit(SmsBase):
             else:
                 message_pdu = self._split_sms_message(self.text_gsm)
         elif self.fmt == 0x04:
-            if len(self.text) <= consts.EIGHTBIT_SIZE:
-                message_pdu = [pack_8bits_to_8bit(self.text)]
+            if self.ports is not None:
+                ports_ie = self.ports.to_bytes()
+                udh = chr(len(ports_ie)) + ports_ie
+            else:
+                udh = ''
+
+            if len(udh) + len(self.text) <= consts.EIGHTBIT_SIZE:
+                message_pdu = [pack_8bits_to_8bit(self.text, udh or None)]
             else:
                 message_pdu = self._split_sms_message(self.text)
         elif self.fmt == 0x08:
@@ -276,6 +289,8 @@ class SmsSubmit(SmsBase):
 
         elif self.fmt == 0x04:
             len_without_udh = consts.EIGHTBIT_MP_SIZE
+            if self.ports is not None:
+                len_without_udh -= len(self.ports.to_bytes())
             limit = consts.EIGHTBIT_SIZE
             packing_func = pack_8bits_to_8bit
             total_len = len(self.text)
@@ -290,7 +305,8 @@ class SmsSubmit(SmsBase):
         pi, pe = 0, len_without_udh
 
         while pi < total_len:
-            if text[pi:pe][-1] == '\x1b':
+            # do not split an escape sequence of the GSM alphabet
+            if self.fmt == 0x00 and text[pi:pe][-1] == '\x1b':
                 pe -= 1
 
             msgs.append(text[pi:pe])
@@ -313,6 +329,13 @@ class SmsSubmit(SmsBase):
                 udh = (chr(udh_len) + chr(mid) + chr(data_len) +
                        chr(sms_ref) + chr(total_parts) + chr(i))
                 padding = " "
+            elif limit == consts.EIGHTBIT_SIZE:
+                udh = ConcatReference(sms_ref, total_parts, i,
+                                      True).to_bytes()
+                if self.ports is not None:
+                    udh += self.ports.to_bytes()
+                udh = chr(len(udh)) + udh
+                padding = ""
             else:
                 udh = (unichr(int("%04x" % ((udh_len << 8) | mid), 16)) +
                        unichr(int("%04x" % ((data_len << 8) | sms_ref), 16)) +
@@ -324,7 +347,7 @@ class SmsSubmit(SmsBase):
         return pdu_msgs
 
     def _get_rand_id(self):
-        if not self.id_list:
-            self.id_list = range(0, 255)
-
-        return self.id_list.pop(0)
+        # cycles through 0..254, like popping from range(0, 255)
+        _id = self._next_id
+        self._next_id = (_id + 1) % 255
+        return _id
@@ -1,7 +1,13 @@
 # See LICENSE
 
+import struct
 
-class PortAddress(object):
+from messaging.utils import SlotsPickleMixin
+
+
+class PortAddress(SlotsPickleMixin):
+
+    __slots__ = ('dest_port', 'orig_port', 'eight_bits')
 
     def __init__(self, dest_port, orig_port, eight_bits):
         self.dest_port = dest_port
@@ -12,8 +18,18 @@ class PortAddress(object):
         args = (self.dest_port, self.orig_port)
         return "<PortAddress dest_port: %d orig_port: %d>" % args
 
+    def to_bytes(self):
+        """Returns the encoded information element, with its IEI and length"""
+        if self.eight_bits:
+            return struct.pack('>BBBB', 0x04, 2, self.dest_port,
+                               self.orig_port)
+
+        return struct.pack('>BBHH', 0x05, 4, self.dest_port, self.orig_port)
+
 
-class ConcatReference(object):
+class ConcatReference(SlotsPickleMixin):
+
+    __slots__ = ('ref', 'cnt', 'seq', 'eight_bits')
 
     def __init__(self, ref, cnt, seq, eight_bits):
         self.ref = ref
@@ -25,8 +41,18 @@ class ConcatReference(object):
         args = (self.ref, self.cnt, self.seq)
         return "<ConcatReference ref: %d cnt: %d seq: %d>" % args
 
+    def to_bytes(self):
+        """Returns the encoded information element, with its IEI and length"""
+        if self.eight_bits:
+            return struct.pack('>BBBBB', 0x00, 3, self.ref, self.cnt,
+                               self.seq)
+
+        return struct.pack('>BBHBB', 0x08, 4, self.ref, self.cnt, self.seq)
+
 
-class UserDataHeader(object):
+class UserDataHeader(SlotsPickleMixin):
+
+    __slots__ = ('concat', 'ports', 'headers')
 
     def __init__(self):
         self.concat = None
@@ -58,7 +84,7 @@ class UserDataHeader(object):
                 ref, cnt, seq = ie_data
                 udh.concat = ConcatReference(ref, cnt, seq, True)
 
-            if iei == 0x08:
+            elif iei == 0x08:
                 # process SM concatenation 16bit ref.
                 ref = ie_data[0] << 8 | ie_data[1]
                 cnt = ie_data[2]
@@ -68,7 +94,7 @@ class UserDataHeader(object):
             elif iei == 0x04:
                 # process App port addressing 8bit
                 dest_port, orig_port = ie_data
-                udh.ports = PortAddress(dest_port, orig_port, False)
+                udh.ports = PortAddress(dest_port, orig_port, True)
 
             elif iei == 0x05:
                 # process App port addressing 16bit
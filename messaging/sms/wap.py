@@ -1,8 +1,18 @@
 # See LICENSE
 
 from array import array
+import time
 
-from messaging.mms.mms_pdu import MMSDecoder
+from messaging.mms.message import MMSMessage
+from messaging.mms.push import decode_mms_notification, dispatcher
+from messaging.sms.submit import SmsSubmit
+from messaging.utils import LRUCache
+
+# WAP push ports over SMS (WAP-259, section 6.2)
+WAP_PUSH_PORT = 2948
+WAP_PUSH_SECURE_PORT = 2949
+# the port of connectionless WSP, pushes are sent from it
+WSP_PORT = 9200
 
 
 def is_a_wap_push_notification(s):
@@ -18,21 +28,209 @@ def is_a_wap_push_notification(s):
 
 
 def extract_push_notification(s):
-    data = array("B", s)
+    """
+    Decodes the WAP push ``s`` according to its content type
+
+    MMS PDUs are returned as a :class:`~messaging.mms.message.MMSMessage`,
+    Service Indication and Service Loading documents as an element tree,
+    and any other push as a :class:`~messaging.mms.push.PushPDU`. See
+    :class:`~messaging.mms.push.PushDispatcher`.
+
+    :param s: The reassembled text of a WAP push SMS
+    :type s: str
+    """
+    return dispatcher.dispatch(s)
+
 
-    wap_push, offset = data[1:3]
-    assert wap_push == 0x06
+def extract_mms_notification(s):
+    """
+    Returns the m-notification-ind pushed in ``s``, or None
 
-    offset += 3
-    data = data[offset:]
+    Unlike :func:`extract_push_notification`, the content type of the
+    push is checked and only the notification headers are decoded.
 
-    # XXX: Not all WAP pushes are MMS
-    return MMSDecoder().decode_data(data)
+    :param s: The reassembled text of a WAP push SMS
+    :type s: str
+    :rtype: :class:`~messaging.mms.push.MMSNotification`
+    """
+    return decode_mms_notification(s)
 
 
 def is_mms_notification(push):
-    # XXX: Pretty poor, but until we decode generic WAP pushes
-    #      it will have to suffice. Ideally we would read the
-    #      content-type from the WAP push header and test
+    if not isinstance(push, MMSMessage):
+        return False
+
     return (push.headers.get('From') is not None and
             push.headers.get('Content-Location') is not None)
+
+
+class PortDispatcher(object):
+    """
+    I reassemble port addressed SMS and hand them to a handler per port
+
+    Messages are routed on the destination port of their user data
+    header; WAP pushes (port 2948) are decoded with
+    :func:`extract_push_notification` unless another handler is
+    registered for it.
+
+    The parts of a concatenated message are kept until the last one
+    arrives, and joined once. At most ``maxsize`` incomplete messages
+    are held: the least recently used one, the incomplete message whose
+    last part arrived the longest ago, is discarded to make room for a
+    new one. Messages that are not complete ``timeout`` seconds after
+    their first part are discarded too. Both are counted in
+    ``dropped``.
+    """
+
+    def __init__(self, maxsize=64, timeout=None, clock=time.time):
+        self.timeout = timeout
+        self.dropped = 0
+        self._clock = clock
+        self._handlers = {WAP_PUSH_PORT: extract_push_notification}
+        self._pending = LRUCache(maxsize)
+
+    def __len__(self):
+        """Returns the number of incomplete messages"""
+        return len(self._pending)
+
+    def register(self, port, handler):
+        """
+        Registers ``handler`` for the destination port ``port``
+
+        :param handler: Called with the payload of every complete
+                        message, what it returns is returned by
+                        :func:`dispatch`
+        :type handler: callable
+        """
+        self._handlers[port] = handler
+
+    def unregister(self, port):
+        """Removes the handler of ``port``"""
+        self._handlers.pop(port, None)
+
+    def reassemble(self, sms):
+        """
+        Adds ``sms`` to its concatenated message
+
+        :type sms: :class:`~messaging.sms.SmsDeliver`
+        :return: The joined text of the message once all its parts have
+                 been received, None until then
+        """
+        udh = sms.udh
+        concat = udh.concat if udh is not None else None
+        if concat is None or concat.cnt <= 1:
+            return sms.text
+
+        cnt, seq = concat.cnt, concat.seq
+        if not 1 <= seq <= cnt:
+            return None
+
+        ports = udh.ports
+        if ports is not None:
+            key = (sms.number, concat.ref, cnt, ports.dest_port,
+                   ports.orig_port)
+        else:
+            key = (sms.number, concat.ref, cnt, None, None)
+
+        pending = self._pending
+        now = self._clock()
+        # [time of the first part, parts, number of parts received]
+        entry = pending.get(key)
+        if (entry is not None and self.timeout is not None and
+                now - entry[0] > self.timeout):
+            self.dropped += 1
+            entry = None
+
+        if entry is None:
+            if key not in pending and len(pending) >= pending.maxsize:
+                self.dropped += 1
+
+            entry = [now, [None] * cnt, 0]
+            pending.set(key, entry)
+
+        parts = entry[1]
+        if parts[seq - 1] is None:
+            entry[2] += 1
+
+        parts[seq - 1] = sms.text
+        if entry[2] < cnt:
+            return None
+
+        pending.pop(key)
+        return ''.join(parts)
+
+    def dispatch(self, sms):
+        """
+        Hands ``sms`` to the handler of its destination port
+
+        :type sms: :class:`~messaging.sms.SmsDeliver`
+        :return: What the handler returns, or None if ``sms`` is not port
+                 addressed, no handler is registered for its port, or
+                 its message is not complete yet
+        """
+        udh = sms.udh
+        if udh is None or udh.ports is None:
+            return None
+
+        handler = self._handlers.get(udh.ports.dest_port)
+        if handler is None:
+            return None
+
+        data = self.reassemble(sms)
+        if data is None:
+            return None
+
+        return handler(data)
+
+
+class PushSmsBuilder(object):
+    """
+    I split WAP pushes into port addressed 8-bit SMS
+
+    Every push gets its own message reference, and its own concatenation
+    reference when it does not fit in a single SMS; both cycle through
+    0..255.
+    """
+
+    def __init__(self, csca=None, validity=None, dest_port=WAP_PUSH_PORT,
+                 orig_port=WSP_PORT):
+        self.csca = csca
+        self.validity = validity
+        self.ports = (dest_port, orig_port)
+        self._next_ref = 0
+
+    def build(self, number, data):
+        """
+        Returns the SMS that push ``data`` to ``number``
+
+        :param number: The number of the recipient
+        :type number: str
+        :param data: The WSP push, e.g. from
+                     :func:`~messaging.mms.push.encode_push`
+        :type data: str
+        :rtype: list of :class:`~messaging.sms.pdu.Pdu`
+        """
+        sms = SmsSubmit(number, data)
+        sms.csca = self.csca
+        sms.validity = self.validity
+        sms.ports = self.ports
+        sms.ref = sms.rand_id = self._next_ref
+        self._next_ref = (self._next_ref + 1) & 0xff
+        return sms.to_pdu()
+
+    def build_notifications(self, encoder, notifications):
+        """
+        Yields the SMS of the MMS notification of every recipient
+
+        :param encoder: Encodes the notifications of the batch
+        :type encoder: :class:`~messaging.mms.push.NotificationEncoder`
+        :param notifications: (number, transaction id, content location)
+                              tuples, a None transaction id is generated
+        :type notifications: iter
+        :return: An iterator over (number, list of Pdu) tuples
+        :rtype: iter
+        """
+        for push_id, (number, transaction_id, location) in enumerate(
+                                                            notifications):
+            data = encoder.encode_push(transaction_id, location, push_id)
+            yield number, self.build(number, data)
@@ -0,0 +1,71 @@
+import unittest
+
+from messaging.sms.address import (AddressCodec, normalize_number,
+                                   normalize_numbers)
+
+
+class TestAddressCodec(unittest.TestCase):
+
+    def test_encode_phone(self):
+        codec = AddressCodec(maxsize=2)
+        self.assertEqual(codec.encode_phone("+34616585119"), "0b914316565811f9")
+        self.assertEqual(codec.encode_phone("655234567"), "098156254365f7")
+        # served from the cache
+        self.assertEqual(codec.encode_phone("+34616585119"), "0b914316565811f9")
+
+    def test_encode_smsc(self):
+        codec = AddressCodec()
+        self.assertEqual(codec.encode_smsc("+34646456456"), "07914346466554f6")
+        self.assertEqual(codec.encode_smsc(None), "00")
+        self.assertEqual(codec.encode_smsc("  "), "00")
+
+
+class TestNormalizeNumbers(unittest.TestCase):
+
+    def test_normalize_number(self):
+        self.assertEqual(normalize_number("+34 (616) 58-51.19"), "+34616585119")
+        self.assertEqual(normalize_number("12"), None)
+
+    def test_normalize_number_e164(self):
+        self.assertEqual(normalize_number("616 58 51 19", '34'),
+                         "+34616585119")
+        self.assertEqual(normalize_number("0034 616 585 119", '34'),
+                         "+34616585119")
+        self.assertEqual(normalize_number("+34616585119", '+44'),
+                         "+34616585119")
+        self.assertEqual(normalize_number("07700 900123", '44'),
+                         "+447700900123")
+        self.assertEqual(normalize_number("011 44 7700 900123", '1',
+                                          international_prefix='011',
+                                          trunk_prefix='1'),
+                         "+447700900123")
+        self.assertEqual(normalize_number("1 (415) 555-0100", '1',
+                                          international_prefix='011',
+                                          trunk_prefix='1'),
+                         "+14155550100")
+        self.assertEqual(normalize_number("00", '34'), None)
+
+    def test_normalize_numbers(self):
+        numbers = ["+34 616 585 119", "bad", "655-234-567", "1\0 2", ""]
+        valid, invalid = normalize_numbers(numbers)
+        self.assertEqual(valid, [(0, "+34616585119"), (2, "655234567")])
+        self.assertEqual(invalid, [(1, "bad"), (3, "1\0 2"), (4, "")])
+
+        valid, invalid = normalize_numbers(numbers[:3])
+        self.assertEqual(valid, [(0, "+34616585119"), (2, "655234567")])
+        self.assertEqual(invalid, [(1, "bad")])
+        self.assertEqual(normalize_numbers([]), ([], []))
+
+    def test_normalize_numbers_e164(self):
+        numbers = ["+34 616 585 119", "0034616585119", "616-585-119",
+                   "0", "00 12"]
+        valid, invalid = normalize_numbers(numbers, country_code='34',
+                                           trunk_prefix='')
+        # the same recipient, however it was written
+        self.assertEqual(valid, [(0, "+34616585119"), (1, "+34616585119"),
+                                 (2, "+34616585119")])
+        self.assertEqual(invalid, [(3, "0"), (4, "00 12")])
+        self.assertEqual(
+            [normalize_number(number, '34', trunk_prefix='')
+             for number in numbers],
+            [number for i, number in valid] + [None, None])
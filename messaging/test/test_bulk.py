@@ -0,0 +1,86 @@
+# -*- coding: utf-8 -*-
+from cStringIO import StringIO
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from messaging.sms.bulk import decode_files, iter_decoded
+
+PDUS = [
+    "07911326040000F0040B911346610089F60000208062917314080CC8F71D14969741F977FD07",
+    "",
+    "07914306073011F0040B914316709807F2000880604290224080084E2D5174901A8BAF",
+    "07911326040000F0040B911346610089F6000020806291731408",
+    "0791538375000075061805810531F1019082416500400190824165004000",
+]
+
+
+class TestBulkDecoding(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'pdus.txt')
+        f = open(self.path, 'w')
+        f.write('\n'.join(PDUS) + '\n')
+        f.close()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_iter_decoded_keeps_order(self):
+        for processes in (1, 2):
+            results = list(iter_decoded(PDUS * 20, processes, chunksize=3))
+            self.assertEqual(len(results), 80)
+            linenos = [r[0] for r in results]
+            self.assertEqual(linenos, sorted(linenos))
+            self.assertEqual(results[0][2]['text'], u"How are you?")
+            self.assertEqual(results[1][2]['text'], u"中兴通讯")
+            self.assertEqual(results[2][2], None)
+            self.assertTrue(results[2][3])
+            self.assertEqual(results[3][2]['ref'], 24)
+
+    def test_decode_files_jsonl(self):
+        output, rejects = StringIO(), StringIO()
+        ret = decode_files([self.path], output, rejects=rejects, processes=1)
+        self.assertEqual(ret, (3, 1))
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(len(lines), 3)
+        data = json.loads(lines[0])
+        self.assertEqual(data['number'], '+31641600986')
+        self.assertEqual(data['date'], '2002-08-26T19:37:41')
+        sr = json.loads(lines[2])['sr']
+        self.assertEqual(sr['recipient'], '50131')
+
+        path, lineno, pdu, error = rejects.getvalue().rstrip().split('\t')
+        self.assertEqual((path, lineno, pdu), (self.path, '4', PDUS[3]))
+
+    def test_decode_several_files(self):
+        other = os.path.join(self.tmpdir, 'other.txt')
+        f = open(other, 'w')
+        f.write('\n'.join(reversed(PDUS)) + '\n')
+        f.close()
+
+        output, rejects = StringIO(), StringIO()
+        ret = decode_files([self.path, other] * 5, output, rejects=rejects,
+                           processes=2, chunksize=2)
+        self.assertEqual(ret, (30, 10))
+
+        lines = output.getvalue().splitlines()
+        self.assertEqual(json.loads(lines[0])['text'], u"How are you?")
+        self.assertEqual(json.loads(lines[3])['sr']['recipient'], '50131')
+        rejected = [line.split('\t')[:2]
+                    for line in rejects.getvalue().splitlines()]
+        self.assertEqual(rejected, [[self.path, '4'], [other, '2']] * 5)
+
+    def test_decode_files_csv(self):
+        output = StringIO()
+        decode_files([self.path], output, fmt='csv', processes=1)
+        lines = output.getvalue().splitlines()
+        self.assertEqual(lines[0], 'text,pid,dcs,csca,number,type,date,'
+                                   'fmt,sr,ref,cnt,seq')
+        self.assertEqual(len(lines), 4)
+        self.assertRaises(ValueError, decode_files, [self.path], output,
+                          fmt='xml')
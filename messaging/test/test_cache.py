@@ -0,0 +1,95 @@
+import unittest
+
+from messaging.sms.cache import BloomFilter, SmsDeliverCache, pdu_digest
+from messaging.utils import LRUCache
+
+PDU = "07911326040000F0040B911346610089F60000208062917314080CC8F71D14969741F977FD07"
+PDU2 = "07914306073011F0040B914316709807F2000880604290224080084E2D5174901A8BAF"
+
+
+class FakeClock(object):
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class TestLRUCache(unittest.TestCase):
+
+    def test_eviction_order(self):
+        lru = LRUCache(2)
+        lru.set('a', 1)
+        lru.set('b', 2)
+        self.assertEqual(lru.get('a'), 1)
+        lru.set('c', 3)
+        self.assertTrue('a' in lru)
+        self.assertFalse('b' in lru)
+        self.assertEqual(len(lru), 2)
+        self.assertEqual(lru.pop('a'), 1)
+        self.assertEqual(lru.get('a', 'missing'), 'missing')
+
+
+class TestBloomFilter(unittest.TestCase):
+
+    def test_membership(self):
+        bloom = BloomFilter(100)
+        bloom.add(pdu_digest(PDU))
+        self.assertTrue(pdu_digest(PDU) in bloom)
+        self.assertFalse(pdu_digest(PDU2) in bloom)
+
+
+class TestSmsDeliverCache(unittest.TestCase):
+
+    def test_decode_returns_cached_object(self):
+        cache = SmsDeliverCache(maxsize=10)
+        sms = cache.decode(PDU)
+        self.assertEqual(sms.text, "How are you?")
+        self.assertTrue(cache.decode(PDU.lower()) is sms)
+        self.assertEqual(cache.stats, {'hits': 1, 'misses': 1,
+                                       'duplicates': 0, 'size': 1})
+
+    def test_decode_error_is_not_cached(self):
+        cache = SmsDeliverCache()
+        self.assertRaises(ValueError, cache.decode, PDU[:-1])
+        self.assertEqual(len(cache), 0)
+
+    def test_duplicates_within_window(self):
+        clock = FakeClock()
+        cache = SmsDeliverCache(window=60, clock=clock)
+        sms, dup = cache.receive(PDU)
+        self.assertFalse(dup)
+        clock.now += 30
+        self.assertEqual(cache.receive(PDU), (sms, True))
+        clock.now += 31
+        self.assertEqual(cache.receive(PDU), (sms, False))
+        self.assertEqual(cache.duplicates, 1)
+
+    def test_bloom_filter_remembers_evicted_pdus(self):
+        clock = FakeClock()
+        cache = SmsDeliverCache(maxsize=1, window=60, bloom_capacity=100,
+                                clock=clock)
+        self.assertFalse(cache.receive(PDU)[1])
+        self.assertFalse(cache.receive(PDU2)[1])
+        # PDU was evicted from the LRU but is still in the window
+        self.assertTrue(cache.receive(PDU)[1])
+        self.assertEqual(cache.misses, 3)
+        # two windows later it has been forgotten
+        clock.now += 61
+        cache.receive(PDU2)
+        clock.now += 61
+        self.assertFalse(cache.receive(PDU)[1])
+
+    def test_bloom_filter_after_idle_windows(self):
+        clock = FakeClock()
+        cache = SmsDeliverCache(maxsize=1, window=60, bloom_capacity=100,
+                                clock=clock)
+        cache.receive(PDU)
+        clock.now += 1
+        cache.receive(PDU2)
+        # nothing received for more than two windows
+        clock.now += 199
+        self.assertFalse(cache.receive(PDU)[1])
+        self.assertFalse(cache.receive(PDU2)[1])
+        self.assertEqual(cache.duplicates, 0)
@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime
+import os
+import shutil
+import tempfile
+import unittest
+
+from messaging.sms.columnar import SmsColumns
+
+PDUS = [
+    "07911326040000F0040B911346610089F60000208062917314080CC8F71D14969741F977FD07",
+    "07914306073011F0040B914316709807F2000880604290224080084E2D5174901A8BAF",
+    "07911326040000F0040B911346610089F6000020806291731408",
+    "0791538375000075061805810531F1019082416500400190824165004000",
+]
+
+
+class TestSmsColumns(unittest.TestCase):
+
+    def setUp(self):
+        self.columns = SmsColumns.from_pdus(PDUS)
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'sms.col')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_from_pdus(self):
+        self.assertEqual(len(self.columns), 3)
+        self.assertEqual(self.columns.errors, 1)
+        self.assertEqual(list(self.columns['dcs']), [0, 8, -1])
+        self.assertEqual(self.columns['text'][1], u"中兴通讯")
+
+        row = self.columns.row(0)
+        self.assertEqual(row['number'], '+31641600986')
+        self.assertEqual(row['date'], datetime(2002, 8, 26, 19, 37, 41))
+        self.assertEqual(row['text'], u"How are you?")
+        self.assertEqual(self.columns.row(2)['pid'], None)
+
+    def assertSameRows(self, columns):
+        self.assertEqual(len(columns), len(self.columns))
+        for i in range(len(columns)):
+            self.assertEqual(columns.row(i), self.columns.row(i))
+
+    def test_save_and_load(self):
+        self.columns.save(self.path)
+        for use_mmap in (True, False):
+            columns = SmsColumns.load(self.path, use_mmap=use_mmap)
+            self.assertSameRows(columns)
+            columns.close()
+
+    def test_mmap_columns_are_read_only(self):
+        self.columns.save(self.path)
+        columns = SmsColumns.load(self.path)
+        self.assertRaises(TypeError, columns.append, None)
+        columns.close()
+
+    def test_load_invalid_file(self):
+        f = open(self.path, 'wb')
+        f.write('not a columns file')
+        f.close()
+        self.assertRaises(ValueError, SmsColumns.load, self.path)
@@ -0,0 +1,121 @@
+import threading
+import unittest
+
+from messaging.mms import ids
+from messaging.mms.ids import IdGenerator, TransactionIndex, new_id
+from messaging.mms.message import MMSMessage
+from messaging.mms.mms_pdu import MMSDecoder, MMSEncoder
+from messaging.mms.push import NotificationEncoder, decode_mms_notification
+
+
+class FakeClock(object):
+
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class TestIdGenerator(unittest.TestCase):
+
+    def test_format(self):
+        generator = IdGenerator(node=0x12345, prefix='T',
+                                clock=FakeClock(1299241800.5))
+        first = generator()
+        self.assertEqual(len(first), 26)
+        self.assertTrue(first.startswith('T' + '%011x' % 1299241800500))
+        self.assertEqual(first[12:16], '2345')
+        self.assertTrue(first.endswith('0000'))
+        self.assertTrue(generator().endswith('0001'))
+
+    def test_monotonic(self):
+        clock = FakeClock(1000.0)
+        generator = IdGenerator(node=1, clock=clock)
+        generated = [generator() for i in range(3)]
+        clock.now = 999.0
+        generated.extend([generator() for i in range(3)])
+        clock.now = 1000.002
+        generated.append(generator())
+        self.assertEqual(sorted(generated), generated)
+        self.assertEqual(len(set(generated)), len(generated))
+
+    def test_counter_overflow(self):
+        generator = IdGenerator(node=1, clock=FakeClock(1.0))
+        generated = [generator() for i in range(0x10002)]
+        self.assertEqual(sorted(generated), generated)
+        self.assertEqual(len(set(generated)), len(generated))
+        self.assertEqual(generated[-1][:11], '%011x' % 1001)
+
+    def test_threads(self):
+        generator = IdGenerator()
+        generated = []
+
+        def generate():
+            generated.extend([generator() for i in range(2000)])
+
+        threads = [threading.Thread(target=generate) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(len(set(generated)), 8000)
+
+    def test_encoders_use_generator(self):
+        generated = iter(['id-1', 'id-2'])
+        ids.set_id_generator(lambda: generated.next())
+        try:
+            mms = MMSMessage()
+            self.assertFalse('Transaction-Id' in mms.headers)
+            data = MMSEncoder().encode(mms)
+            self.assertEqual(mms.headers['Transaction-Id'], 'id-1')
+            self.assertEqual(MMSDecoder().decode_data(data).headers[
+                                                'Transaction-Id'], 'id-1')
+            # the message keeps its Transaction-Id
+            self.assertEqual(MMSEncoder().encode(mms), data)
+
+            data = NotificationEncoder(1024, 3600).encode_push(None,
+                                                              'http://x/1')
+            self.assertEqual(decode_mms_notification(data).transaction_id,
+                             'id-2')
+        finally:
+            ids.set_id_generator(IdGenerator())
+
+        self.assertNotEqual(MMSMessage().encode(), MMSMessage().encode())
+
+
+class TestTransactionIndex(unittest.TestCase):
+
+    def test_match(self):
+        index = TransactionIndex()
+        tid = new_id()
+        index.add(tid, '+34600000000')
+        index.add(new_id(), '+34600000001')
+        self.assertEqual(len(index), 2)
+
+        conf = {'Message-Type': 'm-send-conf', 'Transaction-Id': tid,
+                'Response-Status': 'Ok', 'Message-ID': 'msg-1'}
+        self.assertEqual(index.match(conf), '+34600000000')
+        self.assertEqual(index.get_by_message_id('msg-1'), '+34600000000')
+
+        report = MMSMessage()
+        report.headers = {'Message-Type': 'm-delivery-ind',
+                          'Message-ID': 'msg-1', 'Status': 'Retrieved'}
+        self.assertEqual(index.match(report), '+34600000000')
+
+        report.headers['Message-ID'] = 'msg-2'
+        self.assertEqual(index.match(report), None)
+        self.assertEqual(index.match({'Message-Type': 'm-send-conf',
+                                      'Transaction-Id': 'unknown'}), None)
+
+    def test_bounded(self):
+        index = TransactionIndex(maxsize=2)
+        for tid in ('a', 'b', 'c'):
+            index.add(tid, tid.upper(), message_id='m' + tid)
+
+        self.assertEqual(len(index), 2)
+        self.assertEqual(index.get('a'), None)
+        self.assertEqual(index.get('c'), 'C')
+        self.assertEqual(index.get_by_message_id('ma'), None)
+        self.assertEqual(index.get_by_message_id('mb'), 'B')
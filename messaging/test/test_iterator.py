@@ -0,0 +1,50 @@
+from array import array
+import unittest
+
+from messaging.mms.iterator import ByteCursor, PreviewIterator
+from messaging.mms.wsp_pdu import Decoder, DecodeError
+
+
+class TestByteCursor(unittest.TestCase):
+
+    def test_preview_iterator_interface(self):
+        data = [1, 2, 3]
+        for it in (PreviewIterator(data), ByteCursor(array('B', data))):
+            self.assertEqual(it.preview(), 1)
+            self.assertEqual(it.preview(), 2)
+            it.reset_preview()
+            self.assertEqual(it.next(), 1)
+            self.assertEqual(it.preview(), 2)
+            self.assertEqual(list(it), [2, 3])
+            self.assertRaises(StopIteration, it.next)
+
+    def test_reads(self):
+        cursor = ByteCursor('\x7fabc\x00\x81\x01rest')
+        self.assertEqual(cursor.peek(1), ord('a'))
+        cursor.advance()
+        self.assertEqual(cursor.read_cstring(), 'abc')
+        self.assertEqual(cursor.read_uint_var(), 129)
+        sub = cursor.sub_cursor(2)
+        self.assertEqual(sub.read(2), 're')
+        self.assertTrue(sub.at_end())
+        self.assertEqual(cursor.remaining, 2)
+        self.assertRaises(StopIteration, cursor.read_cstring)
+        self.assertTrue(cursor.at_end())
+
+    def test_decoder_gives_same_results(self):
+        cases = [
+            ('decode_text_string', [0x7f, 0x61, 0x62, 0x00, 0x63]),
+            ('decode_token_text', [0x61, 0x62, 0x3b, 0x63]),
+            ('decode_uint_var', [0x81, 0x80, 0x01]),
+            ('decode_extension_media', [0x61, 0x2f, 0x62, 0x00]),
+            ('decode_content_type_value',
+             [0x1f, 0x04, 0x61, 0x00, 0x81, 0x83, 0x99]),
+        ]
+        for name, data in cases:
+            old, new = PreviewIterator(data), ByteCursor(data)
+            func = getattr(Decoder, name)
+            self.assertEqual(func(old), func(new))
+            self.assertEqual(list(old), list(new))
+
+        self.assertRaises(DecodeError, Decoder.decode_token_text,
+                          ByteCursor([0x20]))
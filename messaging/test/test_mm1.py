@@ -0,0 +1,334 @@
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import httplib
+import mmap
+import os
+import socket
+from SocketServer import ThreadingMixIn
+import threading
+import time
+import unittest
+
+from messaging.mms import ids, wsp_pdu
+from messaging.mms.message import MMSMessage, MMSMessagePage
+from messaging.mms.mm1 import MM1Client, MM1Error, RetrievalService
+from messaging.mms.mms_pdu import MMSEncoder
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'mms-data')
+
+
+def encode_send_conf(transaction_id, message_id):
+    encoder = MMSEncoder()
+    writer = wsp_pdu.ByteWriter()
+    encoder.write_message_header(writer, {
+        'Message-Type': 'm-send-conf', 'Transaction-Id': transaction_id,
+        'Response-Status': 'Ok', 'Message-ID': message_id})
+    return writer.getvalue()
+
+
+class MMSCHandler(BaseHTTPRequestHandler):
+    """A stand-in MMSC"""
+    protocol_version = 'HTTP/1.1'
+    wbufsize = -1
+
+    def setup(self):
+        BaseHTTPRequestHandler.setup(self)
+        self.server.connections += 1
+
+    def do_POST(self):
+        data = self.rfile.read(int(self.headers['Content-Length']))
+        mms = MMSMessage.from_data(data)
+        self.server.received.append((self.path, self.headers, mms))
+        to = mms.headers.get('To')
+        if to == 'error':
+            return self.reply('', 500)
+        elif to == 'close':
+            # accepted, but the connection is lost before the answer
+            self.close_connection = 1
+            return
+        elif to == 'slow':
+            time.sleep(0.5)
+
+        message_id = 'msg-%d' % len(self.server.received)
+        self.reply(encode_send_conf(mms.headers['Transaction-Id'],
+                                    message_id))
+
+    def do_GET(self):
+        self.server.received.append((self.path, self.headers, None))
+        name = self.path.split('?')[0].rsplit('/', 1)[-1]
+        path = os.path.join(DATA_DIR, name)
+        if not os.path.exists(path):
+            return self.reply('', 404)
+
+        self.server.lock.acquire()
+        self.server.active += 1
+        self.server.max_active = max(self.server.max_active,
+                                     self.server.active)
+        self.server.lock.release()
+
+        data = open(path, 'rb').read()
+        if self.server.headers_seen is None:
+            time.sleep(self.server.delay)
+            self.reply(data)
+        else:
+            # the rest of the body only once the client saw the headers
+            self.send_response(200)
+            self.send_header('Content-Length', str(len(data)))
+            self.end_headers()
+            self.wfile.write(data[:512])
+            self.wfile.flush()
+            self.server.waited = self.server.headers_seen.wait(5)
+            self.wfile.write(data[512:])
+
+        self.server.lock.acquire()
+        self.server.active -= 1
+        self.server.lock.release()
+
+    def reply(self, data, status=200):
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/vnd.wap.mms-message')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+        if self.server.drop_connections:
+            # without telling the client
+            self.close_connection = 1
+
+    def log_message(self, *args):
+        pass
+
+
+class MMSCServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class MMSCTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.server = MMSCServer(('127.0.0.1', 0), MMSCHandler)
+        self.server.connections = 0
+        self.server.received = []
+        self.server.drop_connections = False
+        self.server.lock = threading.Lock()
+        self.server.active = self.server.max_active = 0
+        self.server.delay = 0
+        self.server.headers_seen = None
+        self.thread = threading.Thread(target=self.server.serve_forever,
+                                       args=(0.01,))
+        self.thread.daemon = True
+        self.thread.start()
+        self.url = 'http://127.0.0.1:%d/mms' % self.server.server_port
+        self.client = MM1Client(self.url)
+
+    def tearDown(self):
+        self.client.close()
+        self.server.shutdown()
+        self.server.server_close()
+
+    def get_message(self, to='+34600000000/TYPE=PLMN'):
+        mms = MMSMessage()
+        mms.headers['To'] = to
+        mms.headers['Subject'] = 'mm1'
+        page = MMSMessagePage()
+        page.add_image(os.path.join(DATA_DIR, 'BTMMS.MMS'))
+        page.add_text('hello')
+        mms.add_page(page)
+        return mms
+
+
+class TestMM1Client(MMSCTestCase):
+
+    def test_send(self):
+        mms = self.get_message()
+        conf = self.client.send(mms)
+        self.assertEqual(conf.headers['Message-Type'], 'm-send-conf')
+        self.assertEqual(conf.headers['Response-Status'], 'Ok')
+        self.assertEqual(conf.headers['Message-ID'], 'msg-1')
+        self.assertEqual(conf.headers['Transaction-Id'],
+                         mms.headers['Transaction-Id'])
+
+        path, headers, received = self.server.received[0]
+        self.assertEqual(path, '/mms')
+        self.assertEqual(headers['Content-Type'],
+                         'application/vnd.wap.mms-message')
+        self.assertEqual(received.headers['Subject'], 'mm1')
+        self.assertEqual(received.data_parts[1].data,
+                         open(os.path.join(DATA_DIR, 'BTMMS.MMS')).read())
+
+    def test_connections_are_reused(self):
+        template = self.get_message().template()
+        for i in range(3):
+            conf = self.client.send(template, {'To': '%d/TYPE=PLMN' % i,
+                                               'Transaction-Id': 'T%d' % i})
+            self.assertEqual(conf.headers['Transaction-Id'], 'T%d' % i)
+
+        self.client.send(self.get_message().encode().tostring())
+        self.client.retrieve(self.url + '/SIMPLE.MMS')
+        self.assertEqual(len(self.server.received), 5)
+        self.assertEqual(self.server.connections, 1)
+
+    def test_send_template_without_transaction_id(self):
+        # ids of different lengths, the Content-Length must match the body
+        generated = iter(['T1', 'T-12345678'])
+        ids.set_id_generator(lambda: generated.next())
+        try:
+            template = self.get_message().template()
+            headers = {'To': '1/TYPE=PLMN'}
+            conf = self.client.send(template, headers)
+            self.assertEqual(headers['Transaction-Id'], 'T1')
+            self.assertEqual(conf.headers['Transaction-Id'], 'T1')
+
+            conf = self.client.send(template, {'To': '2/TYPE=PLMN'})
+            self.assertEqual(conf.headers['Transaction-Id'], 'T-12345678')
+        finally:
+            ids.set_id_generator(ids.IdGenerator())
+
+        self.assertEqual([mms.headers['Transaction-Id']
+                          for path, headers, mms in self.server.received],
+                         ['T1', 'T-12345678'])
+
+    def test_connection_closed_by_server(self):
+        self.server.drop_connections = True
+        for i in range(3):
+            self.client.send(self.get_message())
+            # idle for a while, the client sees the connection closed
+            time.sleep(0.05)
+
+        self.assertEqual(len(self.server.received), 3)
+        self.assertEqual(self.server.connections, 3)
+
+    def test_post_is_not_sent_twice(self):
+        self.client.send(self.get_message())
+        self.assertRaises(httplib.BadStatusLine, self.client.send,
+                          self.get_message(to='close'))
+        self.assertEqual(len(self.server.received), 2)
+
+        client = MM1Client(self.url, timeout=0.1)
+        self.addCleanup(client.close)
+        client.send(self.get_message())
+        self.assertRaises(socket.timeout, client.send,
+                          self.get_message(to='slow'))
+        time.sleep(0.5)
+        self.assertEqual(len(self.server.received), 4)
+
+    def test_retrieve(self):
+        mms = self.client.retrieve(self.url + '/SIMPLE.MMS?x=1')
+        self.assertEqual(mms.headers['Subject'], 'Simple message')
+        self.assertEqual(self.server.received[0][0], '/mms/SIMPLE.MMS?x=1')
+        self.assertEqual(self.server.received[0][1]['Accept'],
+                         'application/vnd.wap.mms-message')
+
+    def test_error(self):
+        try:
+            self.client.send(self.get_message(to='error'))
+        except MM1Error, e:
+            self.assertEqual(e.status, 500)
+        else:
+            self.fail('MM1Error not raised')
+
+        # the connection is still usable
+        self.client.send(self.get_message())
+        self.assertEqual(self.server.connections, 1)
+
+    def test_proxy(self):
+        client = MM1Client('http://mmsc.example.com:8002/servlets/mms',
+                           proxy=('127.0.0.1', self.server.server_port),
+                           headers={'User-Agent': 'messaging'})
+        try:
+            client.send(self.get_message())
+        finally:
+            client.close()
+
+        path, headers, received = self.server.received[0]
+        self.assertEqual(path, 'http://mmsc.example.com:8002/servlets/mms')
+        self.assertEqual(headers['Host'], 'mmsc.example.com:8002')
+        self.assertEqual(headers['User-Agent'], 'messaging')
+
+
+class TestRetrievalService(MMSCTestCase):
+
+    def get_service(self, **kwargs):
+        self.service = RetrievalService(**kwargs)
+        self.addCleanup(self.service.close)
+        return self.service
+
+    def test_retrieve(self):
+        service = self.get_service(workers=4)
+        names = ['SIMPLE.MMS', 'BTMMS.MMS', 'TOMSLOT.MMS', 'iPhone.mms']
+        retrievals = [service.submit('%s/%s' % (self.url, name))
+                      for name in names]
+
+        for name, retrieval in zip(names, retrievals):
+            expected = MMSMessage.from_file(os.path.join(DATA_DIR, name))
+            mms = retrieval.result(5)
+            self.assertEqual(mms.headers, expected.headers)
+            self.assertEqual([part.data for part in mms.data_parts],
+                             [part.data for part in expected.data_parts])
+            self.assertEqual(retrieval.headers.headers, expected.headers)
+            self.assertTrue(retrieval.headers_latency <= retrieval.latency)
+
+        service.close()
+        stats = service.stats()['127.0.0.1:%d' % self.server.server_port]
+        self.assertEqual(stats['count'], 4)
+        self.assertEqual(stats['errors'], 0)
+        self.assertTrue(0 < stats['mean'] <= stats['max'])
+        self.assertTrue(stats['p50'] <= stats['p99'])
+
+    def test_max_per_host(self):
+        self.server.delay = 0.02
+        service = self.get_service(workers=8, max_per_host=2)
+        done = []
+        for i in range(6):
+            service.submit(self.url + '/SIMPLE.MMS', callback=done.append)
+
+        service.close()
+        self.assertEqual(len(done), 6)
+        self.assertEqual(self.server.max_active, 2)
+
+    def test_headers_before_body(self):
+        self.server.headers_seen = threading.Event()
+        seen = []
+
+        def on_headers(retrieval):
+            seen.append(retrieval.message)
+            self.server.headers_seen.set()
+
+        service = self.get_service(on_headers=on_headers, chunk_size=256)
+        retrieval = service.submit(self.url + '/BTMMS.MMS')
+        mms = retrieval.result(10)
+        self.assertTrue(self.server.waited)
+        self.assertEqual(seen, [None])
+        self.assertEqual(retrieval.headers.headers['Subject'],
+                         'BT Ignite MMS')
+        self.assertEqual(len(mms.data_parts), 4)
+
+    def test_small_chunks(self):
+        decoded = []
+        service = self.get_service(chunk_size=16, on_headers=decoded.append)
+        retrieval = service.submit(self.url + '/BTMMS.MMS')
+        mms = retrieval.result(5)
+        self.assertEqual(decoded, [retrieval])
+        self.assertEqual(retrieval.headers.headers, mms.headers)
+        self.assertEqual(len(mms.data_parts), 4)
+
+    def test_spill_to_disk(self):
+        service = self.get_service(spool_size=4096)
+        mms = service.submit(self.url + '/TOMSLOT.MMS').result(5)
+        # the parts are views into the spilled body
+        self.assertTrue(isinstance(mms.data_parts[0]._view[0], mmap.mmap))
+        expected = MMSMessage.from_file(os.path.join(DATA_DIR,
+                                                     'TOMSLOT.MMS'))
+        self.assertEqual([part.data for part in mms.data_parts],
+                         [part.data for part in expected.data_parts])
+
+    def test_errors(self):
+        service = self.get_service()
+        retrieval = service.submit(self.url + '/missing.mms')
+        self.assertTrue(retrieval.wait(5))
+        self.assertTrue(isinstance(retrieval.error, MM1Error))
+        self.assertRaises(MM1Error, retrieval.result)
+
+        service.close()
+        stats = service.stats().values()[0]
+        self.assertEqual((stats['count'], stats['errors']), (1, 1))
+        self.assertEqual(stats['mean'], None)
+        self.assertRaises(ValueError, service.submit, self.url)
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 from array import array
 import datetime
+import mmap
 import os
+from StringIO import StringIO
+import tempfile
 import unittest
 
-from messaging.mms.message import MMSMessage
+from messaging.mms.message import DataPart, MMSMessage, MMSMessagePage
+from messaging.mms.mms_pdu import MMSDecoder, MMSEncoder
+from messaging.mms.wsp_pdu import EncodeError
 
 # test data extracted from heyman's
 # http://github.com/heyman/mms-decoder
@@ -51,8 +56,7 @@ class TestMmsDecoding(unittest.TestCase):
         mms = MMSMessage.from_file(path)
         self.assertTrue(isinstance(mms, MMSMessage))
         headers = {
-            'Transaction-Id': '1234', 'MMS-Version': '1.0',
-            'Message-Type': 'm-retrieve-conf',
+            'MMS-Version': '1.0', 'Message-Type': 'm-retrieve-conf',
             'Date': datetime.datetime(2002, 12, 20, 21, 26, 56),
             'Content-Type': ('application/vnd.wap.multipart.related', {}),
             'Subject': 'Simple message',
@@ -70,8 +74,7 @@ class TestMmsDecoding(unittest.TestCase):
         mms = MMSMessage.from_file(path)
         self.assertTrue(isinstance(mms, MMSMessage))
         headers = {
-            'Transaction-Id': '1234', 'MMS-Version': '1.0',
-            'Message-Type': 'm-retrieve-conf',
+            'MMS-Version': '1.0', 'Message-Type': 'm-retrieve-conf',
             'Date': datetime.datetime(2003, 1, 21, 1, 57, 4),
             'Content-Type': ('application/vnd.wap.multipart.related', {'Start': '<btmms.smil>', 'Type': 'application/smil'}),
             'Subject': 'BT Ignite MMS',
@@ -95,7 +98,6 @@ class TestMmsDecoding(unittest.TestCase):
         self.assertTrue(isinstance(mms, MMSMessage))
         headers = {
             'From': '616c6c616e40746f6d736c6f742e636f6d'.decode('hex'),
-            'Transaction-Id': '1234',
             'MMS-Version': '1.0', 'Message-Type': 'm-retrieve-conf',
             'Date': datetime.datetime(2003, 2, 16, 3, 48, 33),
             'Content-Type': ('application/vnd.wap.multipart.related', {'Start': '<tomslot.smil>', 'Type': 'application/smil'}),
@@ -364,6 +366,138 @@ class TestMmsDecoding(unittest.TestCase):
         self.assertEqual(mms.data_parts[0].content_type_parameters,
                          {'Charset': 'utf-8'})
 
+    def test_decoded_parts_refer_to_message_data(self):
+        path = os.path.join(DATA_DIR, 'iPhone.mms')
+        data = open(path, 'rb').read()
+        mms = MMSMessage.from_data(data)
+        part = mms.data_parts[1]
+        buf, offset, length = part._view
+        self.assertTrue(buf is data)
+        self.assertEqual(len(part), length)
+        payload = data[offset:offset + length]
+        self.assertEqual(str(part.buffer), payload)
+        self.assertEqual(part.data, payload)
+        self.assertEqual(part._view, None)
+
+    def test_decoding_from_mmap(self):
+        path = os.path.join(DATA_DIR, 'iPhone.mms')
+        mms = MMSMessage.from_file(path, use_mmap=True)
+        expected = MMSMessage.from_file(path)
+        self.assertEqual(mms.headers, expected.headers)
+        self.assertEqual(len(mms.data_parts), len(expected.data_parts))
+
+        part = mms.data_parts[1]
+        buf, offset, length = part._view
+        self.assertTrue(isinstance(buf, mmap.mmap))
+        self.assertEqual(len(part), length)
+        self.assertEqual(part.data, expected.data_parts[1].data)
+        self.assertEqual(part._view, None)
+
+    def test_decoding_empty_file_from_mmap(self):
+        fd, path = tempfile.mkstemp()
+        os.close(fd)
+        try:
+            mms = MMSMessage.from_file(path, use_mmap=True)
+            self.assertEqual(mms.data_parts, [])
+        finally:
+            os.unlink(path)
+
+    def test_decoding_part_headers(self):
+        path = os.path.join(DATA_DIR, 'BTMMS.MMS')
+        mms = MMSMessage.from_file(path)
+        self.assertEqual(mms.data_parts[1].headers, {
+            'Content-Type': ('image/gif', {}),
+            'Content-ID': '<btlogo.gif>',
+            'Content-Location': 'btlogo.gif',
+        })
+
+    def test_decoding_headers_only(self):
+        path = os.path.join(DATA_DIR, 'BTMMS.MMS')
+        data = open(path, 'rb').read()
+        mms = MMSDecoder().decode_headers(data)
+        self.assertEqual(mms.headers, MMSMessage.from_data(data).headers)
+        self.assertEqual(mms.data_parts, [])
+
+    def test_decoding_truncated_headers(self):
+        path = os.path.join(DATA_DIR, 'BTMMS.MMS')
+        data = open(path, 'rb').read()
+        decoder = MMSDecoder()
+        decoder.decode_headers(data)
+        header_length = decoder.header_length
+        for n in range(header_length):
+            decoder.decode_headers(data[:n])
+            self.assertEqual(decoder.header_length, None)
+
+        decoder.decode_headers(data[:header_length])
+        self.assertEqual(decoder.header_length, header_length)
+
+    def test_decoding_part_index(self):
+        path = os.path.join(DATA_DIR, 'BTMMS.MMS')
+        data = open(path, 'rb').read()
+        index = MMSDecoder().decode_part_index(data)
+        parts = MMSMessage.from_data(data).data_parts
+        self.assertEqual(len(index), len(parts))
+        self.assertEqual(index[0], (109, 47, 494, 'application/smil',
+                                    '<btmms.smil>'))
+        for info, part in zip(index, parts):
+            self.assertEqual(info.content_type, part.content_type)
+            self.assertEqual(info.content_id, part.headers['Content-ID'])
+            payload = data[info.offset:info.offset + info.data_len]
+            self.assertEqual(payload, part.data)
+
+    def test_decoding_pages(self):
+        path = os.path.join(DATA_DIR, 'BTMMS.MMS')
+        mms = MMSMessage.from_file(path)
+        # the SMIL part is only parsed when the pages are needed
+        self.assertEqual(mms._parsed_pages, None)
+        self.assertTrue(mms.smil_part is mms.data_parts[0])
+
+        pages = mms.pages
+        self.assertTrue(mms.pages is pages)
+        self.assertEqual(len(pages), 2)
+        self.assertEqual(pages[0].duration, 6825)
+        self.assertTrue(pages[0].image[0] is mms.data_parts[1])
+        self.assertEqual(pages[0].image[1:], (0, 0))
+        self.assertTrue(pages[0].audio[0] is mms.data_parts[2])
+        self.assertEqual(pages[0].audio[1:], (350, 6350))
+        self.assertEqual(pages[0].text, None)
+        self.assertEqual(pages[1].duration, 3000)
+        self.assertTrue(pages[1].text[0] is mms.data_parts[3])
+
+    def test_decoding_pages_by_content_id(self):
+        path = os.path.join(DATA_DIR, 'gallery2test.mms')
+        mms = MMSMessage.from_file(path)
+        self.assertEqual(len(mms.pages), 1)
+        self.assertEqual(mms.pages[0].duration, 30000)
+        self.assertEqual(mms.pages[0].image[0].headers['Content-ID'],
+                         '<image_0>')
+        self.assertEqual(mms.pages[0].text[0].headers['Content-ID'],
+                         '<text_0>')
+
+        path = os.path.join(DATA_DIR, 'SIMPLE.MMS')
+        self.assertEqual(MMSMessage.from_file(path).pages, [])
+
+    def test_decoding_builds_part_index(self):
+        path = os.path.join(DATA_DIR, 'TOMSLOT.MMS')
+        mms = MMSMessage.from_file(path)
+        index = mms._part_index
+        self.assertNotEqual(index, None)
+        self.assertEqual(len(index), len(mms.data_parts))
+
+        part = mms.get_part_by_location('img03.jpg')
+        self.assertTrue(part is mms.data_parts[4])
+        self.assertTrue(mms.get_part('img03.jpg') is part)
+        self.assertEqual(mms.get_part_by_location('img09.jpg'), None)
+        self.assertTrue(mms.get_part_by_content_id('<tomslot.smil>')
+                        is mms.data_parts[0])
+        self.assertTrue(mms.get_part_by_content_id('tomslot.smil')
+                        is mms.data_parts[0])
+        self.assertEqual(
+            [p.headers['Content-Location']
+             for p in mms.get_parts_by_content_type('IMAGE/JPEG')],
+            ['img00.jpg', 'img01.jpg', 'img02.jpg', 'img03.jpg', 'img04.jpg'])
+        self.assertEqual(mms.get_parts_by_content_type('video/3gpp'), [])
+
     def test_encoding_m_sendnotifyresp_ind(self):
         message = MMSMessage()
         message.headers['Transaction-Id'] = 'NOK5AIdhfTMYSG4JeIgAAsHtp72AGAAAAAAAA'
@@ -376,3 +510,185 @@ class TestMmsDecoding(unittest.TestCase):
             149, 129, 132, 163, 1, 35, 129]
 
         self.assertEqual(list(message.encode()[:50]), data)
+
+
+class TestMmsStreamEncoding(unittest.TestCase):
+
+    def setUp(self):
+        # a GIF taken out of one of the test messages
+        path = os.path.join(DATA_DIR, 'BTMMS.MMS')
+        image = MMSMessage.from_file(path).data_parts[1].data
+        fd, self.image_path = tempfile.mkstemp(suffix='.gif')
+        os.write(fd, image)
+        os.close(fd)
+
+    def tearDown(self):
+        os.unlink(self.image_path)
+
+    def get_message(self):
+        message = MMSMessage()
+        message.headers['Transaction-Id'] = 'T1'
+        message.headers['To'] = '+34231342234/TYPE=PLMN'
+        message.headers['Subject'] = 'stream'
+        page = MMSMessagePage()
+        page.add_image(self.image_path)
+        page.add_text('hello')
+        message.add_page(page)
+        return message
+
+    def test_data_parts(self):
+        message = self.get_message()
+        parts = message.data_parts
+        self.assertEqual([part.content_type for part in parts],
+                         ['application/smil', 'image/gif', 'text/plain'])
+        self.assertEqual(parts[0].data, message.smil())
+        self.assertTrue(parts[1] is message.pages[0].image[0])
+
+    def test_part_index(self):
+        message = self.get_message()
+        image = message.pages[0].image[0]
+        self.assertTrue(message.get_part('cid:image') is None)
+        self.assertTrue(message.get_part_by_location(
+            os.path.basename(self.image_path)) is image)
+
+        part = DataPart()
+        part.set_data('x', 'text/plain')
+        part.headers['Content-ID'] = '<a b>'
+        message.add_data_part(part)
+        self.assertTrue(message.get_part('cid:a%20b') is part)
+        self.assertEqual(len(message.get_parts_by_content_type('text/plain')),
+                         2)
+
+        page = MMSMessagePage()
+        page.add_text('bye')
+        message.add_page(page)
+        self.assertTrue(page.text[0] in
+                        message.get_parts_by_content_type('text/plain'))
+
+        part.headers['Content-Location'] = 'a.txt'
+        self.assertEqual(message.get_part('a.txt'), None)
+        message.reindex_parts()
+        self.assertTrue(message.get_part('a.txt') is part)
+
+    def test_encode_to_matches_encode(self):
+        message = self.get_message()
+        expected = message.encode().tostring()
+
+        f = StringIO()
+        written = self.get_message().encode_to(f)
+        self.assertEqual(f.getvalue(), expected)
+        self.assertEqual(written, len(expected))
+
+    def test_encode_to_reads_files_in_chunks(self):
+        message = self.get_message()
+        expected = message.encode().tostring()
+
+        chunks = []
+        message = self.get_message()
+        MMSEncoder().encode_to(message, StringIO(), chunk_size=1024)
+        image = message.pages[0].image[0]
+        self.assertEqual(image._data, None)
+        self.assertEqual(
+            [len(c) for c in image.iter_chunks(4096)][:2], [4096, 4096])
+
+        class Socket(object):
+            def sendall(self, data):
+                chunks.append(str(data))
+
+        self.get_message().encode_to(Socket())
+        self.assertEqual(''.join(chunks), expected)
+
+    def test_encoded_size(self):
+        message = self.get_message()
+        size = message.encoded_size()
+        image = message.pages[0].image[0]
+        # the image was measured with a stat, not read
+        self.assertEqual(image._data, None)
+        self.assertEqual(size, len(message.encode()))
+
+        encoded = MMSEncoder()
+        encoded.encode(message)
+        for part in encoded.get_message_parts():
+            header = encoded.encode_part_header(part)
+            self.assertEqual(part.encoded_size(), len(header) + len(part))
+
+        measured = 0
+        for path in sorted(os.listdir(DATA_DIR)):
+            mms = MMSMessage.from_file(os.path.join(DATA_DIR, path))
+            try:
+                data = mms.encode()
+            except EncodeError:
+                # some decoded headers can not be encoded yet
+                continue
+
+            self.assertEqual(mms.encoded_size(), len(data), path)
+            measured += 1
+
+        self.assertTrue(measured > 5)
+
+    def test_encode_to_decoded_message(self):
+        path = os.path.join(DATA_DIR, 'BTMMS.MMS')
+        mms = MMSMessage.from_file(path, use_mmap=True)
+        part = mms.data_parts[1]
+        message = MMSMessage()
+        message.add_data_part(part)
+
+        f = StringIO()
+        message.encode_to(f)
+        self.assertEqual(f.getvalue(), message.encode().tostring())
+        # the payload was written out of the mapping
+        self.assertNotEqual(part._view, None)
+
+        decoded = MMSMessage.from_data(f.getvalue())
+        self.assertEqual(len(decoded.data_parts), 2)
+        self.assertEqual(decoded.data_parts[1].data, part.data)
+
+
+class TestMmsTemplate(unittest.TestCase):
+
+    def get_message(self):
+        message = MMSMessage()
+        message.headers['Subject'] = 'fan-out'
+        message.headers['From'] = '+34600000000/TYPE=PLMN'
+        page = MMSMessagePage()
+        page.add_text('hello')
+        message.add_page(page)
+        part = DataPart()
+        part.set_data('\x00' * 4096, 'application/octet-stream')
+        message.add_data_part(part)
+        return message
+
+    def test_template_matches_encode(self):
+        message = self.get_message()
+        template = message.template()
+
+        for number in ('+34611111111', '+34622222222'):
+            headers = {'To': number + '/TYPE=PLMN',
+                       'Transaction-Id': 'T' + number}
+            message.headers.update(headers)
+            expected = message.encode().tostring()
+
+            buffers = template.encode(headers)
+            self.assertEqual(len(buffers), 2)
+            self.assertTrue(buffers[1] is template.body)
+            self.assertEqual(''.join(buffers), expected)
+
+            self.assertEqual(template.encoded_size(headers), len(expected))
+            f = StringIO()
+            self.assertEqual(template.encode_to(f, headers), len(expected))
+            self.assertEqual(f.getvalue(), expected)
+
+        decoded = MMSMessage.from_data(''.join(template.encode(headers)))
+        self.assertEqual(decoded.headers['To'], '+34622222222/TYPE=PLMN')
+        self.assertEqual(decoded.data_parts[-1].data, '\x00' * 4096)
+
+    def test_template_is_a_snapshot(self):
+        message = self.get_message()
+        template = message.template()
+        message.headers['Subject'] = 'changed'
+        message.add_data_part(DataPart())
+        self.assertEqual(template.headers['Subject'], 'fan-out')
+        headers = {'To': '1/TYPE=PLMN', 'Transaction-Id': 'T1'}
+        self.assertEqual(''.join(template.encode(headers)),
+                         ''.join(self.get_message().template().encode(
+                                                                 headers)))
@@ -0,0 +1,168 @@
+from array import array
+from datetime import datetime
+import unittest
+
+from messaging.mms import wbxml
+from messaging.mms.message import MMSMessage
+from messaging.mms.push import (MMSNotification, PushDispatcher, PushPDU,
+                                NotificationEncoder, SI_CONTENT_TYPE,
+                                decode_mms_notification,
+                                decode_notification_ind, decode_push,
+                                dispatcher, encode_notification_ind,
+                                encode_push)
+from messaging.mms.wsp_pdu import DecodeError
+from messaging.sms.wap import extract_mms_notification
+
+MMS_PUSH = array('B', [1, 6, 34, 97, 112, 112, 108, 105, 99, 97, 116, 105,
+    111, 110, 47, 118, 110, 100, 46, 119, 97, 112, 46, 109, 109, 115, 45,
+    109, 101, 115, 115, 97, 103, 101, 0, 175, 132, 140, 130, 152, 78,
+    79, 75, 53, 67, 105, 75, 99, 111, 84, 77, 89, 83, 71, 52, 77, 66,
+    83, 119, 65, 65, 115, 75, 118, 49, 52, 70, 85, 72, 65, 65, 65, 65,
+    65, 65, 65, 65, 0, 141, 144, 137, 25, 128, 43, 52, 52, 55, 55, 56,
+    53, 51, 52, 50, 55, 52, 57, 47, 84, 89, 80, 69, 61, 80, 76, 77, 78,
+    0, 138, 128, 142, 2, 116, 0, 136, 5, 129, 3, 1, 25, 64, 131, 104,
+    116, 116, 112, 58, 47, 47, 112, 114, 111, 109, 109, 115, 47, 115,
+    101, 114, 118, 108, 101, 116, 115, 47, 78, 79, 75, 53, 67, 105, 75,
+    99, 111, 84, 77, 89, 83, 71, 52, 77, 66, 83, 119, 65, 65, 115, 75,
+    118, 49, 52, 70, 85, 72, 65, 65, 65, 65, 65, 65, 65, 65, 0]).tostring()
+
+SI_PUSH = ('\x01\x06\x0b\x03\xae\x81\xea\xc3\x95\x8d\x01\xa2\xb4\x84\x03\x05'
+           'j\n Vodafone\x00E\xc6\x0c\x03wap.meincallya.de/\x00\x08\x01\x03Zum '
+           'kostenlosen Portal "Mein\x00\x83\x00\x03" - einfach auf den '
+           'folgenden Link klicken oder die Seite direkt aufrufen. Ihr\x00'
+           '\x83\x00\x03 Team\x00\x01\x01')
+
+
+class TestPush(unittest.TestCase):
+
+    def test_decode_push(self):
+        push = decode_push(MMS_PUSH)
+        self.assertEqual(push.transaction_id, 1)
+        self.assertEqual(push.pdu_type, 0x06)
+        self.assertEqual(push.content_type, 'application/vnd.wap.mms-message')
+        self.assertEqual(push.application_id, 'x-wap-application:mms.ua')
+        self.assertTrue(push.is_mms_notification())
+        self.assertEqual(push.body, MMS_PUSH[37:])
+
+        push = decode_push(array('B', MMS_PUSH[1:]), connectionless=False)
+        self.assertEqual(push.transaction_id, None)
+        self.assertEqual(push.body, MMS_PUSH[37:])
+
+    def test_decode_generic_push(self):
+        push = decode_push(SI_PUSH)
+        self.assertEqual(push.content_type, 'application/vnd.wap.sic')
+        self.assertEqual(push.content_type_parameters, {'Charset': 'utf-8'})
+        self.assertEqual(push.headers['Encoding-Version'], '1.5')
+        self.assertEqual(push.headers['Content-Length'], 162)
+        self.assertEqual(push.headers['Push-Flag'], 4)
+        self.assertFalse(push.is_mms_notification())
+        self.assertEqual(push.body[:2], '\x03\x05')
+
+    def test_decode_push_errors(self):
+        self.assertRaises(DecodeError, decode_push, '\x01\x04\x00')
+        self.assertRaises(DecodeError, decode_push, MMS_PUSH[:10])
+        self.assertRaises(DecodeError, decode_push, '\x01')
+
+    def test_decode_mms_notification(self):
+        notification = decode_mms_notification(MMS_PUSH)
+        self.assertTrue(isinstance(notification, MMSNotification))
+        self.assertEqual(notification.transaction_id,
+                         'NOK5CiKcoTMYSG4MBSwAAsKv14FUHAAAAAAAA')
+        self.assertEqual(notification.mms_version, '1.0')
+        self.assertEqual(notification.sender, '+447785342749/TYPE=PLMN')
+        self.assertEqual(notification.subject, None)
+        self.assertEqual(notification.message_class, 'Personal')
+        self.assertEqual(notification.message_size, 29696)
+        self.assertEqual(notification.expiry, 72000)
+        self.assertEqual(notification.content_location,
+            'http://promms/servlets/NOK5CiKcoTMYSG4MBSwAAsKv14FUHAAAAAAAA')
+        self.assertEqual(extract_mms_notification(MMS_PUSH), notification)
+
+    def test_decode_other_pushes(self):
+        self.assertEqual(decode_mms_notification(SI_PUSH), None)
+        # a MMS for another application
+        body = MMS_PUSH[37:]
+        data = encode_push(body, 'application/vnd.wap.mms-message',
+                           {'X-Wap-Application-Id': 'x-example:mms'})
+        self.assertEqual(decode_mms_notification(data), None)
+        data = encode_push(body, 'application/vnd.wap.mms-message')
+        self.assertEqual(decode_mms_notification(data),
+                         decode_mms_notification(MMS_PUSH))
+        # a m-delivery-ind
+        self.assertEqual(decode_notification_ind('\x8c\x86\x98a\x00'), None)
+        self.assertEqual(decode_notification_ind(''), None)
+
+    def test_encode_push(self):
+        body = wbxml.encode_sl('http://www.example.org/')
+        data = encode_push(body, 'application/vnd.wap.slc',
+                           {'X-Wap-Application-Id': 'x-wap-application:wml.ua'},
+                           transaction_id=7)
+        self.assertEqual(data[:5], '\x07\x06\x03\xb0\xaf')
+        push = decode_push(data)
+        self.assertEqual(push.transaction_id, 7)
+        self.assertEqual(push.content_type, 'application/vnd.wap.slc')
+        self.assertEqual(push.application_id, 'x-wap-application:wml.ua')
+        self.assertEqual(push.body, body)
+
+        data = encode_push('data', 'application/x-foo',
+                           {'X-Wap-Application-Id': 'x-example:foo'})
+        push = decode_push(data)
+        self.assertEqual(push.content_type, 'application/x-foo')
+        self.assertEqual(push.application_id, 'x-example:foo')
+        self.assertEqual(push.body, 'data')
+
+    def test_encode_notification(self):
+        encoder = NotificationEncoder(29696, 72000,
+                                      sender='+447785342749/TYPE=PLMN')
+        location = ('http://promms/servlets/'
+                    'NOK5CiKcoTMYSG4MBSwAAsKv14FUHAAAAAAAA')
+        data = encoder.encode_push('NOK5CiKcoTMYSG4MBSwAAsKv14FUHAAAAAAAA',
+                                   location, push_id=1)
+        # the same push, with the well-known code of the content type
+        self.assertEqual(data, '\x01\x06\x03\xbe' + MMS_PUSH[35:])
+        self.assertEqual(decode_mms_notification(data),
+                         decode_mms_notification(MMS_PUSH))
+
+        expiry = datetime(2011, 3, 4, 12, 30)
+        data = encode_notification_ind('1', 'http://x/1', 1024, expiry,
+                                       subject='Hi',
+                                       message_class='Advertisement')
+        notification = decode_notification_ind(data)
+        self.assertEqual(notification.transaction_id, '1')
+        self.assertEqual(notification.subject, 'Hi')
+        self.assertEqual(notification.message_class, 'Advertisement')
+        self.assertEqual(notification.message_size, 1024)
+        self.assertEqual(notification.expiry, expiry)
+        self.assertEqual(notification.content_location, 'http://x/1')
+
+
+class TestPushDispatcher(unittest.TestCase):
+
+    def test_default_dispatcher(self):
+        self.assertTrue(isinstance(dispatcher.dispatch(MMS_PUSH), MMSMessage))
+
+        si = dispatcher.dispatch(SI_PUSH)
+        self.assertEqual(si.tag, 'si')
+        self.assertEqual(si[0].get('href'), 'http://wap.meincallya.de/')
+
+        push = dispatcher.dispatch(encode_push('data', 'text/plain'))
+        self.assertTrue(isinstance(push, PushPDU))
+
+    def test_lookup_order(self):
+        pushes = PushDispatcher(default=lambda push: 'default')
+        pushes.register(lambda push: 'ctype', content_type=SI_CONTENT_TYPE)
+        pushes.register(lambda push: 'app', application_id='x-example:app')
+        pushes.register(lambda push: 'both', content_type=SI_CONTENT_TYPE,
+                        application_id='x-example:app')
+
+        app = {'X-Wap-Application-Id': 'x-example:app'}
+        self.assertEqual(pushes.dispatch(encode_push('', SI_CONTENT_TYPE, app)),
+                         'both')
+        self.assertEqual(pushes.dispatch(encode_push('', 'text/plain', app)),
+                         'app')
+        self.assertEqual(pushes.dispatch(SI_PUSH), 'ctype')
+        self.assertEqual(pushes.dispatch(MMS_PUSH), 'default')
+
+        pushes.unregister(content_type=SI_CONTENT_TYPE)
+        self.assertEqual(pushes.dispatch(SI_PUSH), 'default')
+        self.assertRaises(ValueError, pushes.register, lambda push: None)
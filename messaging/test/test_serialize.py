@@ -0,0 +1,108 @@
+# -*- coding: utf-8 -*-
+from datetime import datetime, timedelta
+import os
+import unittest
+
+from messaging.mms.message import MMSMessage
+from messaging.serialize import (Record, dumps, loads, PDU_LIST,
+                                  SMS_DELIVER)
+from messaging.sms import SmsDeliver, SmsSubmit
+from messaging.utils import FixedOffset
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), 'mms-data')
+
+
+class TestSerialize(unittest.TestCase):
+
+    def test_sms_deliver(self):
+        for pdu in ["07914306073011F0040B914316709807F2000880604290224080084E2D5174901A8BAF",
+                    "0791538375000075061805810531F1019082416500400190824165004000"]:
+            sms = SmsDeliver(pdu)
+            loaded = loads(dumps(sms))
+            self.assertTrue(isinstance(loaded, SmsDeliver))
+            self.assertEqual(loaded.data, sms.data)
+            self.assertEqual(loaded.pdu, pdu)
+
+    def test_sms_deliver_layouts(self):
+        sms = SmsDeliver("07911326040000F0040B911346610089F60000208062917314080CC8F71D14969741F977FD07",
+                         keep_pdu=False)
+        packed = dumps(sms)
+        sms.csca = None
+        sms.text = 'raw'
+        sms.dcs = 0
+        self.assertEqual(loads(dumps(sms)).data, sms.data)
+
+        # the fields that do not fit in the fixed layout
+        sms.date = datetime(2010, 12, 31, tzinfo=FixedOffset(60, 'CET'))
+        sms.pid = 0x100
+        generic = dumps(sms)
+        self.assertTrue(len(generic) > len(packed))
+        loaded = loads(generic)
+        self.assertEqual(loaded.data, sms.data)
+        self.assertEqual(loaded.date.tzname(), 'CET')
+        self.assertEqual(loaded.pdu, None)
+
+        for data in (packed, generic):
+            record = Record(data)
+            self.assertEqual(record.kind, SMS_DELIVER)
+            self.assertEqual(record['number'], '+31641600986')
+            self.assertRaises(ValueError, loads, data[:-20])
+
+    def test_sms_deliver_udh(self):
+        sms = SmsDeliver("07919471227210244405852122F039F1015062712181804F"
+                         "050003190202E4E8309B5E7683DAFC319A5E76B340F73D9A"
+                         "5D7683A6E93268FD9ED3CB6EF67B0E5AD172B19B2C2693C9"
+                         "602E90355D6683A6F0B007946E8382F5393BEC26BB00")
+        loaded = loads(dumps(sms))
+        self.assertEqual(loaded.udh.concat.ref, sms.udh.concat.ref)
+        self.assertEqual(loaded.udh.headers, sms.udh.headers)
+        self.assertEqual(loaded.text, sms.text)
+
+    def test_sms_submit(self):
+        sms = SmsSubmit("+34616585119", u"あ" * 80)
+        sms.ref = 0x21
+        sms.rand_id = 0x18
+        sms.validity = datetime(2010, 12, 31, 23, 59, 59,
+                                tzinfo=FixedOffset(60, 'CET'))
+        loaded = loads(dumps(sms))
+        self.assertEqual(loaded.validity, sms.validity)
+        self.assertEqual(loaded.validity.tzname(), 'CET')
+        self.assertEqual([p.pdu for p in loaded.to_pdu()],
+                         [p.pdu for p in sms.to_pdu()])
+
+        sms.validity = timedelta(hours=5)
+        self.assertEqual(loads(dumps(sms)).validity, timedelta(hours=5))
+
+    def test_pdu_list(self):
+        pdus = SmsSubmit("+34616585119", "hey " * 50).to_pdu()
+        loaded = loads(dumps(pdus))
+        self.assertEqual([(p.pdu, p.length, p.cnt, p.seq) for p in loaded],
+                         [(p.pdu, p.length, p.cnt, p.seq) for p in pdus])
+        record = Record(dumps(pdus))
+        self.assertEqual(record.kind, PDU_LIST)
+        self.assertEqual(record['pdus'][1][3], 2)
+        self.assertEqual(len(record.load()), len(pdus))
+
+        pdus[0].length = 0x100
+        self.assertEqual(loads(dumps(pdus))[0].length, 0x100)
+
+    def test_mms_headers(self):
+        path = os.path.join(DATA_DIR, 'SonyEricssonT310-R201.mms')
+        mms = MMSMessage.from_file(path)
+        record = Record(dumps(mms))
+        self.assertEqual(sorted(record.keys()), sorted(mms.headers))
+        self.assertEqual(record['Date'], mms.headers['Date'])
+        self.assertEqual(loads(dumps(mms)).headers, mms.headers)
+
+    def test_lazy_record(self):
+        sms = SmsDeliver("07911326040000F0040B911346610089F60000208062917314080CC8F71D14969741F977FD07")
+        record = Record('xx' + dumps(sms), 2)
+        self.assertEqual(record['text'], "How are you?")
+        self.assertEqual(record.get('foo', 1), 1)
+        self.assertRaises(KeyError, record.__getitem__, 'foo')
+
+    def test_invalid_data(self):
+        self.assertRaises(ValueError, loads, 'XX\x01\x01\x00\x00')
+        self.assertRaises(ValueError, loads, 'PM\x02\x01\x00\x00')
+        self.assertRaises(ValueError, loads, 'PM')
+        self.assertRaises(TypeError, dumps, object())
@@ -0,0 +1,143 @@
+import unittest
+from xml.dom import minidom
+
+from messaging.mms.message import DataPart, MMSMessage, MMSMessagePage
+from messaging.mms.smil import (SmilParser, SmilWriter, escape_attr,
+                                 generate_smil, parse_clock_value,
+                                 parse_smil)
+
+HEAD = ('<smil><head><layout><root-layout width="176" height="220"/>'
+        '<region id="Image" left="0" top="0" width="176" height="144"/>'
+        '<region id="Text" left="0" top="144" width="176" height="76"/>'
+        '</layout></head><body>')
+
+
+def get_part(content_type, **headers):
+    part = DataPart()
+    part.set_data('data', content_type)
+    part.headers.update(headers)
+    return part
+
+
+class TestSmil(unittest.TestCase):
+
+    def test_escape_attr(self):
+        self.assertEqual(escape_attr('a&b<c>"d"'),
+                         'a&amp;b&lt;c&gt;&quot;d&quot;')
+        self.assertEqual(escape_attr('a\tb\r\n'), 'a&#9;b&#13;&#10;')
+        self.assertEqual(escape_attr(u'\xf1'), '\xc3\xb1')
+        self.assertEqual(escape_attr(176), '176')
+
+    def test_empty_presentation(self):
+        self.assertEqual(generate_smil([]), HEAD + '</body></smil>')
+
+    def test_pages(self):
+        page = MMSMessagePage()
+        page.image = (get_part('image/gif', **{'Content-Location': 'a.gif'}),
+                      0, 0)
+        page.text = (get_part('text/plain', **{'Content-ID': '<t0>'}), 0, 0)
+        page.audio = (get_part('audio/amr', **{'Content-Location': 'a.amr'}),
+                      350, 6000)
+        page.set_duration(5000)
+
+        expected = (HEAD + '<par dur="5000ms">'
+                    '<img src="a.gif" region="Image"/>'
+                    '<text src="cid:t0" region="Text"/>'
+                    '<audio src="a.amr" begin="350ms" end="5000ms"/>'
+                    '</par></body></smil>')
+        self.assertEqual(generate_smil([page]), expected)
+        self.assertEqual(generate_smil([page]), expected)
+
+    def test_attributes_are_escaped(self):
+        page = MMSMessagePage()
+        page.image = (get_part('image/gif',
+                               **{'Content-Location': 'a"<b>&.gif'}), 0, 0)
+        smil = generate_smil([page], meta={'title': 'Tom & "Jerry"'})
+
+        doc = minidom.parseString(smil)
+        meta = doc.getElementsByTagName('meta')[0]
+        self.assertEqual(meta.getAttribute('content'), 'Tom & "Jerry"')
+        img = doc.getElementsByTagName('img')[0]
+        self.assertEqual(img.getAttribute('src'), 'a"<b>&.gif')
+
+    def test_head_is_cached(self):
+        writer = SmilWriter(maxsize=2)
+        regions = (('Image', 0, 0, '100%', '50%'),)
+        head = writer.head(160, 120, regions, {'author': 'me'})
+        self.assertTrue(head is writer.head(160, 120, regions,
+                                            {'author': 'me'}))
+        self.assertFalse(head is writer.head(160, 120))
+        self.assertEqual(head, '<smil><head>'
+                         '<meta name="author" content="me"/><layout>'
+                         '<root-layout width="160" height="120"/>'
+                         '<region id="Image" left="0" top="0" width="100%" '
+                         'height="50%"/></layout></head><body>')
+
+        writer.clear()
+        self.assertEqual(len(writer._heads), 0)
+
+    def test_message_smil(self):
+        mms = MMSMessage()
+        mms.width, mms.height = 320, 240
+        page = MMSMessagePage()
+        page.add_text('hello')
+        mms.add_page(page)
+
+        smil = mms.smil()
+        self.assertTrue(smil.startswith('<smil><head><layout>'
+                                        '<root-layout width="320" '
+                                        'height="240"/>'))
+        self.assertTrue('<par dur="4000ms"><text src="hello" region="Text"/>'
+                        '</par>' in smil)
+        self.assertEqual(mms.smil(), smil)
+
+
+class TestSmilParsing(unittest.TestCase):
+
+    def test_parse_clock_value(self):
+        self.assertEqual(parse_clock_value('6825ms'), 6825)
+        self.assertEqual(parse_clock_value('1.5s'), 1500)
+        self.assertEqual(parse_clock_value(' 5 '), 5000)
+        self.assertEqual(parse_clock_value('2min'), 120000)
+        self.assertEqual(parse_clock_value('1h'), 3600000)
+        self.assertEqual(parse_clock_value('01:30'), 90000)
+        self.assertEqual(parse_clock_value('1:00:01.5'), 3601500)
+        self.assertEqual(parse_clock_value('indefinite'), None)
+
+    def test_parse_in_chunks(self):
+        smil = ('<smil><body><par dur="5s"><img src="a.gif" region="Image"/>'
+                '<audio src="cid:a%40b" begin="350ms" end="1s"/></par>'
+                '<seq><par><text src="t.txt"/><par><ref src="v.3gp"/></par>'
+                '</par></seq></body></smil>')
+        parser = SmilParser()
+        for i in range(0, len(smil), 7):
+            parser.feed(smil[i:i + 7])
+
+        slides = parser.close()
+        self.assertEqual(len(slides), 2)
+        self.assertEqual(slides[0].duration, 5000)
+        self.assertEqual(slides[0].media,
+                         [('img', 'a.gif', 'Image', None, None),
+                          ('audio', 'cid:a%40b', None, 350, 1000)])
+        self.assertEqual(slides[1].duration, None)
+        self.assertEqual(slides[1].media,
+                         [('text', 't.txt', None, None, None),
+                          ('ref', 'v.3gp', None, None, None)])
+
+    def test_parse_not_well_formed(self):
+        smil = ('<smil><body><par dur="1s"><img src="a.gif"></img></par>'
+                '</body></smil>\x00\x00')
+        slides = parse_smil([smil])
+        self.assertEqual(len(slides), 1)
+        self.assertEqual(slides[0].media[0][1], 'a.gif')
+
+    def test_written_smil_parses_back(self):
+        page = MMSMessagePage()
+        page.image = (get_part('image/gif', **{'Content-Location': 'a.gif'}),
+                      100, 0)
+        page.set_duration(2500)
+
+        slides = parse_smil([generate_smil([page, page])])
+        self.assertEqual([s.duration for s in slides], [2500, 2500])
+        self.assertEqual(slides[0].media,
+                         [('img', 'a.gif', 'Image', 100, None)])
@@ -1,5 +1,6 @@
 # -*- coding: utf-8 -*-
 from datetime import datetime, timedelta
+import pickle
 
 try:
     import unittest2 as unittest
@@ -187,6 +188,46 @@ class TestSmsSubmit(unittest.TestCase):
         pdu = sms.to_pdu()[0]
         self.assertEqual(pdu.pdu, expected)
 
+    def test_encoding_8bit_port_addressed_message(self):
+        sms = SmsSubmit("01000000000", "\x01\x06\x03\xbe")
+        sms.ref = 0x0
+        sms.ports = (2948, 9200)
+        self.assertEqual(sms.ports.dest_port, 2948)
+        self.assertFalse(sms.ports.eight_bits)
+
+        pdu = sms.to_pdu()[0]
+        # UDHI set, 8-bit data and the 16-bit port addressing IE
+        self.assertEqual(pdu.pdu, "004100"
+                                  "0B811000000000F00004"
+                                  "0B0605040B8423F0010603BE")
+
+        sms = SmsSubmit("01000000000", "text")
+        sms.fmt = 0x00
+        sms.ports = (2948, 9200)
+        self.assertRaises(ValueError, sms.to_pdu)
+
+    def test_encoding_multipart_8bit(self):
+        data = ''.join(map(chr, range(256))) * 2
+        sms = SmsSubmit("01000000000", data)
+        sms.ref = 0x0
+        sms.rand_id = 0x42
+        sms.ports = (2948, 9200)
+
+        pdus = sms.to_pdu()
+        self.assertEqual(len(pdus), 4)
+        payload = ''
+        for i, pdu in enumerate(pdus):
+            udh = "0B000342%02X%02X05040B8423F0" % (len(pdus), i + 1)
+            start = pdu.pdu.index(udh) + len(udh)
+            # the UDL counts the header and the data in octets
+            self.assertEqual(int(pdu.pdu[start - len(udh) - 2:
+                                         start - len(udh)], 16),
+                             len(udh) / 2 + len(pdu.pdu[start:]) / 2)
+            self.assertTrue(len(pdu.pdu[start:]) / 2 <= 128)
+            payload += pdu.pdu[start:].decode('hex')
+
+        self.assertEqual(payload, data)
+
     def test_encoding_ucs2_message(self):
         number = '2b3334363136353835313139'.decode('hex')
         text = u'あ叶葉'
@@ -240,6 +281,20 @@ class TestSmsSubmit(unittest.TestCase):
         sms = SmsSubmit("54342342", "text")
         self.assertRaises(ValueError, setattr, sms, 'csca', "1badcsca")
 
+    def test_message_references_cycle(self):
+        sms = SmsSubmit("54342342", "text")
+        ids = [sms._get_rand_id() for i in range(256)]
+        self.assertEqual(ids, range(0, 255) + [0])
+        self.assertEqual(sms.id_list, range(1, 255))
+
+    def test_pickling_pdus(self):
+        sms = SmsSubmit("+34616585119", "hey " * 50)
+        for protocol in (0, 2):
+            pdus = sms.to_pdu()
+            loaded = pickle.loads(pickle.dumps(pdus, protocol))
+            self.assertEqual([(p.pdu, p.length, p.cnt, p.seq) for p in pdus],
+                             [(p.pdu, p.length, p.cnt, p.seq) for p in loaded])
+
 
 class TestSubmitPduCounts(unittest.TestCase):
 
@@ -469,6 +524,21 @@ class TestSmsDeliver(unittest.TestCase):
         self.assertEqual(data['ref'], 5)
         self.assertEqual(sms.sr, sr)
 
+    def test_decoding_without_keeping_pdu(self):
+        pdu = "07911326040000F0040B911346610089F60000208062917314080CC8F71D14969741F977FD07"
+        sms = SmsDeliver(pdu, keep_pdu=False)
+        self.assertEqual(sms.pdu, None)
+        self.assertEqual(sms.text, "How are you?")
+        self.assertEqual(SmsDeliver(pdu).pdu, pdu)
+
+    def test_pickling(self):
+        pdu = "0791538375000075061805810531F1019082416500400190824165004000"
+        for protocol in (0, 2):
+            sms = pickle.loads(pickle.dumps(SmsDeliver(pdu), protocol))
+            self.assertEqual(sms.pdu, pdu)
+            self.assertEqual(sms.data, SmsDeliver(pdu).data)
+            self.assertEqual(sms.udh.concat.ref, 24)
+
 # XXX: renable when support added
 #    def test_decoding_submit_status_report(self):
 #        # sent from SMSC to indicate submission failed or additional info
@@ -1,6 +1,6 @@
 import unittest
 
-from messaging.sms.udh import UserDataHeader
+from messaging.sms.udh import ConcatReference, PortAddress, UserDataHeader
 from messaging.utils import to_array
 
 
@@ -22,3 +22,21 @@ class TestUserDataHeader(unittest.TestCase):
         self.assertEqual(udh.concat.seq, 1)
         self.assertEqual(udh.concat.cnt, 2)
         self.assertEqual(udh.concat.ref, 25)
+
+    def test_port_address_width(self):
+        udh = UserDataHeader.from_bytes(to_array("0402f5f0"))
+        self.assertEqual(udh.ports.dest_port, 245)
+        self.assertTrue(udh.ports.eight_bits)
+
+        udh = UserDataHeader.from_bytes(to_array("05040b8423f0"))
+        self.assertFalse(udh.ports.eight_bits)
+
+    def test_to_bytes(self):
+        self.assertEqual(PortAddress(2948, 9200, False).to_bytes(),
+                         '\x05\x04\x0b\x84\x23\xf0')
+        self.assertEqual(PortAddress(245, 240, True).to_bytes(),
+                         '\x04\x02\xf5\xf0')
+        self.assertEqual(ConcatReference(25, 2, 1, True).to_bytes(),
+                         '\x00\x03\x19\x02\x01')
+        self.assertEqual(ConcatReference(40846, 2, 1, False).to_bytes(),
+                         '\x08\x04\x9f\x8e\x02\x01')
@@ -5,7 +5,9 @@ import unittest
 from messaging.sms import SmsDeliver
 from messaging.sms.wap import (is_a_wap_push_notification as is_push,
                                is_mms_notification,
-                               extract_push_notification)
+                               extract_push_notification, PortDispatcher,
+                               PushSmsBuilder)
+from messaging.mms.push import NotificationEncoder
 
 
 def list_to_str(l):
@@ -138,3 +140,91 @@ class TestSmsWapPush(unittest.TestCase):
 
         push = extract_push_notification(data)
         self.assertEqual(is_mms_notification(push), False)
+        self.assertEqual(push.tag, 'si')
+        self.assertEqual(push[0].get('href'), 'http://wap.meincallya.de/')
+
+
+MMS_PDUS = [
+    "0791447758100650400E80885810000000810004016082415464408C0C08049F8E020105040B8423F00106226170706C69636174696F6E2F766E642E7761702E6D6D732D6D65737361676500AF848C82984E4F4B3543694B636F544D595347344D4253774141734B7631344655484141414141414141008D908919802B3434373738353334323734392F545950453D504C4D4E008A808E0274008805810301194083687474703A2F",
+    "0791447758100650440E8088581000000081000401608241547440440C08049F8E020205040B8423F02F70726F6D6D732F736572766C6574732F4E4F4B3543694B636F544D595347344D4253774141734B763134465548414141414141414100",
+]
+
+SI_PDUS = [
+    "0791947122725014440C8500947122921105F5112042519582408C0B05040B8423F0000396020101060B03AE81EAC3958D01A2B48403056A0A20566F6461666F6E650045C60C037761702E6D65696E63616C6C79612E64652F000801035A756D206B6F7374656E6C6F73656E20506F7274616C20224D65696E0083000322202D2065696E66616368206175662064656E20666F6C67656E64656E204C696E6B206B6C69636B656E",
+    "0791947122725014440C8500947122921105F5112042519592403C0B05040B8423F00003960202206F6465722064696520536569746520646972656B7420617566727566656E2E2049687200830003205465616D000101",
+]
+
+
+class TestPortDispatcher(unittest.TestCase):
+
+    def test_dispatch_wap_pushes(self):
+        dispatcher = PortDispatcher()
+        first, second = [SmsDeliver(pdu) for pdu in MMS_PDUS]
+        self.assertEqual(dispatcher.dispatch(second), None)
+        self.assertEqual(len(dispatcher), 1)
+        # a repeated part is not counted twice
+        self.assertEqual(dispatcher.dispatch(second), None)
+
+        mms = dispatcher.dispatch(first)
+        self.assertEqual(len(dispatcher), 0)
+        self.assertEqual(mms.headers['Content-Location'],
+                'http://promms/servlets/NOK5CiKcoTMYSG4MBSwAAsKv14FUHAAAAAAAA')
+
+        si = None
+        for pdu in SI_PDUS:
+            si = dispatcher.dispatch(SmsDeliver(pdu))
+        self.assertEqual(si[0].get('href'), 'http://wap.meincallya.de/')
+
+    def test_port_handlers(self):
+        dispatcher = PortDispatcher()
+        dispatcher.register(2948, len)
+        for pdu in MMS_PDUS:
+            length = dispatcher.dispatch(SmsDeliver(pdu))
+        self.assertEqual(length, 182)
+
+        dispatcher.unregister(2948)
+        self.assertEqual(dispatcher.dispatch(SmsDeliver(MMS_PDUS[0])), None)
+        self.assertEqual(len(dispatcher), 0)
+
+        # not port addressed
+        sms = SmsDeliver("07911326040000F0040B911346610089F60000208062917314080CC8F71D14969741F977FD07")
+        self.assertEqual(dispatcher.dispatch(sms), None)
+
+    def test_bounded_reassembly(self):
+        now = [0]
+        dispatcher = PortDispatcher(maxsize=1, timeout=10,
+                                    clock=lambda: now[0])
+        self.assertEqual(dispatcher.dispatch(SmsDeliver(MMS_PDUS[0])), None)
+        # the SI push evicts the incomplete MMS notification
+        self.assertEqual(dispatcher.dispatch(SmsDeliver(SI_PDUS[0])), None)
+        self.assertEqual(dispatcher.dropped, 1)
+        self.assertEqual(dispatcher.dispatch(SmsDeliver(MMS_PDUS[1])), None)
+        self.assertEqual(dispatcher.dropped, 2)
+
+        # the first part is too old by the time the second one arrives
+        now[0] = 11
+        self.assertEqual(dispatcher.dispatch(SmsDeliver(MMS_PDUS[0])), None)
+        self.assertEqual(dispatcher.dropped, 3)
+        self.assertEqual(len(dispatcher), 1)
+
+
+class TestPushSmsBuilder(unittest.TestCase):
+
+    def test_build_notifications(self):
+        encoder = NotificationEncoder(29696, 72000)
+        builder = PushSmsBuilder(csca="+447785016005")
+        notifications = [
+            ("+447700900001", "T1", "http://mmsc/1"),
+            ("+447700900002", "T2", "http://mmsc/" + "2" * 200),
+        ]
+        built = list(builder.build_notifications(encoder, notifications))
+        self.assertEqual([number for number, pdus in built],
+                         ["+447700900001", "+447700900002"])
+
+        first, second = [pdus for number, pdus in built]
+        self.assertEqual(len(first), 1)
+        self.assertTrue("05040B8423F0" in first[0].pdu)
+        self.assertEqual(len(second), 2)
+        # the second push has its own concatenation reference
+        self.assertTrue("0B00030102" in second[0].pdu)
+        self.assertTrue("0B00030102" in second[1].pdu)
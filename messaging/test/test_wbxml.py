@@ -0,0 +1,93 @@
+# -*- coding: utf-8 -*-
+import unittest
+
+from messaging.mms import wbxml
+from messaging.mms.wsp_pdu import DecodeError, EncodeError
+
+SI = ('\x03\x05j\n Vodafone\x00E\xc6\x0c\x03wap.meincallya.de/\x00\x08\x01'
+      '\x03Zum kostenlosen Portal "Mein\x00\x83\x00\x03" - einfach auf den '
+      'folgenden Link klicken oder die Seite direkt aufrufen. Ihr\x00\x83'
+      '\x00\x03 Team\x00\x01\x01')
+
+TEXT = (u'Zum kostenlosen Portal "Mein Vodafone" - einfach auf den folgenden '
+        u'Link klicken oder die Seite direkt aufrufen. Ihr Vodafone Team')
+
+
+class TestWBXML(unittest.TestCase):
+
+    def test_parse_si(self):
+        si = wbxml.parse(SI)
+        self.assertEqual(si.tag, 'si')
+        indication = si[0]
+        self.assertEqual(indication.tag, 'indication')
+        self.assertEqual(indication.get('href'), 'http://wap.meincallya.de/')
+        self.assertEqual(indication.get('action'), 'signal-high')
+        self.assertEqual(indication.text, TEXT)
+
+    def test_iterparse_si(self):
+        parser = wbxml.Parser(SI)
+        self.assertEqual(parser.version, 0x03)
+        self.assertEqual(parser.public_id, 0x05)
+        self.assertEqual(parser.charset, 0x6a)
+        self.assertTrue(parser.language is wbxml.SI)
+
+        events = list(parser)
+        self.assertEqual(events[0], ('start', ('si', {})))
+        self.assertEqual(events[2], ('text', u'Zum kostenlosen Portal "Mein'))
+        self.assertEqual(events[3], ('text', u' Vodafone'))
+        self.assertEqual(events[-2:], [('end', 'indication'), ('end', 'si')])
+
+    def test_encode_si(self):
+        data = wbxml.encode_si('https://www.example.com/a?b=1', u'Hola ñ',
+                               si_id='42', created='2010-05-01T12:00:00Z',
+                               action='signal-low')
+        self.assertEqual(data[:4], '\x03\x05\x6a\x00')
+        # the href is split in a prefix, an inline string and ".com/"
+        self.assertTrue('\x0f\x03example\x00\x85\x03a?b=1\x00' in data)
+        # the date is opaque, without its trailing zeroes
+        self.assertTrue('\n\xc3\x05\x20\x10\x05\x01\x12' in data)
+
+        indication = wbxml.parse(data)[0]
+        self.assertEqual(indication.text, u'Hola ñ')
+        self.assertEqual(dict(indication.items()), {
+            'href': 'https://www.example.com/a?b=1',
+            'si-id': '42',
+            'created': '2010-05-01T12:00:00Z',
+            'action': 'signal-low'})
+
+    def test_serialize_round_trip(self):
+        si = wbxml.parse(SI)
+        self.assertEqual(wbxml.parse(wbxml.serialize(si, wbxml.SI))[0].text,
+                         TEXT)
+
+    def test_encode_sl(self):
+        data = wbxml.encode_sl('http://www.example.org/', 'execute-high')
+        self.assertEqual(data, '\x03\x06\x6a\x00\x85\x06\x0a\x03example'
+                               '\x00\x88\x01')
+        sl = wbxml.parse(data)
+        self.assertEqual(sl.tag, 'sl')
+        self.assertEqual(sl.get('href'), 'http://www.example.org/')
+        self.assertEqual(sl.get('action'), 'execute-high')
+
+    def test_parse_opaque(self):
+        # http:// + opaque "ñ" + "/" in the href, opaque text in the SI
+        sl = wbxml.parse('\x03\x06\x6a\x00\x85\x09\xc3\x02\xc3\xb1'
+                         '\x03/\x00\x01')
+        self.assertEqual(sl.get('href'), u'http://ñ/')
+
+        si = wbxml.parse('\x03\x05\x6a\x00\x45\x46\xc3\x05Ol\xc3\xa9!'
+                         '\x01\x01')
+        self.assertEqual(si[0].text, u'Olé!')
+
+    def test_encode_errors(self):
+        self.assertRaises(EncodeError, wbxml.encode_sl, 'http://a/', 'run')
+        self.assertRaises(EncodeError, wbxml.encode_si, 'http://a/',
+                          created='2010-05-01')
+        self.assertRaises(EncodeError, wbxml.serialize,
+                          wbxml.build_sl('http://a/'), wbxml.SI)
+
+    def test_decode_errors(self):
+        self.assertRaises(DecodeError, wbxml.parse, SI[:30])
+        self.assertRaises(DecodeError, wbxml.parse, '\x03')
+        # unknown public identifier
+        self.assertRaises(DecodeError, wbxml.parse, '\x03\x7f\x6a\x00\x05')
@@ -0,0 +1,111 @@
+import unittest
+
+from messaging.mms.iterator import ByteCursor
+from messaging.mms.wsp_pdu import (ByteWriter, Decoder, DecodeError, Encoder,
+                                   header_code_pages,
+                                   register_header_code_page)
+
+
+class TestByteWriter(unittest.TestCase):
+
+    def test_write(self):
+        writer = ByteWriter()
+        writer.write('ab')
+        writer.write([0x81, 0x82])
+        writer.write_byte(0)
+        writer.write_uint_var(0x80)
+        writer.write_text_string('x')
+        self.assertEqual(len(writer), 9)
+        self.assertEqual(writer.getvalue(), 'ab\x81\x82\x00\x81\x00x\x00')
+        self.assertEqual(writer.tolist()[:2], [ord('a'), ord('b')])
+
+    def test_insert_value_length(self):
+        writer = ByteWriter()
+        writer.write_byte(0xff)
+        mark = writer.mark()
+        writer.write('a' * 30)
+        writer.insert_value_length(mark)
+        self.assertEqual(writer.getvalue()[:2], '\xff\x1e')
+
+        writer = ByteWriter()
+        writer.write('a' * 200)
+        writer.insert_value_length(0)
+        # Length-quote followed by an uintvar
+        self.assertEqual(writer.getvalue()[:3], '\x1f\x81\x48')
+        self.assertEqual(len(writer), 203)
+
+
+class TestEncoder(unittest.TestCase):
+
+    def test_encode_uint_var(self):
+        for value in (0, 1, 127, 128, 16383, 16384, 2 ** 28 + 5):
+            encoded = Encoder.encode_uint_var(value)
+            self.assertEqual(Decoder.decode_uint_var(ByteCursor(encoded)),
+                             value)
+
+        self.assertEqual(Encoder.encode_uint_var(0x3fff), [0xff, 0x7f])
+
+    def test_encode_content_general_form(self):
+        params = {'Start': '<0000>', 'Type': 'application/smil'}
+        media = 'application/vnd.wap.multipart.related'
+        encoded = Encoder.encode_content_type_value(media, params)
+        # the Value-length covers the media type and the parameters
+        self.assertEqual(encoded[0], len(encoded) - 1)
+
+        cursor = ByteCursor(encoded + [0xff])
+        self.assertEqual(Decoder.decode_content_type_value(cursor),
+                         (media, params))
+        self.assertEqual(cursor.remaining, 1)
+
+    def test_encode_long_integer(self):
+        self.assertEqual(Encoder.encode_long_integer(29696), [2, 0x74, 0x00])
+        self.assertEqual(Encoder.encode_long_integer(0), [1, 0])
+        for value in (1, 255, 256, 2 ** 40 + 3):
+            cursor = ByteCursor(Encoder.encode_long_integer(value))
+            self.assertEqual(Decoder.decode_long_integer(cursor), value)
+
+    def test_encode_media_type(self):
+        self.assertEqual(Encoder.encode_media_type('image/gif'), [0x9d])
+        self.assertEqual(Encoder.encode_media_type('a/b'),
+                         [ord('a'), ord('/'), ord('b'), 0])
+
+
+class TestDecoder(unittest.TestCase):
+
+    def test_decode_header_versions(self):
+        # Content-ID was assigned in WSP 1.3
+        data = '\xc0"<a>\x00'
+        self.assertEqual(Decoder.decode_header(ByteCursor(data)),
+                         ('Content-ID', '<a>'))
+        self.assertRaises(DecodeError, Decoder.decode_well_known_header,
+                          ByteCursor(data), '1.2')
+
+    def test_decode_headers(self):
+        data = '\x8etest.gif\x00X-Foo\x00bar\x00'
+        self.assertEqual(Decoder.decode_headers(ByteCursor(data)),
+                         {'Content-Location': 'test.gif', 'X-Foo': 'bar'})
+
+    def test_decode_headers_shift_sequence(self):
+        register_header_code_page(7, {0x01: ('X-Seven', 'integer_value')})
+        try:
+            # Shift-delimiter, Short-cut-shift-delimiter, back to page 1
+            data = ('\x7f\x07\x81\x85' '\x08\x81a\x00'
+                    '\x01\x8etest.gif\x00')
+            self.assertEqual(Decoder.decode_headers(ByteCursor(data)), {
+                'X-Seven': 5,
+                'X-Wsp-Page-8-Field-1': 'a',
+                'Content-Location': 'test.gif',
+            })
+        finally:
+            del header_code_pages[7]
+
+    def test_decode_parameter_versions(self):
+        # Name (0x17) was reassigned in WSP 1.4
+        data = '\x97x.gif\x00'
+        self.assertEqual(
+            Decoder.decode_well_known_parameter(ByteCursor(data), '1.4'),
+            ('Name', 'text_value'))
+        self.assertRaises(DecodeError, Decoder.decode_well_known_parameter,
+                          ByteCursor(data), '1.2')
+        self.assertRaises(ValueError, Decoder.decode_well_known_parameter,
+                          ByteCursor(data), '2.0')
@@ -44,6 +44,102 @@ class FixedOffset(tzinfo):
         return timedelta(0)
 
 
+class SlotsPickleMixin(object):
+    """
+    I make classes with ``__slots__`` picklable with any protocol
+
+    Only the slots that have been set are pickled.
+    """
+    __slots__ = ()
+
+    def __getstate__(self):
+        state = {}
+        for klass in type(self).__mro__:
+            for name in klass.__dict__.get('__slots__', ()):
+                if hasattr(self, name):
+                    state[name] = getattr(self, name)
+
+        return state
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+
+class LRUCache(object):
+    """
+    I am a bounded mapping that discards the least recently used entry
+
+    Lookups through :func:`get` refresh the entry, ``in`` checks do not.
+    """
+
+    def __init__(self, maxsize=128):
+        if maxsize < 1:
+            raise ValueError("maxsize must be a positive integer")
+
+        self.maxsize = maxsize
+        self._map = {}
+        # circular doubly linked list: [prev, next, key, value]
+        self._root = root = []
+        root[:] = [root, root, None, None]
+
+    def __len__(self):
+        return len(self._map)
+
+    def __contains__(self, key):
+        return key in self._map
+
+    def get(self, key, default=None):
+        """Returns the value for ``key`` and marks it as recently used"""
+        link = self._map.get(key)
+        if link is None:
+            return default
+
+        prev, _next = link[0], link[1]
+        prev[1] = _next
+        _next[0] = prev
+        root = self._root
+        last = root[0]
+        last[1] = root[0] = link
+        link[0] = last
+        link[1] = root
+        return link[3]
+
+    def set(self, key, value):
+        """Stores ``value`` under ``key``, evicting the oldest entry if full"""
+        link = self._map.get(key)
+        if link is not None:
+            link[3] = value
+            self.get(key)
+            return
+
+        root = self._root
+        if len(self._map) >= self.maxsize:
+            oldest = root[1]
+            root[1] = oldest[1]
+            oldest[1][0] = root
+            del self._map[oldest[2]]
+
+        last = root[0]
+        link = [last, root, key, value]
+        last[1] = root[0] = self._map[key] = link
+
+    def pop(self, key, default=None):
+        """Removes ``key`` and returns its value, or ``default``"""
+        link = self._map.pop(key, None)
+        if link is None:
+            return default
+
+        link[0][1] = link[1]
+        link[1][0] = link[0]
+        return link[3]
+
+    def clear(self):
+        self._map.clear()
+        root = self._root
+        root[:] = [root, root, None, None]
+
+
 def bytes_to_str(b):
     if sys.version_info >= (3,):
         return b.decode('latin1')
@@ -150,7 +246,7 @@ def pack_8bits_to_8bit(message, udh=None):
         text = udh + text
 
     mlen = len(text)
-    message = chr(mlen) + message
+    message = chr(mlen) + text
     return encode_str(message)
 
 
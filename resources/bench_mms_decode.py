@@ -0,0 +1,46 @@
+# Measures the time to decode the headers of MMS messages
+#
+# Usage:
+#   python resources/bench_mms_decode.py [iterations]
+#
+# Decodes the message headers (MMSDecoder.decode_headers), the part
+# index and the whole message of every file in messaging/test/mms-data,
+# and prints the average time per message.
+
+import glob
+import os
+import sys
+import timeit
+
+from messaging.mms.mms_pdu import MMSDecoder
+
+DATA_DIR = os.path.join(os.path.dirname(__file__), os.pardir, 'messaging',
+                        'test', 'mms-data')
+
+
+def main(iterations=200):
+    messages = [open(path, 'rb').read()
+                for path in sorted(glob.glob(os.path.join(DATA_DIR, '*')))]
+    decoder = MMSDecoder()
+
+    def run(decode):
+        for data in messages:
+            decode(data)
+
+    cases = [('headers', 'decode_headers'),
+             ('part index', 'decode_part_index'),
+             ('full message', 'decode_data')]
+
+    for name, method in cases:
+        decode = getattr(decoder, method, None)
+        if decode is None:
+            continue
+
+        seconds = min(timeit.repeat(lambda: run(decode), number=iterations,
+                                    repeat=3))
+        print "%-14s %8.1f us/message" % (
+            name, seconds / iterations / len(messages) * 1e6)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,93 @@
+# Measures the time to encode header-heavy MMS messages
+#
+# Usage:
+#   python resources/bench_mms_encode.py [iterations]
+#
+# Encodes a m-notifyresp-ind, a m-send-req with most of the headers
+# that can be encoded and several small parts with their own headers,
+# and the same m-send-req through the streaming encoder. Then a message
+# with a 300KB attachment is encoded for one more recipient, in full
+# and from its MMSTemplate, and measured with encoded_size().
+
+from cStringIO import StringIO
+import sys
+import timeit
+
+from messaging.mms.message import DataPart, MMSMessage
+
+HEADERS = {
+    'Transaction-Id': 'NOK5AIdhfTMYSG4JeIgAAsHtp72AGAAAAAAAA',
+    'MMS-Version': '1.2',
+    'From': '+34600000000/TYPE=PLMN',
+    'To': '+34611111111/TYPE=PLMN',
+    'Cc': '+34622222222/TYPE=PLMN',
+    'Bcc': '+34633333333/TYPE=PLMN',
+    'Subject': 'header-heavy message',
+    'Message-ID': '5a7f8e2c-0001',
+    'X-Mms-Application-Id': 'bench',
+}
+
+
+def notifyresp():
+    message = MMSMessage()
+    message.headers['Transaction-Id'] = HEADERS['Transaction-Id']
+    message.headers['Message-Type'] = 'm-notifyresp-ind'
+    message.headers['Status'] = 'Retrieved'
+    return message
+
+
+def send_req(parts=10):
+    message = MMSMessage()
+    message.headers.update(HEADERS)
+    message.headers['Content-Type'] = (
+        'application/vnd.wap.multipart.mixed', {})
+    for i in range(parts):
+        part = DataPart()
+        part.set_data('part %d' % i, 'text/plain')
+        part.headers['Content-ID'] = '<part%d>' % i
+        part.headers['Content-Location'] = 'part%d.txt' % i
+        message.add_data_part(part)
+
+    return message
+
+
+def main(iterations=2000):
+    # encoding consumes nothing, the messages can be reused
+    cases = [
+        ('m-notifyresp-ind', notifyresp(), lambda m: m.encode()),
+        ('m-send-req, 10 parts', send_req(), lambda m: m.encode()),
+        ('m-send-req, encode_to', send_req(),
+         lambda m: m.encode_to(StringIO())),
+    ]
+
+    for name, message, encode in cases:
+        if name.endswith('encode_to') and not hasattr(message, 'encode_to'):
+            continue
+
+        seconds = min(timeit.repeat(lambda: encode(message), number=iterations,
+                                    repeat=3))
+        print "%-24s %8.1f us" % (name, seconds / iterations * 1e6)
+
+    message = send_req(parts=1)
+    part = DataPart()
+    part.set_data('\xff' * 300 * 1024, 'image/jpeg')
+    message.add_data_part(part)
+    template = message.template()
+    recipient = {'To': '+34644444444/TYPE=PLMN', 'Transaction-Id': 'fan-out'}
+
+    def encode():
+        message.headers.update(recipient)
+        message.encode()
+
+    cases = [
+        ('300KB, encode', encode),
+        ('300KB, template', lambda: template.encode(recipient)),
+        ('300KB, encoded_size', message.encoded_size),
+    ]
+    for name, run in cases:
+        seconds = min(timeit.repeat(run, number=iterations // 10, repeat=3))
+        print "%-24s %8.1f us" % (name, seconds / (iterations // 10) * 1e6)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,40 @@
+# Measures the generation of MMS notification pushes
+#
+# Usage:
+#   python resources/bench_notifications.py [count]
+#
+# Encodes ``count`` m-notification-ind PDUs in their WAP push envelope
+# with a NotificationEncoder, and then splits them into port addressed
+# SMS with a PushSmsBuilder, and prints the rate of both.
+
+import sys
+import time
+
+from messaging.mms.push import NotificationEncoder
+from messaging.sms.wap import PushSmsBuilder
+
+
+def main(count=5000):
+    encoder = NotificationEncoder(29696, 72000,
+                                  sender='+447785342749/TYPE=PLMN')
+    batch = [('+4477%08d' % i, 'T%030d' % i,
+              'http://mmsc.example.com/m/%030d' % i) for i in range(count)]
+
+    start = time.time()
+    for push_id, (number, tid, location) in enumerate(batch):
+        encoder.encode_push(tid, location, push_id)
+    seconds = time.time() - start
+    print "%-14s %10.0f pushes/s" % ('push', count / seconds)
+
+    builder = PushSmsBuilder()
+    start = time.time()
+    pdus = 0
+    for number, sms in builder.build_notifications(encoder, batch):
+        pdus += len(sms)
+    seconds = time.time() - start
+    print "%-14s %10.0f pushes/s (%d SMS)" % ('push + SMS', count / seconds,
+                                              pdus)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,75 @@
+# Measures the retrieval of MMS messages from a slow MMSC
+#
+# Usage:
+#   python resources/bench_retrieval.py [count] [delay in ms]
+#
+# Starts a local HTTP server that answers every GET with a message of
+# the test data after ``delay`` milliseconds, retrieves it ``count``
+# times one after the other with a MM1Client and then at the same time
+# with a RetrievalService, and prints the rate and latencies of both.
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+import os
+from SocketServer import ThreadingMixIn
+import sys
+import threading
+import time
+
+from messaging.mms.mm1 import MM1Client, RetrievalService
+
+DATA = open(os.path.join(os.path.dirname(__file__), '..', 'messaging',
+                         'test', 'mms-data', 'BTMMS.MMS'), 'rb').read()
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        time.sleep(self.server.delay)
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(DATA)))
+        self.end_headers()
+        self.wfile.write(DATA)
+
+    def log_message(self, *args):
+        pass
+
+
+class Server(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+def main(count=200, delay=20):
+    server = Server(('127.0.0.1', 0), Handler)
+    server.delay = delay / 1000.0
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d/m/BTMMS.MMS' % server.server_port
+
+    client = MM1Client(None)
+    start = time.time()
+    for i in range(count):
+        client.retrieve(url)
+    seconds = time.time() - start
+    client.close()
+    print "%-14s %10.0f messages/s" % ('serial', count / seconds)
+
+    for max_per_host in (4, 16):
+        service = RetrievalService(workers=16, max_per_host=max_per_host)
+        start = time.time()
+        for i in range(count):
+            service.submit(url)
+        service.close()
+        seconds = time.time() - start
+        stats = service.stats().values()[0]
+        print "%-14s %10.0f messages/s, p50 %.0fms p99 %.0fms" % (
+            '%d per host' % max_per_host, count / seconds,
+            stats['p50'] * 1000, stats['p99'] * 1000)
+
+    server.shutdown()
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -0,0 +1,64 @@
+# Compares messaging.serialize with pickle and cPickle
+#
+# Usage:
+#   python resources/bench_serialize.py [iterations]
+#
+# Prints the payload size and the time to serialize and deserialize a
+# decoded SMS, a list of PDUs and the headers of a decoded MMS.
+# multiprocessing queues use cPickle: the SMS and the PDUs should be
+# faster than with it, the MMS headers (a plain dict) only smaller.
+
+import cPickle
+import os
+import pickle
+import sys
+import timeit
+
+from messaging.mms.message import MMSMessage
+from messaging.serialize import Record, dumps, loads
+from messaging.sms import SmsDeliver, SmsSubmit
+
+MMS = os.path.join(os.path.dirname(__file__), os.pardir, 'messaging',
+                   'test', 'mms-data', 'SonyEricssonT310-R201.mms')
+
+SAMPLES = [
+    ('SmsDeliver', SmsDeliver("0791447758100650040C914497726247010000909010711423400A2050EC468B81C4733A")),
+    ('Pdu list', SmsSubmit("+34616585119", "hey " * 50).to_pdu()),
+    ('MMS headers', MMSMessage.from_file(MMS)),
+]
+
+
+def bench(func, number):
+    return min(timeit.repeat(func, repeat=3, number=number)) / number * 1e6
+
+
+def main(number=20000):
+    print "%-12s %-10s %6s %9s %9s" % ('', '', 'bytes', 'dumps us', 'loads us')
+    for name, obj in SAMPLES:
+        if isinstance(obj, MMSMessage):
+            pickled = obj.headers
+        else:
+            pickled = obj
+
+        for label, module in (('pickle', pickle), ('cPickle', cPickle)):
+            data = module.dumps(pickled, 2)
+            print "%-12s %-10s %6d %9.2f %9.2f" % (
+                name, label, len(data),
+                bench(lambda: module.dumps(pickled, 2), number),
+                bench(lambda: module.loads(data), number))
+            name = ''
+
+        data = dumps(obj)
+        print "%-12s %-10s %6d %9.2f %9.2f" % (
+            name, 'serialize', len(data),
+            bench(lambda: dumps(obj), number),
+            bench(lambda: loads(data), number))
+
+    data = dumps(SAMPLES[0][1])
+    print "%-12s %-10s %6s %9s %9.2f" % (
+        'SmsDeliver', 'one field', '', '',
+        bench(lambda: Record(data)['text'], number))
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
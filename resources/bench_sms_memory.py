@@ -0,0 +1,77 @@
+# Measures the memory used by decoded and encoded SMS objects
+#
+# Usage:
+#   python resources/bench_sms_memory.py [count]
+#
+# Reports the deep size (the object plus everything it references that
+# is not shared with the other messages) of a SmsDeliver, a SmsSubmit
+# and a Pdu, and the growth of the peak RSS while holding ``count``
+# decoded messages.
+
+import resource
+import sys
+
+from messaging.sms import SmsDeliver, SmsSubmit
+
+PDU = "07911326040000F0040B911346610089F60000208062917314080CC8F71D14969741F977FD07"
+
+
+def deep_sizeof(obj, seen=None):
+    if seen is None:
+        seen = set()
+
+    if id(obj) in seen or obj is None or isinstance(obj, (bool, type)):
+        return 0
+
+    seen.add(id(obj))
+    size = sys.getsizeof(obj)
+
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += deep_sizeof(key, seen) + deep_sizeof(value, seen)
+    elif isinstance(obj, (list, tuple, set, frozenset)):
+        for item in obj:
+            size += deep_sizeof(item, seen)
+
+    if hasattr(obj, '__dict__'):
+        size += deep_sizeof(obj.__dict__, seen)
+
+    for klass in type(obj).__mro__:
+        for name in klass.__dict__.get('__slots__', ()):
+            if hasattr(obj, name):
+                size += deep_sizeof(getattr(obj, name), seen)
+
+    return size
+
+
+def decode(pdu, keep_pdu):
+    try:
+        return SmsDeliver(pdu, keep_pdu=keep_pdu)
+    except TypeError:
+        # keep_pdu is not supported
+        return SmsDeliver(pdu)
+
+
+def main(count=100000):
+    # small ints, interned strings and the like are shared by every
+    # message, measure a second message to leave them out
+    decode(PDU, True)
+    sms = SmsSubmit("+34616585119", "hey how's it going?")
+    sms.to_pdu()
+    print "SmsDeliver:             %5d bytes" % deep_sizeof(decode(PDU, True))
+    print "SmsDeliver(keep_pdu=0): %5d bytes" % deep_sizeof(decode(PDU, False))
+
+    sms = SmsSubmit("+34616585119", "hey how's it going?")
+    pdus = sms.to_pdu()
+    print "SmsSubmit:              %5d bytes" % deep_sizeof(sms)
+    print "Pdu:                    %5d bytes" % deep_sizeof(pdus[0])
+
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    messages = [decode(PDU, False) for i in xrange(count)]
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print "RSS per SmsDeliver:     %5d bytes (%d messages)" % (
+        (after - before) * 1024 / len(messages), count)
+
+
+if __name__ == '__main__':
+    main(*map(int, sys.argv[1:]))
@@ -13,6 +13,11 @@ setup(name="python-messaging",
       packages=find_packages(),
       install_requires=['nose'],
       zip_safe=True,
+      entry_points={
+        'console_scripts': [
+            'messaging-decode = messaging.sms.bulk:main',
+        ],
+      },
       test_suite='nose.collector',
       classifiers=[
         'Development Status :: 4 - Beta',